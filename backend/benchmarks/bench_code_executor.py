@@ -0,0 +1,106 @@
+"""Benchmark: cold subprocess vs fork server vs warm kernel code execution.
+
+Runs representative Biomni step snippets (pandas wrangling, a scipy test, a
+matplotlib figure, a NumPy expression matrix) through CodeExecutor in each
+CODE_EXEC_MODE and reports per-block latency, including the real preamble /
+postamble and output collection.  The first run per mode (zygote / kernel
+start-up) is reported separately as "startup".
+
+Usage (from backend/):
+    python -m benchmarks.bench_code_executor [--repeat 10]
+        [--modes subprocess,fork,kernel] [--out /tmp/bench_exec]
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List
+
+from config import get_settings
+from tools.code_executor import CodeExecutor
+from tools.kernel_pool import ForkServer, KernelPool
+
+SNIPPETS: Dict[str, str] = {
+    "print": "print('hello')\n",
+    "pandas": (
+        "import pandas as pd\n"
+        "import numpy as np\n"
+        "df = pd.DataFrame({'gene': [f'G{i}' for i in range(5000)],\n"
+        "                   'expr': np.random.rand(5000),\n"
+        "                   'group': np.random.choice(['a', 'b', 'c'], 5000)})\n"
+        "summary = df.groupby('group')['expr'].agg(['mean', 'std', 'count'])\n"
+        "print(summary)\n"
+    ),
+    "scipy": (
+        "import numpy as np\n"
+        "from scipy import stats\n"
+        "a, b = np.random.normal(0, 1, 200), np.random.normal(0.3, 1, 200)\n"
+        "t, p = stats.ttest_ind(a, b)\n"
+        "print(f't={t:.3f} p={p:.3g}')\n"
+    ),
+    "matplotlib": (
+        "import numpy as np\n"
+        "import matplotlib.pyplot as plt\n"
+        "x = np.linspace(0, 10, 200)\n"
+        "plt.plot(x, np.sin(x))\n"
+        "plt.title('sin')\n"
+        "plt.show()\n"
+    ),
+    "numpy": (
+        "import numpy as np\n"
+        "m = np.random.rand(2000, 200)\n"
+        "corr = np.corrcoef(m.T)\n"
+        "print(corr.shape, float(corr.mean()))\n"
+    ),
+}
+
+
+def _bench_mode(mode: str, repeat: int, out_dir: str) -> Dict[str, List[float]]:
+    executor = CodeExecutor()
+    settings = get_settings().model_copy(update={"CODE_EXEC_MODE": mode, "OUTPUTS_DIR": out_dir})
+    executor._settings = settings
+
+    t0 = time.perf_counter()
+    executor._execute_sync("pass\n", "python", f"bench-{mode}", "startup")
+    timings: Dict[str, List[float]] = {"startup": [(time.perf_counter() - t0) * 1e3]}
+
+    for name, code in SNIPPETS.items():
+        timings[name] = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            res = executor._execute_sync(code, "python", f"bench-{mode}", f"{name}_{i}")
+            timings[name].append((time.perf_counter() - t0) * 1e3)
+            if not res.success:
+                print(f"  [{mode}] {name} failed: {res.stderr.strip().splitlines()[-1:]}")
+                break
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--modes", default="subprocess,fork,kernel")
+    parser.add_argument("--out", default="/tmp/bench_exec")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    results = {}
+    try:
+        for mode in modes:
+            results[mode] = _bench_mode(mode, args.repeat, args.out)
+    finally:
+        KernelPool.get_instance().shutdown()
+        ForkServer.get_instance().shutdown()
+
+    print(f"{'snippet':<12}" + "".join(f"{m + ' p50':>16}{m + ' p95':>16}" for m in modes))
+    for name in ["startup", *SNIPPETS]:
+        row = f"{name:<12}"
+        for mode in modes:
+            samples = sorted(results[mode].get(name) or [float("nan")])
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            row += f"{statistics.median(samples):13.1f} ms{p95:13.1f} ms"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Benchmark: per-token frames vs coalesced, orjson-encoded frames.
+
+Simulates many concurrent chat streams, each a ChatEvent generator emitting
+token events at a fixed rate (with an occasional step event), and pushes
+them through
+
+  legacy-sse — one json.dumps'd SSE frame per token (old _sse_generator)
+  legacy-ws  — WSMessage + asdict + json.dumps per token (old _run_stream)
+  sse        — coalesce_tokens + dumps_bytes (routers/chat_sse.py)
+  ws         — coalesce_tokens + WSMessage.to_dict + dumps (routers/ws_chat.py)
+
+Every frame is written to its own loopback socket (asyncio StreamWriter,
+write + drain per frame, as the ASGI server does), drained by a separate
+thread.  Reports tokens per event-loop CPU-second (thread CPU time of the
+loop thread, i.e. one core), frames sent and bytes; the token source itself
+(an asyncio.sleep per token burst) costs the same in every variant.
+--rate 0 emits tokens back to back (upper bound).
+
+Usage (from backend/):
+    python -m benchmarks.bench_event_frames [--streams 200] [--rate 60]
+        [--seconds 5] [--flush-ms 30]
+"""
+
+import argparse
+import asyncio
+import json
+import selectors
+import socket
+import threading
+import time
+from dataclasses import asdict
+from typing import AsyncIterator, Callable, Dict, Tuple
+
+from models.schemas import ChatEvent
+from services.event_frames import coalesce_tokens, dumps, dumps_bytes, orjson
+from ws.events import WSMessage
+
+# Mixed ASCII / Korean tokens of typical LLM size
+_TOKENS = ["The", " gene", " expression", " 분석", "은", " p", "=", "0", ".03", "\n"]
+# Tokens per sleep at a given rate (LLM streams arrive in small bursts)
+_BURST = 3
+
+
+async def _token_stream(n_tokens: int, rate: float) -> AsyncIterator[ChatEvent]:
+    delay = _BURST / rate if rate > 0 else 0.0
+    for i in range(n_tokens):
+        yield ChatEvent(type="token", data={"token": _TOKENS[i % len(_TOKENS)]})
+        if i % 500 == 499:
+            yield ChatEvent(type="step_start", data={"step_start": {"step": i // 500}})
+        if delay and i % _BURST == _BURST - 1:
+            await asyncio.sleep(delay)
+
+
+async def _legacy_sse(events, writer: asyncio.StreamWriter) -> Tuple[int, int]:
+    frames = size = 0
+    async for event in events:
+        payload = {"type": event.type, **event.data}
+        frame = f"data: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n".encode("utf-8")
+        writer.write(frame)
+        await writer.drain()
+        frames += 1
+        size += len(frame)
+    return frames, size
+
+
+async def _legacy_ws(events, writer: asyncio.StreamWriter) -> Tuple[int, int]:
+    frames = size = 0
+    async for event in events:
+        text = json.dumps(asdict(WSMessage(type=event.type, data=event.data)))
+        data = text.encode("utf-8")
+        writer.write(data)
+        await writer.drain()
+        frames += 1
+        size += len(data)
+    return frames, size
+
+
+async def _sse(events, writer: asyncio.StreamWriter) -> Tuple[int, int]:
+    frames = size = 0
+    async for event in coalesce_tokens(events):
+        frame = b"data: " + dumps_bytes({"type": event.type, **event.data}) + b"\n\n"
+        writer.write(frame)
+        await writer.drain()
+        frames += 1
+        size += len(frame)
+    return frames, size
+
+
+async def _ws(events, writer: asyncio.StreamWriter) -> Tuple[int, int]:
+    frames = size = 0
+    async for event in coalesce_tokens(events):
+        text = dumps(WSMessage(type=event.type, data=event.data).to_dict())
+        data = text.encode("utf-8")
+        writer.write(data)
+        await writer.drain()
+        frames += 1
+        size += len(data)
+    return frames, size
+
+
+VARIANTS: Dict[str, Callable] = {
+    "legacy-sse": _legacy_sse,
+    "legacy-ws": _legacy_ws,
+    "sse": _sse,
+    "ws": _ws,
+}
+
+
+def _drain(socks, stop: threading.Event) -> None:
+    """Read and discard everything the loop writes (runs in its own thread)."""
+    sel = selectors.DefaultSelector()
+    for sock in socks:
+        sel.register(sock, selectors.EVENT_READ)
+    while not stop.is_set():
+        for key, _ in sel.select(timeout=0.1):
+            try:
+                key.fileobj.recv(1 << 16)
+            except OSError:
+                pass
+    sel.close()
+
+
+async def _run(variant: Callable, streams: int, n_tokens: int, rate: float) -> Tuple[int, int, float]:
+    pairs = [socket.socketpair() for _ in range(streams)]
+    stop = threading.Event()
+    drainer = threading.Thread(target=_drain, args=([b for _, b in pairs], stop), daemon=True)
+    drainer.start()
+    writers = []
+    for a, _ in pairs:
+        _, writer = await asyncio.open_connection(sock=a)
+        writers.append(writer)
+    cpu0 = time.thread_time()
+    try:
+        results = await asyncio.gather(
+            *(variant(_token_stream(n_tokens, rate), w) for w in writers)
+        )
+    finally:
+        cpu = time.thread_time() - cpu0
+        for writer in writers:
+            writer.close()
+        stop.set()
+        drainer.join()
+        for _, b in pairs:
+            b.close()
+    return sum(r[0] for r in results), sum(r[1] for r in results), cpu
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=60.0, help="tokens/s per stream (0: unpaced)")
+    parser.add_argument("--seconds", type=float, default=5.0, help="stream length at --rate")
+    parser.add_argument("--flush-ms", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.flush_ms is not None:
+        from config import get_settings
+        get_settings().STREAM_TOKEN_FLUSH_MS = args.flush_ms
+
+    n_tokens = int(args.rate * args.seconds) if args.rate > 0 else 20_000
+    total = n_tokens * args.streams
+    print(f"{args.streams} streams x {n_tokens} tokens, orjson: {'yes' if orjson else 'no'}")
+    print(f"{'variant':<12}{'tokens/cpu-s':>14}{'frames':>10}{'MB':>8}{'wall s':>8}")
+    for name, variant in VARIANTS.items():
+        wall0 = time.perf_counter()
+        frames, size, cpu = asyncio.run(_run(variant, args.streams, n_tokens, args.rate))
+        wall = time.perf_counter() - wall0
+        print(f"{name:<12}{total / cpu:>14,.0f}{frames:>10,}{size / 1e6:>8.1f}{wall:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
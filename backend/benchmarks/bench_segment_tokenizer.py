@@ -0,0 +1,299 @@
+"""Micro-benchmark: regex cascade vs single-pass SegmentTokenizer.
+
+Replays recorded model responses (every string in the Langfuse traces under
+reasoning_logs/ that contains a think/execute/observation/solution tag) through
+
+  legacy — the pre-tokenizer step post-processing: _parse_segments + think /
+           reasoning / code / solution regex cascade on the final response
+  stream — SegmentTokenizer fed in small chunks as they arrive from the LLM
+  oneshot — SegmentTokenizer fed the complete response at once
+
+and reports throughput plus how many responses produce identical fields.
+The tokenizer differs from legacy by design only where a block opener meets
+another block opener before its own close (an unclosed tag mentioned in prose,
+an execute re-opened, an execute / solution inside thinking); any mismatch in
+a response without such stray tags is reported as unexpected.
+
+Usage (from backend/):
+    python -m benchmarks.bench_segment_tokenizer [--logs ../reasoning_logs]
+        [--chunk 8] [--repeat 3] [--format xml|bracket]
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+from tools.segment_tokenizer import SegmentTokenizer, tokenize_response
+from tools.tool_parser import _closing_tag
+
+_BEHAVIORS = {
+    "xml": {
+        "think_format": None,
+        "code_execute_format": "<execute>",
+        "code_result_format": "<observation>",
+        "solution_format": "<solution>",
+    },
+    "bracket": {
+        "think_format": "[THINK]",
+        "code_execute_format": "[EXECUTE]",
+        "code_result_format": "[OBSERVATION]",
+        "solution_format": "[SOLUTION]",
+    },
+}
+
+_TAG_RE = re.compile(r"<execute>|\[EXECUTE\]|<think>|\[THINK\]|<observation>|<solution>", re.I)
+_BLOCK_TAG_RE = re.compile(
+    r"<(/?)(think|execute|observation|solution)>|\[(/?)(THINK|EXECUTE|OBSERVATION|SOLUTION)\]", re.I
+)
+
+
+# ═══════════════════════════════════════════
+# Legacy implementation (regex cascade, kept verbatim for comparison)
+# ═══════════════════════════════════════════
+
+
+def _legacy_parse_segments(full_response: str, behavior: Dict[str, Any]) -> List[Dict[str, str]]:
+    tag_types: Dict[str, List[str]] = {
+        "thinking": [behavior.get("think_format") or "<think>", "<think>", "[THINK]"],
+        "code": [behavior.get("code_execute_format") or "<execute>", "<execute>", "[EXECUTE]"],
+        "output": [behavior.get("code_result_format") or "<observation>", "<observation>", "[OBSERVATION]"],
+        "solution": [behavior.get("solution_format") or "<solution>", "<solution>", "[SOLUTION]"],
+    }
+    all_blocks: List[Tuple[int, int, str, str]] = []
+    for seg_type, open_tags in tag_types.items():
+        seen: set = set()
+        for open_tag in open_tags:
+            if open_tag in seen:
+                continue
+            seen.add(open_tag)
+            close_tag = _closing_tag(open_tag)
+            flags = re.IGNORECASE if open_tag.startswith("<") else 0
+            pattern = re.escape(open_tag) + r'([\s\S]*?)' + re.escape(close_tag)
+            for m in re.finditer(pattern, full_response, flags):
+                overlaps = any(
+                    b[0] <= m.start() < b[1] or b[0] < m.end() <= b[1]
+                    for b in all_blocks
+                    if b[2] == seg_type
+                )
+                if not overlaps:
+                    all_blocks.append((m.start(), m.end(), seg_type, m.group(1).strip()))
+    md_code_pat = re.compile(r'```(\w*)\n([\s\S]*?)```')
+    for m in md_code_pat.finditer(full_response):
+        overlaps = any(
+            b[0] <= m.start() < b[1] or b[0] < m.end() <= b[1]
+            for b in all_blocks
+        )
+        if not overlaps and m.group(2).strip():
+            all_blocks.append((m.start(), m.end(), "code", m.group(2).strip()))
+    thinking_ranges = [(b[0], b[1]) for b in all_blocks if b[2] == "thinking"]
+    blocks = [
+        b for b in all_blocks
+        if b[2] == "thinking" or not any(t[0] <= b[0] and b[1] <= t[1] for t in thinking_ranges)
+    ]
+    blocks.sort(key=lambda x: x[0])
+    segments: List[Dict[str, str]] = []
+    pos = 0
+    for start, end, seg_type, inner in blocks:
+        gap = full_response[pos:start].strip()
+        if gap:
+            segments.append({"type": "text", "content": gap})
+        if inner:
+            segments.append({"type": seg_type, "content": inner})
+        pos = end
+    tail = full_response[pos:].strip()
+    if tail:
+        segments.append({"type": "text", "content": tail})
+    return segments
+
+
+def _legacy_extract(full_response: str, behavior: Dict[str, Any]) -> Dict[str, Any]:
+    exec_fmt = behavior.get("code_execute_format") or "<execute>"
+    exec_close = _closing_tag(exec_fmt)
+    code_blocks = re.findall(re.escape(exec_fmt) + r'([\s\S]*?)' + re.escape(exec_close), full_response)
+    if not code_blocks:
+        for alt_pat, alt_flags in [
+            (r'<execute>((?:(?!<execute>)[\s\S])*?)</execute>', re.IGNORECASE),
+            (r'\[EXECUTE\]((?:(?!\[EXECUTE\])[\s\S])*?)\[/EXECUTE\]', 0),
+        ]:
+            code_blocks = re.findall(alt_pat, full_response, alt_flags)
+            if code_blocks:
+                break
+
+    segments = _legacy_parse_segments(full_response, behavior)
+
+    think_fmt = behavior.get("think_format") or "<think>"
+    think_close = _closing_tag(think_fmt)
+    think_pattern = re.escape(think_fmt) + r'([\s\S]*?)' + re.escape(think_close)
+    think_matches = re.findall(think_pattern, full_response)
+    if not think_matches:
+        think_matches = re.findall(r'<think>([\s\S]*?)</think>', full_response, re.IGNORECASE)
+    if not think_matches:
+        think_matches = re.findall(r'\[THINK\]([\s\S]*?)\[/THINK\]', full_response)
+    thinking = "\n".join(b.strip() for b in think_matches)
+
+    obs_fmt = behavior.get("code_result_format") or "<observation>"
+    obs_close = _closing_tag(obs_fmt)
+    reasoning = re.sub(think_pattern, '', full_response)
+    reasoning = re.sub(r'<think>[\s\S]*?</think>', '', reasoning, flags=re.IGNORECASE)
+    reasoning = re.sub(r'\[THINK\][\s\S]*?\[/THINK\]', '', reasoning)
+    reasoning = re.sub(re.escape(exec_fmt) + r'[\s\S]*?' + re.escape(exec_close), '', reasoning)
+    reasoning = re.sub(r'<execute>(?:(?!<execute>)[\s\S])*?</execute>', '', reasoning, flags=re.IGNORECASE)
+    reasoning = re.sub(r'\[EXECUTE\](?:(?!\[EXECUTE\])[\s\S])*?\[/EXECUTE\]', '', reasoning)
+    reasoning = re.sub(re.escape(obs_fmt) + r'[\s\S]*?' + re.escape(obs_close), '', reasoning)
+    reasoning = re.sub(r'<observation>[\s\S]*?</observation>', '', reasoning, flags=re.IGNORECASE)
+    reasoning = re.sub(r'\[OBSERVATION\][\s\S]*?\[/OBSERVATION\]', '', reasoning)
+    reasoning = re.sub(r'<solution>[\s\S]*?</solution>', '', reasoning, flags=re.IGNORECASE)
+    reasoning = re.sub(r'\[SOLUTION\][\s\S]*?\[/SOLUTION\]', '', reasoning)
+    reasoning = re.sub(r'<solution>[\s\S]*$', '', reasoning, flags=re.IGNORECASE)
+    reasoning = re.sub(r'\[SOLUTION\][\s\S]*$', '', reasoning)
+    reasoning = re.sub(r'<think>[\s\S]*$', '', reasoning, flags=re.IGNORECASE)
+    reasoning = re.sub(r'\[THINK\][\s\S]*$', '', reasoning)
+    reasoning = re.sub(r'<execute>[\s\S]*$', '', reasoning, flags=re.IGNORECASE)
+    reasoning = re.sub(r'\[EXECUTE\][\s\S]*$', '', reasoning)
+    reasoning = reasoning.strip()
+
+    sol_fmt = behavior.get("solution_format") or "<solution>"
+    sol_close = _closing_tag(sol_fmt)
+    sol_match = re.search(re.escape(sol_fmt) + r'([\s\S]*?)' + re.escape(sol_close), full_response)
+    if not sol_match:
+        sol_match = re.search(re.escape(sol_fmt) + r'([\s\S]+)$', full_response)
+
+    return {
+        "segments": segments,
+        "thinking": thinking,
+        "reasoning": reasoning,
+        "code_blocks": code_blocks,
+        "solution": sol_match.group(1).strip() if sol_match else None,
+    }
+
+
+# ═══════════════════════════════════════════
+# Corpus
+# ═══════════════════════════════════════════
+
+
+def _walk_strings(obj: Any) -> Iterator[str]:
+    if isinstance(obj, str):
+        yield obj
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            yield from _walk_strings(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from _walk_strings(v)
+
+
+def load_recorded_responses(logs_dir: str) -> List[str]:
+    """Collect unique tagged model responses from recorded Langfuse traces."""
+    seen: Dict[str, None] = {}
+    for path in sorted(glob.glob(os.path.join(logs_dir, "**", "*.json"), recursive=True)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        for s in _walk_strings(data):
+            if len(s) > 200 and _TAG_RE.search(s):
+                seen.setdefault(s, None)
+    return list(seen)
+
+
+# ═══════════════════════════════════════════
+# Runner
+# ═══════════════════════════════════════════
+
+
+def _has_stray_tags(text: str) -> bool:
+    """True if a block opener meets another opener before its close, or is never closed.
+
+    Those are the responses where the tokenizer deliberately parts with the
+    regex cascade; everywhere else the two must agree.
+    """
+    open_name = None
+    for m in _BLOCK_TAG_RE.finditer(text):
+        closing = bool(m.group(1) or m.group(3))
+        name = (m.group(2) or m.group(4)).lower()
+        if open_name is None:
+            if not closing:
+                open_name = name
+        elif closing:
+            if name == open_name:
+                open_name = None
+        elif open_name == "think" or name != open_name or name == "execute":
+            return True
+    return open_name not in (None, "think")
+
+
+def _run_stream(text: str, behavior: Dict[str, Any], chunk: int) -> Any:
+    tok = SegmentTokenizer(behavior)
+    for i in range(0, len(text), chunk):
+        tok.feed(text[i:i + chunk])
+    return tok.finish()
+
+
+def _time(fn, corpus: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for text in corpus:
+            fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--logs", default=os.path.join(here, "..", "..", "reasoning_logs"))
+    parser.add_argument("--chunk", type=int, default=8, help="stream chunk size in chars")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--format", choices=sorted(_BEHAVIORS), default="xml")
+    args = parser.parse_args()
+
+    behavior = _BEHAVIORS[args.format]
+    corpus = load_recorded_responses(args.logs)
+    if not corpus:
+        print(f"No recorded responses found under {args.logs}")
+        return
+    total_mb = sum(len(t) for t in corpus) / 1e6
+    print(f"{len(corpus)} responses, {total_mb:.2f} MB, format={args.format}")
+
+    legacy_s = _time(lambda t: _legacy_extract(t, behavior), corpus, args.repeat)
+    oneshot_s = _time(lambda t: tokenize_response(t, behavior), corpus, args.repeat)
+    stream_s = _time(lambda t: _run_stream(t, behavior, args.chunk), corpus, args.repeat)
+
+    for label, secs in (("legacy", legacy_s), ("oneshot", oneshot_s), (f"stream/{args.chunk}", stream_s)):
+        print(f"  {label:<10} {secs * 1e3:9.1f} ms  {total_mb / secs:7.2f} MB/s")
+    n_chunks = sum(-(-len(t) // args.chunk) for t in corpus)
+    print(f"  stream overhead: {stream_s / n_chunks * 1e6:.2f} us/chunk over {n_chunks} chunks")
+
+    fields = ("segments", "thinking", "reasoning", "code_blocks", "solution")
+    same = {f: 0 for f in fields}
+    unexpected = {f: 0 for f in fields}
+    stray = 0
+    stream_consistent = 0
+    for text in corpus:
+        old = _legacy_extract(text, behavior)
+        new = tokenize_response(text, behavior)
+        has_stray = _has_stray_tags(text)
+        stray += has_stray
+        for f in fields:
+            if old[f] == getattr(new, f):
+                same[f] += 1
+            elif not has_stray:
+                unexpected[f] += 1
+        stream_consistent += _run_stream(text, behavior, args.chunk) == new
+    print("  identical to legacy: " + ", ".join(f"{f}={same[f]}/{len(corpus)}" for f in fields))
+    print(
+        f"  differing outside the {stray} responses with stray tags: "
+        + ", ".join(f"{f}={unexpected[f]}" for f in fields)
+    )
+    print(f"  stream == oneshot: {stream_consistent}/{len(corpus)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -35,11 +35,114 @@ class Settings(BaseSettings):
 
     # --- Biomni ---
     BIOMNI_DATA_PATH: str = "/app/data"
+    # Seconds a data-lake listing is reused without touching the filesystem
+    DATA_LAKE_REFRESH_INTERVAL: float = 30.0
+
+    # --- Retrieval ---
+    # sentence-transformers model for `use_llm_retrieval: embedding`
+    # (name or path); empty → TF-IDF/LSA embeddings fitted on the catalog
+    RETRIEVAL_EMBEDDING_MODEL: str = ""
+    # Retrieval result cache (LRU + TTL); PERSIST also stores selections in the settings table
+    RETRIEVAL_CACHE_SIZE: int = 256
+    RETRIEVAL_CACHE_TTL: int = 3600
+    RETRIEVAL_CACHE_PERSIST: bool = False
+
+    # --- Code Execution ---
+    # "subprocess": fresh interpreter per code block;
+    # "fork": fresh child per block forked from a preloaded zygote;
+    # "kernel": warm per-conversation Python worker (tools/kernel_pool.py) — module
+    # state persists between blocks and the memory limit also counts preloaded
+    # and leaked memory.  Only direct execution uses these: A1 plan steps run code
+    # inside biomni.  R always uses a subprocess.
+    CODE_EXEC_MODE: str = "subprocess"
+    # Modules imported once when a kernel / the zygote starts (comma-separated, missing ones skipped)
+    CODE_KERNEL_PRELOAD: str = "numpy,pandas,matplotlib.pyplot,scipy,scipy.stats"
+    CODE_KERNEL_MAX: int = 8
+    CODE_KERNEL_IDLE_TIMEOUT: float = 600.0
+    # stdout / stderr kept per code block (first and last half; the middle is dropped)
+    CODE_OUTPUT_MAX_CHARS: int = 200_000
+    # DataFrames left in a block's namespace (tools/frame_export.py): frames with more
+    # than CSV_MAX_CELLS cells go to "parquet" / "arrow" ("csv" → always CSV) plus a
+    # PREVIEW_ROWS-row preview CSV; unchanged frames aren't rewritten
+    CODE_TABLE_FORMAT: str = "parquet"
+    CODE_TABLE_CSV_MAX_CELLS: int = 200_000
+    CODE_TABLE_PREVIEW_ROWS: int = 200
+    # Per-block limits (0 → unlimited): RLIMIT_DATA in MB and RLIMIT_CPU in seconds.
+    # RLIMIT_CPU counts the CPU time of all threads, so multithreaded BLAS / numba
+    # code reaches it up to (cores)x sooner than wall time; off by default
+    CODE_MEMORY_LIMIT_MB: int = 8192
+    CODE_CPU_TIME_LIMIT: int = 0
+    # Run subprocess / fork blocks in child cgroups under this cgroup v2 directory
+    # (e.g. /sys/fs/cgroup/aigen-exec). The deployment creates and delegates it:
+    # empty of processes, memory controller available, writable by the backend.
+    # Empty → rlimits only
+    CODE_CGROUP_PATH: str = ""
+    # POST /api/execute_code/stream and the WS "execute_code" action run arbitrary
+    # code for any caller; off unless the deployment restricts access itself
+    CODE_EXEC_API_ENABLED: bool = False
+
+    # --- Scheduling (services/scheduler.py) ---
+    # Concurrent code executions across all conversations (0 → CPU count)
+    SCHED_CODE_SLOTS: int = 0
+    # Concurrent streaming LLM calls per model
+    SCHED_LLM_STREAMS_PER_MODEL: int = 8
+    # Concurrent embedding / LLM retrieval calls
+    SCHED_RETRIEVAL_SLOTS: int = 4
+
+    # --- Streaming (services/event_frames.py) ---
+    # Consecutive token events are merged into one frame for up to FLUSH_MS
+    # (0 → one frame per token) or until FLUSH_CHARS characters are pending
+    STREAM_TOKEN_FLUSH_MS: int = 30
+    STREAM_TOKEN_FLUSH_CHARS: int = 4096
+
+    # --- Runs (services/runs.py) ---
+    # Events of a run kept in memory for replay; older ones spill to CACHE_DIR/runs
+    RUN_EVENT_BUFFER: int = 2048
+    # Seconds a finished run stays attachable / replayable
+    RUN_RETENTION: int = 900
+    # Active runs per user; 0 → unlimited.  Off by default: without auth the user is
+    # the client-supplied X-User-Id header, else the client address (the proxy's,
+    # behind vite / nginx), so it is not a real per-user limit
+    RUN_MAX_PER_USER: int = 0
+    # Seconds active runs get to finish on shutdown before they are stopped
+    RUN_SHUTDOWN_GRACE: float = 30.0
+
+    # --- Workers (services/state_backend.py) ---
+    # State shared between uvicorn workers: "local" (single worker), "socket"
+    # (workers on one host) or "postgres" (LISTEN/NOTIFY on DATABASE_URL).
+    # Workers must share CACHE_DIR: other workers read run events from it
+    STATE_BACKEND: str = "local"
+    # Sockets and store of the socket backend (empty → CACHE_DIR/state)
+    STATE_SOCKET_DIR: str = ""
+    # Workers renew a heartbeat every third of this; a worker silent for longer
+    # is dead and its unfinished runs are reported as errors
+    STATE_WORKER_LEASE: float = 30.0
+
+    # --- WebSocket (ws/manager.py) ---
+    # Messages queued per connection before the runs it follows wait for it
+    WS_SEND_QUEUE: int = 256
+    # A socket write taking longer than this closes the connection (1013); the client reattaches
+    WS_SEND_TIMEOUT: float = 15.0
+    # Seconds without traffic before a ping message is sent
+    WS_PING_INTERVAL: float = 20.0
+
+    # --- Uploads (services/uploads.py) ---
+    # Chunk size suggested to clients for resumable uploads
+    UPLOAD_CHUNK_SIZE: int = 16 * 1024 * 1024
+    # Unfinished upload sessions idle longer than this are removed
+    UPLOAD_SESSION_TTL: int = 24 * 3600
+    # Seconds before the in-memory upload listing is re-checked against the directory
+    UPLOAD_INDEX_REFRESH_INTERVAL: float = 60.0
 
     # --- File Paths ---
     UPLOADS_DIR: str = "/app/uploads"
+    # Upload blobs, their alias index and unfinished uploads — outside UPLOADS_DIR
+    # so /uploads never serves them. Aliases are hardlinks when this is on the same
+    # mount as UPLOADS_DIR, symlinks otherwise
+    UPLOAD_STORE_DIR: str = "/app/upload_store"
     OUTPUTS_DIR: str = "/app/outputs"
     LOGS_DIR: str = "/app/logs"
+    CACHE_DIR: str = "/app/cache"
 
     # --- Models Directory ---
     MODELS_DIR: str = "/app/models"
@@ -43,3 +43,13 @@ class Setting(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     key = Column(String(255), unique=True, nullable=False)
     value = Column(JSON, default=dict)
+
+
+class SharedState(Base):
+    """Key-value state shared by backend workers (services/state_backend.py)."""
+
+    __tablename__ = "shared_state"
+
+    key = Column(String(255), primary_key=True)
+    value = Column(JSON)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -1,5 +1,6 @@
 """aigen_server — Lightweight API Gateway for Biomni A1"""
 
+import asyncio
 import os
 import sys
 import logging
@@ -74,9 +75,45 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"BiomniToolLoader init failed: {e}")
 
+    # State shared with the other uvicorn workers (STATE_BACKEND)
+    try:
+        from services.state_backend import get_state_backend
+        await get_state_backend().start()
+    except Exception as e:
+        logger.warning(f"State backend start failed: {e}")
+
+    # Warm the data-lake catalog in the background so the first plan doesn't pay the walk
+    try:
+        from config import get_settings
+        from services.data_lake_catalog import DataLakeCatalog
+        data_lake_path = os.path.join(get_settings().BIOMNI_DATA_PATH or "", "biomni_data", "data_lake")
+        app.state.data_lake_warmup = asyncio.create_task(
+            DataLakeCatalog.get_instance().scan(data_lake_path)
+        )
+    except Exception as e:
+        logger.warning(f"Data lake catalog warmup skipped: {e}")
+
     yield
 
     logger.info("Shutting down...")
+    # Runs first: interrupted plans persist their partial results through the DB
+    try:
+        from config import get_settings
+        from services.runs import RunRegistry
+        await RunRegistry.get_instance().shutdown(get_settings().RUN_SHUTDOWN_GRACE)
+    except Exception as e:
+        logger.warning(f"Run shutdown failed: {e}")
+    try:
+        from services.state_backend import get_state_backend
+        await get_state_backend().close()
+    except Exception:
+        pass
+    try:
+        from tools.kernel_pool import ForkServer, KernelPool
+        KernelPool.get_instance().shutdown()
+        ForkServer.get_instance().shutdown()
+    except Exception:
+        pass
     try:
         from db.database import close_db
         await close_db()
@@ -119,6 +156,12 @@ async def health_check():
 
     return {"status": "ok", "vllm": vllm_ok, "db": db_ok}
 
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    """Slot usage, queue depth and wait-time percentiles per scheduled resource."""
+    from services.scheduler import get_scheduler
+    return get_scheduler().stats()
+
 @app.post("/api/feedback")
 def submit_feedback(req: FeedbackRequest):
     try:
@@ -134,9 +177,28 @@ def submit_feedback(req: FeedbackRequest):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+class _UploadFiles(StaticFiles):
+    """/uploads: aliases may be symlinks into UPLOAD_STORE_DIR, nothing else is followed."""
+
+    def __init__(self, directory: str, store_dir: str) -> None:
+        super().__init__(directory=directory, follow_symlink=True)
+        self._roots = [os.path.realpath(directory), os.path.realpath(store_dir)]
+
+    def lookup_path(self, path: str):
+        full_path, stat_result = super().lookup_path(path)
+        real = os.path.realpath(full_path) if full_path else ""
+        if real and any(os.path.commonpath([real, root]) == root for root in self._roots):
+            return full_path, stat_result
+        return "", None
+
+
 uploads_dir = os.getenv("UPLOADS_DIR", "/app/uploads")
 if os.path.exists(uploads_dir):
-    app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
+    app.mount(
+        "/uploads",
+        _UploadFiles(uploads_dir, os.getenv("UPLOAD_STORE_DIR", "/app/upload_store")),
+        name="uploads",
+    )
 
 # --- 라우터 등록 ---
 from routers import (
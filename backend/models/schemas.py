@@ -19,6 +19,7 @@ class ChatRequest(BaseModel):
     rerun: bool = False
     rerun_steps: Optional[List[Dict[str, Any]]] = None
     rerun_goal: Optional[str] = None
+    stream_segments: bool = False  # emit step_segment deltas during plan steps
 
 
 class StepQuestionRequest(BaseModel):
@@ -48,6 +49,9 @@ class SSEEventType(str, Enum):
     TOOL_CALL = "tool_call"
     TOOL_RESULT = "tool_result"
     STEP_START = "step_start"
+    STEP_SEGMENT = "step_segment"
+    STEP_EXECUTE = "step_execute"
+    QUEUE_POSITION = "queue_position"
     PLAN_COMPLETE = "plan_complete"
     DONE = "done"
     ERROR = "error"
@@ -59,6 +63,16 @@ class ChatEvent(BaseModel):
     data: Dict[str, Any]
 
 
+class RunInfo(BaseModel):
+    run_id: str
+    conv_id: str
+    kind: str  # chat | step_question | retry_step | execute_code
+    status: str  # running | done | error | stopped
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    last_event_id: int = 0  # attach / Last-Event-ID with this to follow from here
+
+
 # ─── Conversations ───
 
 class ConversationSummary(BaseModel):
@@ -165,7 +179,8 @@ class ExecuteCodeRequest(BaseModel):
     code: str
     language: str = "python"
     conv_id: Optional[str] = None
-    step_index: Optional[int] = None
+    step_index: int = 0
+    iteration: int = 0
 
 
 class NodeManifest(BaseModel):
@@ -184,6 +199,26 @@ class FileInfo(BaseModel):
 class FileUploadResponse(BaseModel):
     filename: str
     text_content: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: Optional[int] = None  # total bytes, if known (checked on complete)
+
+
+class UploadByHashRequest(BaseModel):
+    filename: str
+    sha256: str  # hex digest of the file's content
+
+
+class UploadSessionInfo(BaseModel):
+    upload_id: str
+    filename: str
+    offset: int  # bytes received so far — where the next chunk starts
+    size: Optional[int] = None
+    chunk_size: int
 
 
 # ─── Plan ───
@@ -1,76 +1,173 @@
-"""Chat endpoints with SSE streaming — 4 endpoints."""
+"""Chat endpoints with SSE streaming and run control — 9 endpoints.
+
+Each streaming request starts a run (services/runs.py) that executes
+independently of the HTTP connection; the response subscribes to the run's
+event log.  Frames carry ``id:`` fields and the run id is in the X-Run-Id
+header, so a dropped stream resumes with GET /api/runs/{run_id}/events and
+Last-Event-ID instead of re-running the request; /api/runs reports run
+status and cancels runs.  With several workers any of them serves these for
+runs of the others (services/state_backend.py).  A user over
+RUN_MAX_PER_USER active runs gets 429.  Token events are coalesced and
+serialized with orjson when available (services/event_frames.py).
+"""
 
-import json
 import logging
+from typing import AsyncIterator, Callable, List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Header, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
-from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_db
+from config import get_settings
 from models.schemas import (
+    ChatEvent,
     ChatRequest,
+    ExecuteCodeRequest,
     RetryStepRequest,
+    RunInfo,
     StatusResponse,
     StepQuestionRequest,
     StopRequest,
 )
 from services.chat_handler import ChatHandler
+from services.event_frames import dumps_bytes
+from services.runs import Run, RunLimitExceeded, RunRegistry, owner_of, with_db_session
 
 logger = logging.getLogger("aigen.chat_sse")
 router = APIRouter(tags=["chat"])
 
+# Seconds cancel_run waits for the run to unwind before reporting its status
+_CANCEL_WAIT = 10.0
+
 
 def _get_handler() -> ChatHandler:
     return ChatHandler.get_instance()
 
 
-async def _sse_generator(event_stream):
-    """Convert ChatEvent async generator to SSE text/event-stream format."""
+async def _sse_generator(run: Run, after: int):
+    """Convert a run's event log (from id ``after``) to SSE text/event-stream format."""
     try:
-        async for event in event_stream:
-            payload = {"type": event.type, **event.data}
-            yield f"data: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+        async for event_id, event in run.log.subscribe(after):
+            payload = dumps_bytes({"type": event.type, **event.data})
+            yield b"id: %d\ndata: %s\n\n" % (event_id, payload)
     except Exception as e:
         logger.exception("SSE stream error")
-        yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+        yield b"data: " + dumps_bytes({"type": "error", "error": str(e)}) + b"\n\n"
+
+
+async def _start_run(
+    http_request: Request, conv_id: str, kind: str,
+    events: Callable[[], AsyncIterator[ChatEvent]],
+) -> Run:
+    try:
+        return await RunRegistry.get_instance().start(conv_id, kind, events, owner=owner_of(http_request))
+    except RunLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
 
 
-def _streaming_response(event_stream) -> StreamingResponse:
+async def _get_run(run_id: str) -> Run:
+    run = await RunRegistry.get_instance().find(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found or expired")
+    return run
+
+
+def _streaming_response(run: Run, after: int = 0) -> StreamingResponse:
     return StreamingResponse(
-        _sse_generator(event_stream),
+        _sse_generator(run, after),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "X-Accel-Buffering": "no",
+            "X-Run-Id": run.run_id,
         },
     )
 
 
 @router.post("/api/chat")
-async def chat(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+async def chat(request: ChatRequest, http_request: Request):
     """SSE streaming chat — main entry point."""
     handler = _get_handler()
-    return _streaming_response(handler.handle_chat(request, db))
+    run = await _start_run(
+        http_request, request.conv_id or "", "chat",
+        with_db_session(lambda db: handler.handle_chat(request, db)),
+    )
+    return _streaming_response(run)
 
 
 @router.post("/step_question")
-async def step_question(
-    request: StepQuestionRequest, db: AsyncSession = Depends(get_db)
-):
+async def step_question(request: StepQuestionRequest, http_request: Request):
     """User question during plan execution."""
     handler = _get_handler()
-    return _streaming_response(handler.handle_step_question(request, db))
+    run = await _start_run(
+        http_request, request.conv_id, "step_question",
+        with_db_session(lambda db: handler.handle_step_question(request, db)),
+    )
+    return _streaming_response(run)
 
 
 @router.post("/retry_step")
-async def retry_step(
-    request: RetryStepRequest, db: AsyncSession = Depends(get_db)
-):
+async def retry_step(request: RetryStepRequest, http_request: Request):
     """Retry a specific plan step."""
     handler = _get_handler()
-    return _streaming_response(handler.handle_retry_step(request, db))
+    run = await _start_run(
+        http_request, request.conv_id, "retry_step",
+        with_db_session(lambda db: handler.handle_retry_step(request, db)),
+    )
+    return _streaming_response(run)
+
+
+@router.post("/api/execute_code/stream")
+async def execute_code_stream(request: ExecuteCodeRequest, http_request: Request):
+    """Run a code block, streaming stdout/stderr as step_execute progress events.
+
+    Disabled unless CODE_EXEC_API_ENABLED.
+    """
+    if not get_settings().CODE_EXEC_API_ENABLED:
+        raise HTTPException(status_code=403, detail="Direct code execution is disabled")
+    handler = _get_handler()
+    run = await _start_run(
+        http_request, request.conv_id or "", "execute_code",
+        lambda: handler.handle_execute_code(request),
+    )
+    return _streaming_response(run)
+
+
+@router.get("/api/runs", response_model=List[RunInfo])
+async def list_runs(
+    conv_id: Optional[str] = Query(None),
+    active: Optional[bool] = Query(None, description="Only active (true) or finished (false) runs"),
+):
+    """Running and recently finished runs, newest first."""
+    return await RunRegistry.get_instance().list_runs(conv_id, active)
+
+
+@router.get("/api/runs/{run_id}", response_model=RunInfo)
+async def get_run(run_id: str):
+    return (await _get_run(run_id)).info()
+
+
+@router.post("/api/runs/{run_id}/cancel", response_model=RunInfo)
+async def cancel_run(run_id: str):
+    """Stop a run; a plan saves its results so far. The log ends with done ``stopped``."""
+    runs = RunRegistry.get_instance()
+    run = await _get_run(run_id)
+    if await runs.cancel_run(run_id):
+        await runs.wait(run, _CANCEL_WAIT)
+    return run.info()
+
+
+@router.get("/api/runs/{run_id}/events")
+async def run_events(
+    run_id: str,
+    after: Optional[int] = Query(None, ge=0, description="Replay events after this id"),
+    last_event_id: Optional[str] = Header(None),
+):
+    """Reattach to a run: replay events after Last-Event-ID (or ``after``), then follow it."""
+    run = await _get_run(run_id)
+    if after is None:
+        after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    return _streaming_response(run, after)
 
 
 @router.post("/api/stop", response_model=StatusResponse)
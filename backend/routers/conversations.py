@@ -1,5 +1,6 @@
 """Conversation management endpoints — 7 endpoints."""
 
+import asyncio
 import logging
 from uuid import UUID
 
@@ -16,6 +17,7 @@ from models.schemas import (
     TruncateRequest,
 )
 from services.conversation_service import ConversationService
+from tools.kernel_pool import KernelPool
 
 logger = logging.getLogger("aigen.conversations")
 
@@ -52,6 +54,8 @@ async def create_conversation(
 async def delete_conversation(conv_id: UUID, db: AsyncSession = Depends(get_db)):
     svc = ConversationService(db)
     await svc.delete_conversation(conv_id)
+    # Its warm kernel (CODE_EXEC_MODE="kernel") would otherwise idle until evicted
+    await asyncio.to_thread(KernelPool.get_instance().release, str(conv_id))
     return StatusResponse(status="ok", message="Conversation deleted")
 
 
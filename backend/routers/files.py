@@ -1,20 +1,44 @@
-"""File management endpoints — 5 endpoints."""
-
+"""File management endpoints — 12 endpoints.
+
+Uploads are streamed to disk (services/uploads.py) and stored by content
+hash (services/upload_store.py), so a file whose SHA-256 is already known
+can be added by hash alone; large files can use the resumable chunked
+session endpoints under /api/data/uploads.  The upload listing is served
+from an in-memory index (services/upload_index.py) with paging, sorting and
+ETag revalidation.  Output files are served with ETag / If-None-Match
+revalidation and single byte-range (HTTP Range) support; table outputs also
+have a paged preview.
+"""
+
+import asyncio
+import hashlib
 import mimetypes
 import os
 import re
-from datetime import datetime, timezone
+from typing import Literal, Optional
 
-from fastapi import APIRouter, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 
 from config import get_settings
-from models.schemas import FileInfo, FileUploadResponse, StatusResponse
+from models.schemas import (
+    FileInfo,
+    FileUploadResponse,
+    StatusResponse,
+    UploadByHashRequest,
+    UploadSessionInfo,
+    UploadSessionRequest,
+)
+from services.table_preview import PREVIEW_EXTENSIONS, preview_table
+from services.upload_index import UploadIndex
+from services.upload_store import is_sha256
+from services.uploads import UploadManager, UploadOffsetMismatch, UploadSession, iter_upload_file
 
 router = APIRouter(prefix="/api", tags=["files"])
 
-IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".svg", ".ico"}
-TEXT_EXTENSIONS = {".txt", ".csv", ".tsv", ".json", ".jsonl", ".md", ".xml", ".yaml", ".yml", ".log"}
+
+_RANGE_CHUNK = 256 * 1024
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
 
 
 def _get_uploads_dir() -> str:
@@ -40,97 +64,190 @@ def _safe_path(base_dir: str, *parts: str) -> str:
     return full
 
 
-def _extract_text(file_path: str) -> str | None:
-    """Extract text from non-image files (simple text-based formats)."""
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext not in TEXT_EXTENSIONS:
-        return None
-    try:
-        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
-            return f.read(1_000_000)  # cap at 1MB text
-    except Exception:
-        return None
+def _file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
 
 
-@router.get("/data/list", response_model=list[FileInfo])
-async def list_files():
-    """List all uploaded files, excluding .extracted.txt companions."""
-    uploads = _get_uploads_dir()
-    if not os.path.isdir(uploads):
-        return []
-
-    files: list[FileInfo] = []
-    for fname in os.listdir(uploads):
-        if fname.endswith(".extracted.txt"):
-            continue
-        fpath = os.path.join(uploads, fname)
-        if not os.path.isfile(fpath):
-            continue
-        stat = os.stat(fpath)
-        mime = mimetypes.guess_type(fname)[0] or "application/octet-stream"
-        files.append(
-            FileInfo(
-                filename=fname,
-                size=stat.st_size,
-                type=mime,
-                uploaded_at=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return header.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in header.split(",")]
+
+
+def _iter_file(path: str, start: int, length: int):
+    # Sync generator: StreamingResponse iterates it in the threadpool
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(_RANGE_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class _WholeFileResponse(FileResponse):
+    """FileResponse that always sends the whole file.
+
+    Starlette's FileResponse answers Range itself (400 for a malformed one);
+    _file_response has already decided the range is not served.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"range", b"if-range")]
+        await super().__call__({**scope, "headers": headers}, receive, send)
+
+
+def _file_response(request: Request, fpath: str, filename: str) -> Response:
+    """FileResponse with ETag revalidation (304) and a single byte range (206 / 416)."""
+    st = os.stat(fpath)
+    etag = _file_etag(st)
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        m = _RANGE_RE.match(range_header.strip())
+        if m and (m.group(1) or m.group(2)):
+            size = st.st_size
+            if m.group(1):
+                start = int(m.group(1))
+                end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            else:  # suffix range: the last N bytes
+                start, end = max(size - int(m.group(2)), 0), size - 1
+            if start >= size or start > end:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+            length = end - start + 1
+            headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)})
+            return StreamingResponse(
+                _iter_file(fpath, start, length), status_code=206, media_type=media_type, headers=headers
             )
-        )
+        # Multiple or malformed ranges: fall through to the whole file
 
-    files.sort(key=lambda f: f.uploaded_at or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+    return _WholeFileResponse(fpath, media_type=media_type, filename=filename, headers=headers)
+
+
+@router.get("/data/list", response_model=list[FileInfo])
+async def list_files(
+    request: Request,
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=10_000, description="Page size (default: all)"),
+    sort: Literal["uploaded_at", "filename", "size"] = "uploaded_at",
+    order: Literal["asc", "desc"] = "desc",
+):
+    """List uploaded files (excluding .extracted.txt companions) from the in-memory index.
+
+    The total count is in X-Total-Count; If-None-Match revalidates against
+    the listing's ETag.
+    """
+    index = UploadIndex.get_instance()
+    await index.ensure_fresh()
+    etag = index.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    files, total = index.page(sort, order == "desc", offset, limit)
+    response.headers.update({**headers, "X-Total-Count": str(total)})
     return files
 
 
 @router.post("/data/upload", response_model=FileUploadResponse)
 async def upload_file(file: UploadFile):
-    """Upload a file to UPLOADS_DIR with dedup and optional text extraction."""
-    uploads = _get_uploads_dir()
-    os.makedirs(uploads, exist_ok=True)
-
+    """Upload a file to UPLOADS_DIR, streamed to disk, with dedup and text extraction."""
     safe_name = _sanitize_filename(file.filename or "upload")
-    base, ext = os.path.splitext(safe_name)
-    dest = os.path.join(uploads, safe_name)
+    result = await UploadManager.get_instance().receive(safe_name, iter_upload_file(file))
+    return FileUploadResponse(**result)
+
+
+@router.post("/data/upload/by-hash", response_model=FileUploadResponse)
+async def upload_by_hash(req: UploadByHashRequest):
+    """Add a file whose content is already stored, without sending it (404 if unknown)."""
+    digest = req.sha256.lower()
+    if not is_sha256(digest):
+        raise HTTPException(status_code=400, detail="sha256 must be a hex SHA-256 digest")
+    result = await UploadManager.get_instance().link(_sanitize_filename(req.filename), digest)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Content not stored; upload the file")
+    return FileUploadResponse(**result)
+
+
+def _session_info(session: UploadSession) -> UploadSessionInfo:
+    return UploadSessionInfo(
+        upload_id=session.upload_id,
+        filename=session.filename,
+        offset=session.offset,
+        size=session.size,
+        chunk_size=get_settings().UPLOAD_CHUNK_SIZE,
+    )
+
+
+async def _get_session(upload_id: str) -> UploadSession:
+    session = await UploadManager.get_instance().get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
 
-    # Handle duplicate filenames
-    counter = 1
-    while os.path.exists(dest):
-        safe_name = f"{base}_{counter}{ext}"
-        dest = os.path.join(uploads, safe_name)
-        counter += 1
 
-    # Save file
-    content = await file.read()
-    with open(dest, "wb") as f:
-        f.write(content)
+@router.post("/data/uploads", response_model=UploadSessionInfo)
+async def create_upload_session(req: UploadSessionRequest):
+    """Start a resumable upload; send chunks with PUT, then POST .../complete."""
+    session = await UploadManager.get_instance().create(_sanitize_filename(req.filename), req.size)
+    return _session_info(session)
 
-    # Text extraction for non-image files
-    text_content = None
-    if ext.lower() not in IMAGE_EXTENSIONS:
-        text_content = _extract_text(dest)
-        if text_content is not None:
-            txt_path = dest + ".extracted.txt"
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(text_content)
 
-    return FileUploadResponse(filename=safe_name, text_content=text_content)
+@router.get("/data/uploads/{upload_id}", response_model=UploadSessionInfo)
+async def get_upload_session(upload_id: str):
+    """Bytes received so far — where an interrupted upload resumes."""
+    return _session_info(await _get_session(upload_id))
+
+
+@router.put("/data/uploads/{upload_id}", response_model=UploadSessionInfo)
+async def put_upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Append the raw request body at ``offset`` (409 with the expected offset otherwise)."""
+    session = await _get_session(upload_id)
+    try:
+        await UploadManager.get_instance().write(session, offset, request.stream())
+    except UploadOffsetMismatch as e:
+        return JSONResponse(
+            status_code=409, content={"detail": str(e), "offset": e.expected}
+        )
+    return _session_info(session)
+
+
+@router.post("/data/uploads/{upload_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(upload_id: str):
+    """Store the uploaded bytes under the session's filename."""
+    session = await _get_session(upload_id)
+    try:
+        result = await UploadManager.get_instance().complete(session)
+    except UploadOffsetMismatch as e:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": f"Incomplete upload: {e.expected} of {session.size} bytes", "offset": e.expected},
+        )
+    return FileUploadResponse(**result)
+
+
+@router.delete("/data/uploads/{upload_id}", response_model=StatusResponse)
+async def abort_upload_session(upload_id: str):
+    """Discard an unfinished upload."""
+    await _get_session(upload_id)
+    await UploadManager.get_instance().abort(upload_id)
+    return StatusResponse(status="ok", message=f"Aborted upload {upload_id}")
 
 
 @router.delete("/data/{filename}", response_model=StatusResponse)
 async def delete_file(filename: str):
-    """Delete an uploaded file and its .extracted.txt companion."""
+    """Delete an uploaded file and its .extracted.txt companion (and the blob with its last name)."""
     uploads = _get_uploads_dir()
     fpath = _safe_path(uploads, filename)
 
-    if not os.path.isfile(fpath):
+    if not await UploadManager.get_instance().delete(os.path.relpath(fpath, uploads)):
         raise HTTPException(status_code=404, detail="File not found")
 
-    os.remove(fpath)
-
-    # Remove companion .extracted.txt if it exists
-    extracted = fpath + ".extracted.txt"
-    if os.path.isfile(extracted):
-        os.remove(extracted)
-
     return StatusResponse(status="ok", message=f"Deleted {filename}")
 
 
@@ -157,13 +274,49 @@ async def list_step_outputs(conv_id: str, step_id: str):
 
 
 @router.get("/outputs/{conv_id}/{step_id}/{filename}")
-async def get_step_output_file(conv_id: str, step_id: str, filename: str):
-    """Serve a specific step output file."""
+async def get_step_output_file(conv_id: str, step_id: str, filename: str, request: Request):
+    """Serve a specific step output file (Range / If-None-Match aware)."""
     outputs = _get_outputs_dir()
     fpath = _safe_path(outputs, conv_id, f"step_{step_id}", filename)
 
     if not os.path.isfile(fpath):
         raise HTTPException(status_code=404, detail="File not found")
 
-    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
-    return FileResponse(fpath, media_type=media_type, filename=filename)
+    return _file_response(request, fpath, filename)
+
+
+@router.get("/outputs/{conv_id}/{step_id}/{filename}/preview")
+async def preview_step_output_table(
+    conv_id: str,
+    step_id: str,
+    filename: str,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    columns: str = Query("", description="Comma-separated column subset"),
+    stats: bool = Query(False, description="Include per-column min / max / null count"),
+):
+    """One page of rows from a CSV / TSV / Parquet / Arrow output, read lazily."""
+    outputs = _get_outputs_dir()
+    fpath = _safe_path(outputs, conv_id, f"step_{step_id}", filename)
+
+    if not os.path.isfile(fpath):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not filename.lower().endswith(PREVIEW_EXTENSIONS):
+        raise HTTPException(status_code=415, detail="Not a table file")
+
+    # A page is a pure function of the file and the query: revalidate by ETag
+    key = f"{_file_etag(os.stat(fpath))}|{offset}|{limit}|{columns}|{stats}"
+    etag = f'"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    wanted = [c.strip() for c in columns.split(",") if c.strip()] or None
+    try:
+        page = await asyncio.to_thread(preview_table, fpath, offset, limit, wanted, stats)
+    except ImportError:
+        raise HTTPException(status_code=501, detail="pyarrow is required to preview this file")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(page, headers=headers)
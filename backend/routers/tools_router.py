@@ -75,3 +75,20 @@ async def list_data_lake() -> List[Dict[str, str]]:
     except Exception as e:
         logger.warning(f"Failed to load data lake: {e}")
         return []
+
+
+@router.get("/retrieval/cache")
+async def retrieval_cache_stats() -> Dict[str, Any]:
+    """Plan retrieval cache metrics (size, hits, misses, hit rate)."""
+    from services.retrieval_cache import get_retrieval_cache
+    return get_retrieval_cache().stats()
+
+
+@router.delete("/retrieval/cache")
+async def clear_retrieval_cache() -> Dict[str, Any]:
+    """Drop all retrieval cache entries, in memory and persisted (counters are kept)."""
+    from services.retrieval_cache import clear_persisted, get_retrieval_cache
+    cache = get_retrieval_cache()
+    cache.clear()
+    await clear_persisted()
+    return cache.stats()
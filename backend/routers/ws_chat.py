@@ -1,13 +1,25 @@
-"""WebSocket chat endpoint with action-based message routing."""
+"""WebSocket chat endpoint with action-based message routing.
+
+Actions start runs (services/runs.py) and the connection follows their
+event logs; messages carry the event ``id`` and ``run_id``.  Disconnecting
+detaches without stopping the runs — after reconnecting, the client sends
+``{"action": "attach", "run_id": ..., "after": <last id>}`` to receive the
+events it missed and follow the run again.  Every connection to a
+conversation follows the runs started in it (ws/manager.py), so several
+tabs or viewers see the same run.  Runs are started for the connecting user
+(``owner_of``); an action over RUN_MAX_PER_USER active runs gets an error
+event instead.
+"""
 
-import asyncio
 import logging
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
-from db.database import async_session_factory
-from models.schemas import ChatRequest, StepQuestionRequest, RetryStepRequest
+from config import get_settings
+from models.schemas import ChatRequest, ExecuteCodeRequest, StepQuestionRequest, RetryStepRequest
 from services.chat_handler import ChatHandler
+from services.event_frames import dumps
+from services.runs import RunLimitExceeded, RunRegistry, owner_of, with_db_session
 from ws.events import EventType, WSMessage
 from ws.manager import manager
 
@@ -18,45 +30,47 @@ router = APIRouter(tags=["websocket"])
 
 @router.websocket("/ws/chat/{conv_id}")
 async def websocket_chat(websocket: WebSocket, conv_id: str):
-    await manager.connect(websocket, conv_id)
-    streaming_task: asyncio.Task | None = None
+    conn = await manager.connect(websocket, conv_id)
+    runs = RunRegistry.get_instance()
+    owner = owner_of(websocket)
 
-    async def _run_stream(handler, coro_gen, cid):
-        """Stream events from an async generator to the WebSocket."""
+    async def _error(message: str):
+        await conn.send(WSMessage(type=EventType.ERROR, data={"error": message}))
+
+    async def _start(run_conv_id: str, kind: str, events):
         try:
-            async for event in coro_gen:
-                ws_msg = WSMessage(type=event.type, data=event.data)
-                await manager.send_event(cid, ws_msg)
-        except asyncio.CancelledError:
-            # Task was cancelled by stop action
-            await manager.send_event(
-                cid, WSMessage(type=EventType.DONE, data={"stopped": True})
-            )
-        except Exception as e:
-            logger.error(f"Streaming error: {e}")
-            await manager.send_event(
-                cid, WSMessage(type=EventType.ERROR, data={"error": str(e)})
-            )
+            run = await runs.start(run_conv_id, kind, events, owner=owner)
+        except RunLimitExceeded as e:
+            await _error(str(e))
+            return
+        manager.follow_run(run, conn)
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await conn.receive_json()
             action = data.get("action", "chat")
             handler = ChatHandler.get_instance()
 
             # Stop doesn't need a DB session
             if action == "stop":
-                handler.stop(data.get("conv_id", conv_id))
-                # Cancel the streaming task if running
-                if streaming_task and not streaming_task.done():
-                    streaming_task.cancel()
-                    # CancelledError handler in _run_stream will send done
+                stop_conv = data.get("conv_id", conv_id)
+                handler.stop(stop_conv)
+                # Cancelled runs log a done event, which followers forward
+                if not await runs.cancel(stop_conv):
+                    # No running run, send done directly
+                    await conn.send(WSMessage(type=EventType.DONE, data={"stopped": True}))
+                continue
+
+            if action == "attach":
+                run_id = data.get("run_id")
+                if run_id:
+                    run = await runs.find(run_id)
                 else:
-                    # No running task, send done directly
-                    await manager.send_event(
-                        conv_id,
-                        WSMessage(type=EventType.DONE, data={"stopped": True}),
-                    )
+                    run = await runs.find_latest(data.get("conv_id", conv_id))
+                if run is not None:
+                    conn.attach(run, int(data.get("after") or 0))
+                elif run_id:
+                    await _error(f"Run {run_id} not found or expired")
                 continue
 
             if action == "chat":
@@ -69,15 +83,12 @@ async def websocket_chat(websocket: WebSocket, conv_id: str):
                     rerun=data.get("rerun", False),
                     rerun_steps=data.get("rerun_steps"),
                     rerun_goal=data.get("rerun_goal"),
+                    stream_segments=data.get("stream_segments", False),
                 )
 
-                async def _chat_gen(req=request):
-                    async with async_session_factory() as db:
-                        async for event in handler.handle_chat(req, db):
-                            yield event
-
-                streaming_task = asyncio.create_task(
-                    _run_stream(handler, _chat_gen(), conv_id)
+                await _start(
+                    request.conv_id or conv_id, "chat",
+                    with_db_session(lambda db, req=request: handler.handle_chat(req, db)),
                 )
 
             elif action == "step_question":
@@ -89,13 +100,9 @@ async def websocket_chat(websocket: WebSocket, conv_id: str):
                     steps=data.get("steps"),
                 )
 
-                async def _step_question_gen(req=request):
-                    async with async_session_factory() as db:
-                        async for event in handler.handle_step_question(req, db):
-                            yield event
-
-                streaming_task = asyncio.create_task(
-                    _run_stream(handler, _step_question_gen(), conv_id)
+                await _start(
+                    request.conv_id, "step_question",
+                    with_db_session(lambda db, req=request: handler.handle_step_question(req, db)),
                 )
 
             elif action == "retry_step":
@@ -109,37 +116,37 @@ async def websocket_chat(websocket: WebSocket, conv_id: str):
                     plan_goal=data.get("plan_goal"),
                 )
 
-                async def _retry_step_gen(req=request):
-                    async with async_session_factory() as db:
-                        async for event in handler.handle_retry_step(req, db):
-                            yield event
+                await _start(
+                    request.conv_id, "retry_step",
+                    with_db_session(lambda db, req=request: handler.handle_retry_step(req, db)),
+                )
 
-                streaming_task = asyncio.create_task(
-                    _run_stream(handler, _retry_step_gen(), conv_id)
+            elif action == "execute_code":
+                if not get_settings().CODE_EXEC_API_ENABLED:
+                    await _error("Direct code execution is disabled")
+                    continue
+                request = ExecuteCodeRequest(
+                    code=data.get("code", ""),
+                    language=data.get("language", "python"),
+                    conv_id=data.get("conv_id", conv_id),
+                    step_index=data.get("step_index", 0),
+                    iteration=data.get("iteration", 0),
+                )
+                await _start(
+                    request.conv_id or conv_id, "execute_code",
+                    lambda req=request: handler.handle_execute_code(req),
                 )
 
             else:
-                await manager.send_event(
-                    conv_id,
-                    WSMessage(
-                        type=EventType.ERROR,
-                        data={"error": f"Unknown action: {action}"},
-                    ),
-                )
+                await _error(f"Unknown action: {action}")
 
     except WebSocketDisconnect:
-        if streaming_task and not streaming_task.done():
-            streaming_task.cancel()
-        manager.disconnect(conv_id)
+        # Runs keep going; the client can reattach
+        manager.disconnect(conn)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        if streaming_task and not streaming_task.done():
-            streaming_task.cancel()
         try:
-            await manager.send_event(
-                conv_id,
-                WSMessage(type=EventType.ERROR, data={"error": str(e)}),
-            )
+            await websocket.send_text(dumps(WSMessage(type=EventType.ERROR, data={"error": str(e)}).to_dict()))
         except Exception:
             pass
-        manager.disconnect(conv_id)
+        manager.disconnect(conn)
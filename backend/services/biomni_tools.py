@@ -7,12 +7,19 @@ Also provides training-format retrieval that matches the Phase 0 format from
 data_formatting/output_formatted.json (the model was trained on this format).
 """
 
+import hashlib
 import json
 import logging
-import os
 import re
-from typing import Any, Dict, List, Optional, TypedDict
-from langfuse.decorators import observe
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+from langfuse.decorators import observe, langfuse_context
+
+from config import get_settings
+from services.data_lake_catalog import DataLakeCatalog
+from services.retrieval_index import BM25Index, max_normalized, tokenize
 
 logger = logging.getLogger("aigen.biomni_tools")
 
@@ -24,6 +31,22 @@ class RetrievalResult(TypedDict):
     know_how: List[Dict[str, str]]
 
 
+class RetrievalStats(TypedDict, total=False):
+    shortlist_ms: float
+    shortlist_counts: Dict[str, int]
+    prompt_chars: int
+    prompt_tokens_est: int
+    full_prompt_chars: int
+    rerank_ms: float
+    llm_ms: float
+    layout: str
+    fallback: bool
+
+
+class RetrievalResultWithStats(RetrievalResult, total=False):
+    stats: RetrievalStats
+
+
 def scan_data_lake(data_lake_path: str) -> List[Dict[str, str]]:
     """List top-level items in the data lake directory with schema info.
 
@@ -31,41 +54,11 @@ def scan_data_lake(data_lake_path: str) -> List[Dict[str, str]]:
     For CSV/TSV files, reads header row to provide column names.
     For directories, lists first few items.
     Returns empty list if directory doesn't exist.
+
+    Blocking; served from the DataLakeCatalog cache (async callers use
+    ``await DataLakeCatalog.get_instance().scan(path)``).
     """
-    if not data_lake_path:
-        return []
-    try:
-        items = sorted(os.listdir(data_lake_path))
-    except (OSError, FileNotFoundError):
-        return []
-    result = []
-    for item in items:
-        full_path = os.path.join(data_lake_path, item)
-        desc = ""
-        if os.path.isfile(full_path) and item.lower().endswith(('.csv', '.tsv', '.txt')):
-            try:
-                sep = '\t' if item.lower().endswith('.tsv') else ','
-                with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    header = f.readline().strip()
-                if header:
-                    cols = [c.strip().strip('"') for c in header.split(sep)]
-                    desc = f"columns: {', '.join(cols[:20])}"
-                    if len(cols) > 20:
-                        desc += f" ... ({len(cols)} total)"
-            except Exception:
-                pass
-        elif os.path.isdir(full_path):
-            try:
-                sub_items = sorted(os.listdir(full_path))[:5]
-                if sub_items:
-                    desc = f"directory containing: {', '.join(sub_items)}"
-                    total = len(os.listdir(full_path))
-                    if total > 5:
-                        desc += f" ... ({total} items)"
-            except Exception:
-                pass
-        result.append({"name": item, "description": desc})
-    return result
+    return DataLakeCatalog.get_instance().scan_sync(data_lake_path)
 
 
 class BiomniToolLoader:
@@ -79,6 +72,15 @@ class BiomniToolLoader:
         self._data_lake_dict: Dict[str, str] = {}
         self._library_dict: Dict[str, str] = {}
         self._know_how_docs: List[Dict[str, str]] = []
+        # Keyword retrieval: one BM25 index per catalog category (built in initialize)
+        self._indexes: Dict[str, BM25Index] = {}
+        self._catalog: Dict[str, List[Dict[str, Any]]] = {}
+        self._catalog_hash = ""
+        # Rendered full-catalog prompt section, keyed by catalog_hash(data_lake_items)
+        self._catalog_text_memo: "OrderedDict[str, str]" = OrderedDict()
+        # Embedding retrieval: catalog matrix, built lazily on first use
+        self._embeddings: Optional[Any] = None
+        self._embeddings_lock = threading.Lock()
         self._initialized = False
 
     @classmethod
@@ -121,6 +123,7 @@ class BiomniToolLoader:
             except (ImportError, Exception) as kh_err:
                 logger.warning(f"Know-how loader not available: {kh_err}")
 
+            self._build_indexes()
             self._initialized = True
             logger.info(
                 f"BiomniToolLoader initialized: {len(self._module2api)} modules, "
@@ -184,60 +187,200 @@ class BiomniToolLoader:
     def _extract_keywords(self, query: str) -> List[str]:
         """Tokenize query into lowercase keywords (3+ chars), remove stop words."""
         return [
-            w.lower()
-            for w in re.split(r"\W+", query)
-            if len(w) >= 3 and w.lower() not in self._KEYWORD_STOP
+            w
+            for w in tokenize(query)
+            if len(w) >= 3 and w not in self._KEYWORD_STOP
         ]
 
+    # ─── Keyword retrieval (BM25 inverted index) ───
+
+    # Field weights: name match is the strongest signal, then module, then description
+    _NAME_WEIGHT = 3.0
+    _MODULE_WEIGHT = 2.0
+    _DESC_WEIGHT = 1.0
+
+    def _build_indexes(self) -> None:
+        """Tokenize the catalog once into per-category BM25 indexes."""
+        self._catalog = {
+            "tools": self._all_tools,
+            "data_lake": [{"name": n, "description": d} for n, d in self._data_lake_dict.items()],
+            "libraries": [{"name": n, "description": d} for n, d in self._library_dict.items()],
+            "know_how": self._know_how_docs,
+        }
+        self._indexes = {
+            "tools": BM25Index.build(
+                (
+                    (t.get("name", ""), self._NAME_WEIGHT),
+                    (t.get("module", ""), self._MODULE_WEIGHT),
+                    (t.get("description", ""), self._DESC_WEIGHT),
+                )
+                for t in self._all_tools
+            ),
+        }
+        for category in ("data_lake", "libraries", "know_how"):
+            self._indexes[category] = BM25Index.build(
+                (
+                    (str(item.get("name", "")), self._NAME_WEIGHT),
+                    (str(item.get("description", "")), self._DESC_WEIGHT),
+                )
+                for item in self._catalog[category]
+            )
+        digest = hashlib.sha256()
+        for category, items in self._catalog.items():
+            digest.update(category.encode("utf-8"))
+            for item in items:
+                digest.update(f"\x00{item.get('module', '')}.{item.get('name', '')}:{item.get('description', '')}".encode("utf-8"))
+        self._catalog_hash = digest.hexdigest()
+        self._catalog_text_memo.clear()
+        logger.info(
+            "Built keyword indexes: "
+            + ", ".join(f"{k}={len(v)}" for k, v in self._indexes.items())
+        )
+
+    def catalog_hash(self, data_lake_items: Optional[List[Dict[str, str]]] = None) -> str:
+        """Version of the retrievable catalog, including scanned data-lake items."""
+        if not data_lake_items:
+            return self._catalog_hash
+        digest = hashlib.sha256(self._catalog_hash.encode("utf-8"))
+        for item in data_lake_items:
+            digest.update(f"\x00{item.get('name', '')}:{item.get('description', '')}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def resolve_names(
+        self, names: Dict[str, List[str]],
+        data_lake_items: Optional[List[Dict[str, str]]] = None,
+    ) -> RetrievalResult:
+        """Map selections stored by name back to catalog items (unknown names dropped)."""
+        catalog = self._full_catalog(data_lake_items)
+        resolved: Dict[str, List[Dict[str, Any]]] = {}
+        for category, items in catalog.items():
+            by_name = {item.get("name"): item for item in items}
+            resolved[category] = [by_name[n] for n in names.get(category, []) if n in by_name]
+        return RetrievalResult(**resolved)
+
+    def search_index(self, category: str, query: str, top_k: int = 15) -> List[Tuple[int, float]]:
+        """BM25-ranked (catalog index, score) pairs for one category.
+
+        category: "tools" | "data_lake" | "libraries" | "know_how".  Indices
+        refer to the catalog order used by build_retrieval_prompt.
+        """
+        index = self._indexes.get(category)
+        if index is None:
+            return []
+        return index.search(self._extract_keywords(query), top_k)
+
     def keyword_search(
         self, query: str, max_results: int = 15
     ) -> List[Dict[str, Any]]:
-        """Simple keyword-based tool search as fallback when LLM retrieval fails.
+        """BM25 keyword tool search (fallback when LLM retrieval is off or fails).
 
-        Scores each tool by counting how many query keywords appear in the
-        tool's name, description, and module name.
+        Scores tools over name, module and description via the inverted
+        index built in initialize().
         """
-        if not self._all_tools:
-            return []
+        return [self._all_tools[i] for i, _ in self.search_index("tools", query, max_results)]
 
-        keywords = self._extract_keywords(query)
-        if not keywords:
-            return []
+    # Result caps for the non-LLM retrieval modes (tools use max_tools)
+    _CATEGORY_LIMITS = {"data_lake": 10, "libraries": 10, "know_how": 5}
+
+    def keyword_retrieval(self, query: str, max_tools: int = 15) -> RetrievalResult:
+        """BM25 retrieval across all catalog categories, no LLM call."""
+        def _top(category: str, k: int) -> List[Dict[str, Any]]:
+            items = self._catalog.get(category, [])
+            return [items[i] for i, _ in self.search_index(category, query, k)]
+
+        return RetrievalResult(
+            tools=_top("tools", max_tools),
+            data_lake=_top("data_lake", self._CATEGORY_LIMITS["data_lake"]),
+            libraries=_top("libraries", self._CATEGORY_LIMITS["libraries"]),
+            know_how=_top("know_how", self._CATEGORY_LIMITS["know_how"]),
+        )
 
-        scored: List[tuple] = []
-        for tool in self._all_tools:
-            name = tool.get("name", "").lower()
-            desc = tool.get("description", "").lower()
-            module = tool.get("module", "").lower()
-
-            score = 0
-            for kw in keywords:
-                if kw in name:
-                    score += 3  # name match is strongest signal
-                elif kw in module:
-                    score += 2  # module match (e.g., "literature")
-                elif kw in desc:
-                    score += 1  # description match
-            if score > 0:
-                scored.append((score, tool))
-
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [t for _, t in scored[:max_results]]
-
-    def _keyword_search_dict(
-        self, query_keywords: List[str], source: Dict[str, str], max_results: int = 10
+    def _data_lake_list(
+        self, data_lake_items: Optional[List[Dict[str, str]]] = None
     ) -> List[Dict[str, str]]:
-        """Keyword-match items from a name→description dict (data_lake, libraries)."""
-        if not source or not query_keywords:
-            return []
-        scored: List[tuple] = []
-        for name, desc in source.items():
-            text = f"{name} {desc}".lower()
-            score = sum(2 if kw in name.lower() else 1 for kw in query_keywords if kw in text)
-            if score > 0:
-                scored.append((score, {"name": name, "description": desc}))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [item for _, item in scored[:max_results]]
+        """Registry data-lake items followed by scanned items not in the registry.
+
+        Same order as the DATA LAKE section of build_retrieval_prompt.
+        """
+        dl_list = [{"name": n, "description": d} for n, d in self._data_lake_dict.items()]
+        registered_names = set(self._data_lake_dict.keys())
+        for item in data_lake_items or []:
+            if item.get("name") not in registered_names:
+                dl_list.append(item)
+        return dl_list
+
+    # ─── Embedding retrieval (use_llm_retrieval: embedding) ───
+
+    # Minimum cosine similarity for an item to be selected
+    _EMBEDDING_MIN_SCORE = 0.1
+
+    @staticmethod
+    def _embedding_text(item: Dict[str, Any]) -> str:
+        name = str(item.get("name", "")).replace("_", " ")
+        module = str(item.get("module", "")).rsplit(".", 1)[-1].replace("_", " ")
+        return " ".join(p for p in (name, module, str(item.get("description", ""))) if p)
+
+    def _get_embeddings(self) -> Any:
+        """Embed the catalog once (thread-safe; first call may take a while)."""
+        from services.embedding_index import CatalogEmbeddings, create_embedder
+
+        with self._embeddings_lock:
+            if self._embeddings is None:
+                t0 = time.perf_counter()
+                embedder = create_embedder(get_settings().RETRIEVAL_EMBEDDING_MODEL)
+                self._embeddings = CatalogEmbeddings(embedder, {
+                    category: [self._embedding_text(item) for item in items]
+                    for category, items in self._catalog.items()
+                })
+                logger.info(
+                    f"Catalog embeddings built ({embedder.name}) in "
+                    f"{(time.perf_counter() - t0) * 1000:.0f} ms"
+                )
+            return self._embeddings
+
+    def embedding_retrieval(
+        self, query: str, max_tools: int = 15,
+        data_lake_items: Optional[List[Dict[str, str]]] = None,
+    ) -> RetrievalResult:
+        """Select resources by cosine similarity to the query, no LLM call.
+
+        Blocking (NumPy / model inference) — call via asyncio.to_thread.
+        Scanned data-lake items outside the registry are embedded per call.
+        """
+        emb = self._get_embeddings()
+        query_vec = emb.encode([query])[0]
+        min_score = self._EMBEDDING_MIN_SCORE
+
+        def _top(category: str, k: int) -> List[Dict[str, Any]]:
+            items = self._catalog.get(category, [])
+            return [items[i] for i, _ in emb.search(category, query_vec, k, min_score)]
+
+        dl_limit = self._CATEGORY_LIMITS["data_lake"]
+        dl_scored = [
+            (score, self._catalog["data_lake"][i])
+            for i, score in emb.search("data_lake", query_vec, dl_limit, min_score)
+        ]
+        extras = self._data_lake_list(data_lake_items)[len(self._catalog.get("data_lake", [])):]
+        if extras:
+            extra_vecs = emb.encode([self._embedding_text(item) for item in extras])
+            dl_scored += [
+                (score, extras[i])
+                for i, score in emb.rank(extra_vecs, query_vec, dl_limit, min_score)
+            ]
+            dl_scored.sort(key=lambda x: x[0], reverse=True)
+
+        result = RetrievalResult(
+            tools=_top("tools", max_tools),
+            data_lake=[item for _, item in dl_scored[:dl_limit]],
+            libraries=_top("libraries", self._CATEGORY_LIMITS["libraries"]),
+            know_how=_top("know_how", self._CATEGORY_LIMITS["know_how"]),
+        )
+        logger.info(
+            f"Embedding retrieval: {len(result['tools'])} tools, "
+            f"{len(result['data_lake'])} data_lake, {len(result['libraries'])} libraries, "
+            f"{len(result['know_how'])} know_how"
+        )
+        return result
 
     # ─── Training-format retrieval (matches Phase 0 training data) ───
 
@@ -282,11 +425,28 @@ class BiomniToolLoader:
         "- Empty category = empty list, e.g. DATA_LAKE: []"
     )
 
+    # "prefix" layout: static instructions + catalog first, query last, so
+    # consecutive retrieval calls share a long identical token prefix that
+    # vLLM's automatic prefix caching can reuse.
+    _PREFIX_HEAD = (
+        "You are an expert biomedical research assistant. Your task is to select the relevant resources to help answer a user's query.\n"
+        "\n"
+        "The available resources are listed below, followed by the user query. For each category, select items that are directly or indirectly relevant to answering the query.\n"
+        "Be generous in your selection - include resources that might be useful for the task, even if they're not explicitly mentioned in the query.\n"
+        "It's better to include slightly more resources than to miss potentially useful ones.\n"
+        "\n"
+        "You MUST output ONLY in the #OUTPUT FORMAT shown at the end. No other text."
+    )
+
+    _PREFIX_QUERY = "USER QUERY: {user_query}\n\n{plan_context_block}"
+
     def build_retrieval_prompt(
         self, user_query: str, plan_context: str = "",
         data_lake_items: Optional[List[Dict[str, str]]] = None,
         top_override: Optional[str] = None,
         bottom_override: Optional[str] = None,
+        catalog: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        layout: str = "standard",
     ) -> str:
         """Build a retrieval system prompt matching the training data format.
 
@@ -294,39 +454,83 @@ class BiomniToolLoader:
         that the model was trained on (Phase 0 in output_formatted.json).
 
         top_override / bottom_override: custom user edits from DB.
+        catalog: per-category item lists to list instead of the full catalog
+        (hybrid retrieval shortlist); indices in the prompt refer to these lists.
+        layout: "standard" (training format) or "prefix" (catalog before the
+        query, for prefix caching; ignored when top_override is set).
         """
-        # --- Top section ---
         plan_context_block = ""
         if plan_context:
             plan_context_block = f"PLAN CONTEXT:\n{plan_context}\n\n"
 
+        # --- Middle section (auto-generated from env_desc + tools) ---
+        if catalog is None:
+            middle = self._full_catalog_text(data_lake_items)
+        else:
+            middle = self._render_catalog(catalog)
+
+        # --- Bottom section ---
+        bottom = bottom_override if bottom_override else self._DEFAULT_BOTTOM
+
+        if layout == "prefix" and not top_override:
+            query_block = self._PREFIX_QUERY.replace("{user_query}", user_query)
+            query_block = query_block.replace("{plan_context_block}", plan_context_block)
+            return self._PREFIX_HEAD + "\n" + middle + "\n\n" + query_block.rstrip("\n") + "\n\n" + bottom
+
+        # --- Top section ---
         top_template = top_override if top_override else self._DEFAULT_TOP
         top = top_template.replace("{user_query}", user_query)
         top = top.replace("{plan_context_block}", plan_context_block)
         # Clean up leftover placeholder if no plan_context
         top = top.replace("{plan_context}", plan_context or "")
 
-        # --- Middle section (auto-generated from env_desc + tools) ---
+        return top + "\n" + middle + "\n\n" + bottom
+
+    # Distinct data-lake scans whose rendered catalog section is kept
+    _CATALOG_TEXT_MEMO_SIZE = 4
+
+    def _full_catalog_text(self, data_lake_items: Optional[List[Dict[str, str]]] = None) -> str:
+        """Rendered full-catalog section, memoized per catalog version."""
+        key = self.catalog_hash(data_lake_items)
+        text = self._catalog_text_memo.get(key)
+        if text is None:
+            text = self._render_catalog(self._full_catalog(data_lake_items))
+            self._catalog_text_memo[key] = text
+            while len(self._catalog_text_memo) > self._CATALOG_TEXT_MEMO_SIZE:
+                self._catalog_text_memo.popitem(last=False)
+        else:
+            self._catalog_text_memo.move_to_end(key)
+        return text
+
+    def _full_catalog(
+        self, data_lake_items: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """All catalog items per category, in retrieval prompt index order."""
+        return {
+            "tools": self._all_tools,
+            # DATA LAKE: env_desc registry, merged with scan results for custom data
+            "data_lake": self._data_lake_list(data_lake_items),
+            "libraries": [{"name": n, "description": d} for n, d in self._library_dict.items()],
+            "know_how": self._know_how_docs,
+        }
+
+    @staticmethod
+    def _render_catalog(catalog: Dict[str, List[Dict[str, Any]]]) -> str:
+        """Indexed AVAILABLE ... sections of the retrieval prompt."""
         lines = ["", "AVAILABLE TOOLS:"]
-        for idx, tool in enumerate(self._all_tools):
+        for idx, tool in enumerate(catalog.get("tools", [])):
             name = tool.get("name", "unknown")
             desc = tool.get("description", "")
             if len(desc) > 200:
                 desc = desc[:197] + "..."
             lines.append(f"{idx}. {name}: {desc}")
 
-        # DATA LAKE: use env_desc registry, merge with scan results for custom data
         lines.append("")
         lines.append("AVAILABLE DATA LAKE ITEMS:")
-        dl_items = list(self._data_lake_dict.items())
-        # Merge scan results not in registry
-        registered_names = set(self._data_lake_dict.keys())
-        if data_lake_items:
-            for item in data_lake_items:
-                if item.get("name") not in registered_names:
-                    dl_items.append((item["name"], item.get("description", "")))
+        dl_items = catalog.get("data_lake", [])
         if dl_items:
-            for idx, (name, desc) in enumerate(dl_items):
+            for idx, item in enumerate(dl_items):
+                name, desc = item.get("name", ""), item.get("description", "")
                 if desc:
                     lines.append(f"{idx}. {name}: {desc}")
                 else:
@@ -334,32 +538,28 @@ class BiomniToolLoader:
         else:
             lines.append("(none)")
 
-        # LIBRARIES: use env_desc registry
         lines.append("")
         lines.append("AVAILABLE SOFTWARE LIBRARIES:")
-        if self._library_dict:
-            for idx, (name, desc) in enumerate(self._library_dict.items()):
-                lines.append(f"{idx}. {name}: {desc}")
+        libraries = catalog.get("libraries", [])
+        if libraries:
+            for idx, item in enumerate(libraries):
+                lines.append(f"{idx}. {item.get('name', '')}: {item.get('description', '')}")
         else:
             lines.append("(none)")
 
         # KNOW-HOW: documents from KnowHowLoader
         lines.append("")
         lines.append("AVAILABLE KNOW-HOW DOCUMENTS (Best Practices & Protocols):")
-        if self._know_how_docs:
-            for idx, doc in enumerate(self._know_how_docs):
+        know_how = catalog.get("know_how", [])
+        if know_how:
+            for idx, doc in enumerate(know_how):
                 name = doc.get("name", "unknown")
                 desc = doc.get("description", "")
                 lines.append(f"{idx}. {name}: {desc}")
         else:
             lines.append("(none)")
 
-        middle = "\n".join(lines)
-
-        # --- Bottom section ---
-        bottom = bottom_override if bottom_override else self._DEFAULT_BOTTOM
-
-        return top + "\n" + middle + "\n\n" + bottom
+        return "\n".join(lines)
 
     @staticmethod
     def _parse_indices(match_str: str, items: list, max_count: int) -> list:
@@ -373,6 +573,134 @@ class BiomniToolLoader:
                     indices.append(idx)
         return [items[i] for i in indices[:max_count]]
 
+    @staticmethod
+    def _extract_indices_flexible(
+        content: str, category: str, other_categories: List[str], n_items: int
+    ) -> List[int]:
+        """Indices listed after a category label in free-form output.
+
+        Takes every integer between the label (e.g. "DATA_LAKE", "Data lake")
+        and the next other-category label; out-of-range numbers are dropped.
+        """
+        def _label(cat: str) -> str:
+            return cat.replace("_", r"[_\s-]?")
+
+        m = re.search(_label(category), content, re.IGNORECASE)
+        if not m:
+            return []
+        rest = content[m.end():]
+        ends = [
+            nm.start()
+            for nm in (re.search(_label(c), rest, re.IGNORECASE) for c in other_categories)
+            if nm
+        ]
+        section = rest[:min(ends)] if ends else rest
+        indices = (int(n) for n in re.findall(r"\b\d+\b", section))
+        return list(dict.fromkeys(i for i in indices if i < n_items))
+
+    def _parse_retrieval_response(
+        self, content: str, catalog: Dict[str, List[Dict[str, Any]]], max_tools: int,
+    ) -> Optional[RetrievalResult]:
+        """Map the index lists in a retrieval LLM response back to catalog items.
+
+        ``catalog`` must be the per-category lists the prompt was rendered from.
+        Returns None if nothing could be parsed.
+        """
+        tools = catalog.get("tools", [])
+        dl_list = catalog.get("data_lake", [])
+        lib_list = catalog.get("libraries", [])
+        kh_list = catalog.get("know_how", [])
+
+        # --- Strategy 1: Strict regex (TOOLS: [0, 3, 5] or TOOLS: 0, 3, 5) ---
+        def _strict_parse(cat_key: str, items: list, max_n: int) -> list:
+            m = re.search(rf"{cat_key}:\s*\[(.*?)\]", content, re.IGNORECASE)
+            if not m:
+                m = re.search(rf"{cat_key}:\s*([0-9][\d\s,]*)", content, re.IGNORECASE)
+            if m and m.group(1).strip() and items:
+                return self._parse_indices(m.group(1), items, max_n)
+            return []
+
+        selected_tools = _strict_parse("TOOLS", tools, max_tools)
+        selected_data_lake = _strict_parse("DATA_LAKE", dl_list, 20)
+        selected_libraries = _strict_parse("LIBRARIES", lib_list, 30)
+        selected_know_how = _strict_parse("KNOW_HOW", kh_list, 5)
+
+        if selected_tools or selected_data_lake or selected_libraries or selected_know_how:
+            logger.info(
+                f"LLM retrieval (strict): {len(selected_tools)} tools, "
+                f"{len(selected_data_lake)} data_lake, "
+                f"{len(selected_libraries)} libraries, "
+                f"{len(selected_know_how)} know_how"
+            )
+            return RetrievalResult(
+                tools=selected_tools,
+                data_lake=selected_data_lake,
+                libraries=selected_libraries,
+                know_how=selected_know_how,
+            )
+
+        # --- Strategy 2: Flexible extraction from free-form output ---
+        tool_idxs = self._extract_indices_flexible(
+            content, "TOOLS", ["DATA_LAKE", "LIBRARIES", "KNOW_HOW"], len(tools)
+        )
+        dl_idxs = self._extract_indices_flexible(
+            content, "DATA_LAKE", ["LIBRARIES", "KNOW_HOW", "TOOLS"], len(dl_list)
+        )
+        lib_idxs = self._extract_indices_flexible(
+            content, "LIBRARIES", ["KNOW_HOW", "TOOLS", "DATA_LAKE"], len(lib_list)
+        )
+        kh_idxs = self._extract_indices_flexible(
+            content, "KNOW_HOW", ["TOOLS", "DATA_LAKE", "LIBRARIES"], len(kh_list)
+        )
+
+        if tool_idxs or dl_idxs or lib_idxs or kh_idxs:
+            selected_tools = [tools[i] for i in tool_idxs[:max_tools]]
+            selected_data_lake = [dl_list[i] for i in dl_idxs[:20]]
+            selected_libraries = [lib_list[i] for i in lib_idxs[:30]]
+            selected_know_how = [kh_list[i] for i in kh_idxs[:5]]
+            logger.info(
+                f"LLM retrieval (flexible): {len(selected_tools)} tools, "
+                f"{len(selected_data_lake)} data_lake, "
+                f"{len(selected_libraries)} libraries, "
+                f"{len(selected_know_how)} know_how"
+            )
+            return RetrievalResult(
+                tools=selected_tools,
+                data_lake=selected_data_lake,
+                libraries=selected_libraries,
+                know_how=selected_know_how,
+            )
+
+        # --- Strategy 3: JSON fallback ---
+        try:
+            parsed = json.loads(content)
+            if isinstance(parsed, dict) and "tools" in parsed:
+                tool_names = {t.get("name") for t in parsed["tools"] if isinstance(t, dict)}
+                selected = [t for t in tools if t.get("name") in tool_names]
+                if selected:
+                    logger.info(f"LLM retrieval selected {len(selected)} tools by JSON")
+                    return RetrievalResult(
+                        tools=selected[:max_tools],
+                        data_lake=[],
+                        libraries=[],
+                        know_how=[],
+                    )
+        except (json.JSONDecodeError, TypeError):
+            pass
+        return None
+
+    @staticmethod
+    async def _invoke_llm(llm: Any, prompt: str) -> str:
+        from langchain_core.messages import HumanMessage
+
+        if hasattr(llm, "ainvoke"):
+            response = await llm.ainvoke([HumanMessage(content=prompt)])
+            return response.content if hasattr(response, "content") else str(response)
+        if hasattr(llm, "invoke"):
+            response = llm.invoke([HumanMessage(content=prompt)])
+            return response.content if hasattr(response, "content") else str(response)
+        return str(llm(prompt))
+
     @observe(as_type="span", name="tool_retrieval_with_llm")
     async def retrieval_with_llm(
         self, query: str, llm: Any, max_tools: int = 15,
@@ -380,126 +708,47 @@ class BiomniToolLoader:
         data_lake_items: Optional[List[Dict[str, str]]] = None,
         top_override: Optional[str] = None,
         bottom_override: Optional[str] = None,
-    ) -> RetrievalResult:
+        layout: str = "standard",
+    ) -> RetrievalResultWithStats:
         """Run tool retrieval using the training-data-compatible prompt format.
 
         Parses TOOLS, DATA_LAKE, and LIBRARIES indices from LLM response.
-        Falls back to keyword_search on failure.
+        Falls back to keyword_search on failure (marked with stats.fallback).
+        layout: see build_retrieval_prompt ("prefix" for vLLM prefix caching).
         """
         langfuse_context.update_current_span(input={"query": query, "plan_context": plan_context})
 
-        from langchain_core.messages import HumanMessage
-
-        data_lake_items = data_lake_items or []
+        catalog = self._full_catalog(data_lake_items)
         prompt = self.build_retrieval_prompt(
             query, plan_context, data_lake_items,
             top_override=top_override, bottom_override=bottom_override,
+            layout=layout,
+        )
+        stats = RetrievalStats(
+            prompt_chars=len(prompt),
+            prompt_tokens_est=len(prompt.encode("utf-8")) // 3 + 1,
+            layout=layout,
+            fallback=False,
         )
 
+        t0 = time.perf_counter()
         try:
-            if hasattr(llm, "ainvoke"):
-                response = await llm.ainvoke([HumanMessage(content=prompt)])
-                content = response.content if hasattr(response, "content") else str(response)
-            elif hasattr(llm, "invoke"):
-                response = llm.invoke([HumanMessage(content=prompt)])
-                content = response.content if hasattr(response, "content") else str(response)
-            else:
-                content = str(llm(prompt))
-
-            logger.info(f"Retrieval LLM response ({len(content)} chars): {content[:200]}")
-
-            # Build reference lists matching build_retrieval_prompt index order
-            dl_list = [{"name": n, "description": d} for n, d in self._data_lake_dict.items()]
-            registered_names = set(self._data_lake_dict.keys())
-            for item in data_lake_items:
-                if item.get("name") not in registered_names:
-                    dl_list.append(item)
-            lib_list = [{"name": n, "description": d} for n, d in self._library_dict.items()]
-
-            # --- Strategy 1: Strict regex (TOOLS: [0, 3, 5] or TOOLS: 0, 3, 5) ---
-            def _strict_parse(cat_key: str, items: list, max_n: int) -> list:
-                m = re.search(rf"{cat_key}:\s*\[(.*?)\]", content, re.IGNORECASE)
-                if not m:
-                    m = re.search(rf"{cat_key}:\s*([0-9][\d\s,]*)", content, re.IGNORECASE)
-                if m and m.group(1).strip() and items:
-                    return self._parse_indices(m.group(1), items, max_n)
-                return []
-
-            selected_tools = _strict_parse("TOOLS", self._all_tools, max_tools)
-            selected_data_lake = _strict_parse("DATA_LAKE", dl_list, 20)
-            selected_libraries = _strict_parse("LIBRARIES", lib_list, 30)
-            selected_know_how = _strict_parse("KNOW_HOW", self._know_how_docs, 5)
-
-            if selected_tools or selected_data_lake or selected_libraries or selected_know_how:
-                logger.info(
-                    f"LLM retrieval (strict): {len(selected_tools)} tools, "
-                    f"{len(selected_data_lake)} data_lake, "
-                    f"{len(selected_libraries)} libraries, "
-                    f"{len(selected_know_how)} know_how"
-                )
-                
-                result = RetrievalResult(
-                    tools=selected_tools,
-                    data_lake=selected_data_lake,
-                    libraries=selected_libraries,
-                    know_how=selected_know_how,
-                )
+            content = await self._invoke_llm(llm, prompt)
+            stats["llm_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            logger.info(
+                f"Retrieval LLM response in {stats['llm_ms']} ms "
+                f"(prompt {stats['prompt_chars']} chars, layout={layout}, {len(content)} chars): {content[:200]}"
+            )
+
+            result = self._parse_retrieval_response(content, catalog, max_tools)
+            if result is not None:
                 # Langfuse에 반환된 도구 개수 등 메타데이터 기록
                 langfuse_context.update_current_span(output={
-                    "tools_count": len(selected_tools),
-                    "data_lake_count": len(selected_data_lake)
+                    "tools_count": len(result["tools"]),
+                    "data_lake_count": len(result["data_lake"]),
+                    "stats": stats,
                 })
-                return result
-
-            # --- Strategy 2: Flexible extraction from free-form output ---
-            categories = ["TOOLS", "DATA_LAKE", "LIBRARIES", "KNOW_HOW"]
-            tool_idxs = self._extract_indices_flexible(
-                content, "TOOLS", ["DATA_LAKE", "LIBRARIES", "KNOW_HOW"], len(self._all_tools)
-            )
-            dl_idxs = self._extract_indices_flexible(
-                content, "DATA_LAKE", ["LIBRARIES", "KNOW_HOW", "TOOLS"], len(dl_list)
-            )
-            lib_idxs = self._extract_indices_flexible(
-                content, "LIBRARIES", ["KNOW_HOW", "TOOLS", "DATA_LAKE"], len(lib_list)
-            )
-            kh_idxs = self._extract_indices_flexible(
-                content, "KNOW_HOW", ["TOOLS", "DATA_LAKE", "LIBRARIES"], len(self._know_how_docs)
-            )
-
-            if tool_idxs or dl_idxs or lib_idxs or kh_idxs:
-                selected_tools = [self._all_tools[i] for i in tool_idxs[:max_tools]]
-                selected_data_lake = [dl_list[i] for i in dl_idxs[:20]] if dl_list else []
-                selected_libraries = [lib_list[i] for i in lib_idxs[:30]] if lib_list else []
-                selected_know_how = [self._know_how_docs[i] for i in kh_idxs[:5]] if self._know_how_docs else []
-                logger.info(
-                    f"LLM retrieval (flexible): {len(selected_tools)} tools, "
-                    f"{len(selected_data_lake)} data_lake, "
-                    f"{len(selected_libraries)} libraries, "
-                    f"{len(selected_know_how)} know_how"
-                )
-                return RetrievalResult(
-                    tools=selected_tools,
-                    data_lake=selected_data_lake,
-                    libraries=selected_libraries,
-                    know_how=selected_know_how,
-                )
-
-            # --- Strategy 3: JSON fallback ---
-            try:
-                parsed = json.loads(content)
-                if isinstance(parsed, dict) and "tools" in parsed:
-                    tool_names = {t.get("name") for t in parsed["tools"] if isinstance(t, dict)}
-                    selected = [t for t in self._all_tools if t.get("name") in tool_names]
-                    if selected:
-                        logger.info(f"LLM retrieval selected {len(selected)} tools by JSON")
-                        return RetrievalResult(
-                            tools=selected[:max_tools],
-                            data_lake=[],
-                            libraries=[],
-                            know_how=[],
-                        )
-            except (json.JSONDecodeError, TypeError):
-                pass
+                return RetrievalResultWithStats(**result, stats=stats)
 
             logger.warning(
                 f"LLM retrieval: could not parse response, falling back to keyword search. "
@@ -508,17 +757,141 @@ class BiomniToolLoader:
         except Exception as e:
             logger.warning(f"LLM retrieval failed: {e}")
 
-        fallback_tools = self.keyword_search(query, max_results=max_tools)
-        kw = self._extract_keywords(query)
-        fallback_dl = self._keyword_search_dict(kw, self._data_lake_dict, max_results=10)
-        fallback_libs = self._keyword_search_dict(kw, self._library_dict, max_results=10)
+        fallback = self.keyword_retrieval(query, max_tools=max_tools)
         logger.info(
-            f"Keyword fallback: {len(fallback_tools)} tools, "
-            f"{len(fallback_dl)} data_lake, {len(fallback_libs)} libraries"
+            f"Keyword fallback: {len(fallback['tools'])} tools, "
+            f"{len(fallback['data_lake'])} data_lake, {len(fallback['libraries'])} libraries, "
+            f"{len(fallback['know_how'])} know_how"
         )
-        return RetrievalResult(
-            tools=fallback_tools,
-            data_lake=fallback_dl,
-            libraries=fallback_libs,
-            know_how=[],
+        stats["fallback"] = True
+        return RetrievalResultWithStats(**fallback, stats=stats)
+
+    # ─── Hybrid retrieval (use_llm_retrieval: hybrid) ───
+
+    # Stage-1 candidates per category shown to the reranking LLM
+    _SHORTLIST_SIZES = {"tools": 30, "data_lake": 15, "libraries": 20, "know_how": 8}
+
+    def shortlist(
+        self, query: str,
+        data_lake_items: Optional[List[Dict[str, str]]] = None,
+        sizes: Optional[Dict[str, int]] = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Stage 1: BM25 top-K candidates per category (no LLM).
+
+        Scanned data-lake items outside the registry get a per-call index;
+        BM25 scores from different indexes are not on one scale, so each
+        index's hits are divided by its best score before the two are merged.
+        If no tool matches lexically, the first tools in catalog order (up
+        to the shortlist size) are kept so the LLM can still choose without
+        the prompt growing to the whole catalog.
+        """
+        sizes = {**self._SHORTLIST_SIZES, **(sizes or {})}
+        candidates: Dict[str, List[Dict[str, Any]]] = {}
+        for category in ("tools", "libraries", "know_how"):
+            items = self._catalog.get(category, [])
+            candidates[category] = [
+                items[i] for i, _ in self.search_index(category, query, sizes[category])
+            ]
+        if not candidates["tools"]:
+            candidates["tools"] = self._all_tools[:sizes["tools"]]
+
+        k = sizes["data_lake"]
+        registry = self._catalog.get("data_lake", [])
+        scored = [
+            (score, registry[i])
+            for i, score in max_normalized(self.search_index("data_lake", query, k))
+        ]
+        extras = self._data_lake_list(data_lake_items)[len(self._data_lake_dict):]
+        if extras:
+            extra_index = BM25Index.build(
+                (
+                    (str(item.get("name", "")), self._NAME_WEIGHT),
+                    (str(item.get("description", "")), self._DESC_WEIGHT),
+                )
+                for item in extras
+            )
+            scored += [
+                (score, extras[i])
+                for i, score in max_normalized(extra_index.search(self._extract_keywords(query), k))
+            ]
+            scored.sort(key=lambda x: x[0], reverse=True)
+        candidates["data_lake"] = [item for _, item in scored[:k]]
+        return candidates
+
+    @observe(as_type="span", name="tool_retrieval_hybrid")
+    async def hybrid_retrieval(
+        self, query: str, llm: Any, max_tools: int = 15,
+        plan_context: str = "",
+        data_lake_items: Optional[List[Dict[str, str]]] = None,
+        top_override: Optional[str] = None,
+        bottom_override: Optional[str] = None,
+        layout: str = "standard",
+    ) -> RetrievalResultWithStats:
+        """Two-stage retrieval: BM25 shortlist, then LLM rerank over the shortlist.
+
+        The LLM sees the same training-format prompt, listing only the
+        shortlisted items (renumbered from 0); its indices are mapped back to
+        the shortlist, so the result holds regular catalog items.  ``stats``
+        reports candidate counts, prompt size and per-stage latency.
+        """
+        langfuse_context.update_current_span(input={"query": query, "plan_context": plan_context})
+
+        t0 = time.perf_counter()
+        candidates = self.shortlist(query, data_lake_items)
+        shortlist_ms = (time.perf_counter() - t0) * 1000
+
+        prompt = self.build_retrieval_prompt(
+            query, plan_context, catalog=candidates,
+            top_override=top_override, bottom_override=bottom_override,
+            layout=layout,
+        )
+        # The full-catalog prompt differs only in the listed section, whose
+        # rendering is memoized per catalog version
+        full_prompt_chars = (
+            len(prompt) - len(self._render_catalog(candidates))
+            + len(self._full_catalog_text(data_lake_items))
+        )
+        stats = RetrievalStats(
+            shortlist_ms=round(shortlist_ms, 2),
+            shortlist_counts={k: len(v) for k, v in candidates.items()},
+            prompt_chars=len(prompt),
+            prompt_tokens_est=len(prompt.encode("utf-8")) // 3 + 1,
+            full_prompt_chars=full_prompt_chars,
+            rerank_ms=0.0,
+            layout=layout,
+            fallback=False,
+        )
+
+        result: Optional[RetrievalResult] = None
+        t1 = time.perf_counter()
+        try:
+            content = await self._invoke_llm(llm, prompt)
+            logger.info(f"Hybrid rerank response ({len(content)} chars): {content[:200]}")
+            result = self._parse_retrieval_response(content, candidates, max_tools)
+            if result is None:
+                logger.warning(f"Hybrid rerank: could not parse response:\n{content}")
+        except Exception as e:
+            logger.warning(f"Hybrid rerank failed: {e}")
+        stats["rerank_ms"] = round((time.perf_counter() - t1) * 1000, 2)
+
+        if result is None:
+            # Shortlist order is already the BM25 ranking
+            stats["fallback"] = True
+            result = RetrievalResult(
+                tools=candidates["tools"][:max_tools],
+                data_lake=candidates["data_lake"][:self._CATEGORY_LIMITS["data_lake"]],
+                libraries=candidates["libraries"][:self._CATEGORY_LIMITS["libraries"]],
+                know_how=candidates["know_how"][:self._CATEGORY_LIMITS["know_how"]],
+            )
+
+        logger.info(
+            f"Hybrid retrieval: shortlist {stats['shortlist_counts']} in {stats['shortlist_ms']} ms, "
+            f"rerank prompt {stats['prompt_chars']} chars (full catalog {full_prompt_chars}) "
+            f"in {stats['rerank_ms']} ms, fallback={stats['fallback']}"
         )
+        langfuse_context.update_current_span(output={
+            "tools_count": len(result["tools"]),
+            "data_lake_count": len(result["data_lake"]),
+            "stats": stats,
+        })
+        return RetrievalResultWithStats(**result, stats=stats)
@@ -5,7 +5,7 @@ import json
 import logging
 import os
 import re
-from typing import AsyncGenerator, Dict, Any, List, Optional, Tuple
+from typing import AsyncGenerator, AsyncIterator, Dict, Any, List, Optional, Tuple
 from uuid import UUID
 
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
@@ -16,12 +16,23 @@ from sqlalchemy import select
 
 from config import get_settings
 from db.models import Setting
-from models.schemas import ChatEvent, ChatRequest, StepQuestionRequest, RetryStepRequest
+from models.schemas import ChatEvent, ChatRequest, ExecuteCodeRequest, StepQuestionRequest, RetryStepRequest
 from services.conversation_service import ConversationService
-from services.biomni_tools import BiomniToolLoader, scan_data_lake
+from services.biomni_tools import BiomniToolLoader, RetrievalResult
+from services.data_lake_catalog import DataLakeCatalog
+from services.retrieval_cache import (
+    get_retrieval_cache,
+    load_persisted as load_persisted_retrieval,
+    make_key as retrieval_cache_key,
+    persist as persist_retrieval,
+)
 from biomni.agent.a1 import A1
 from services.llm_service import get_llm_service, _PROVIDER_TO_SOURCE
 from services.prompt_builder import PromptMode, build_prompt, _closing_tag
+from services.scheduler import SlotCallback, Ticket, get_scheduler
+from services.state_backend import get_state_backend
+from tools.code_executor import CodeExecutor, ExecutionChunk
+from tools.segment_tokenizer import SegmentEvent, SegmentTokenizer, tokenize_response
 from biomni.memory.graph_memory import GraphMemory
 
 logger = logging.getLogger("biomni_backend.chat_handler")
@@ -30,6 +41,85 @@ def _ev(event_type: str, data: Dict[str, Any]) -> ChatEvent:
     return ChatEvent(type=event_type, data=data)
 
 
+def _agent_slots(conv_id: str) -> SlotCallback:
+    """Scheduler slots for an A1 run: the model per LLM call, ``code`` per execute node."""
+    model = get_llm_service().get_current_model().name
+    return SlotCallback(conv_id, f"llm:{model}", chains={"execute": "code"}, wait=_queue_events)
+
+
+async def _with_side_events(stream: AsyncIterator[Any], side: asyncio.Queue) -> AsyncIterator[Any]:
+    """Items of ``stream``, interleaved with whatever is put on ``side`` meanwhile."""
+    it = stream.__aiter__()
+    nxt = asyncio.ensure_future(it.__anext__())
+    getter = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(side.get())
+            done, _ = await asyncio.wait({nxt, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+            else:
+                getter.cancel()
+            if nxt in done:
+                try:
+                    item = nxt.result()
+                except StopAsyncIteration:
+                    break
+                yield item
+                nxt = asyncio.ensure_future(it.__anext__())
+        while not side.empty():
+            yield side.get_nowait()
+    finally:
+        nxt.cancel()
+        if getter is not None:
+            getter.cancel()
+
+
+async def _queue_events(ticket: Ticket) -> AsyncGenerator[ChatEvent, None]:
+    """``queue_position`` events while ``ticket`` waits for a slot.
+
+    Nothing is emitted when a slot is free; otherwise positions count down
+    and a final position 0 event carries the time spent waiting.
+    """
+    waited = False
+    async for position in ticket.wait():
+        waited = True
+        yield _ev("queue_position", {"queue_position": {
+            "resource": ticket.queue.name, "position": position,
+        }})
+    if waited:
+        yield _ev("queue_position", {"queue_position": {
+            "resource": ticket.queue.name, "position": 0, "waited_ms": round(ticket.waited_ms),
+        }})
+
+
+def _segment_events(step_num: int, attempt: int, events: List[SegmentEvent]) -> List[ChatEvent]:
+    """Tokenizer events → ``step_segment`` ChatEvents (consecutive deltas merged).
+
+    ``attempt`` changes when a step is retried; clients discard segments of the
+    previous attempt.  ``index`` is the segment's position in the final
+    ``segments`` list, which the streamed ones add up to exactly.
+    """
+    merged: List[SegmentEvent] = []
+    for ev in events:
+        last = merged[-1] if merged else None
+        if ev.kind == "delta" and last is not None and last.kind == "delta" and last.index == ev.index:
+            merged[-1] = SegmentEvent("delta", ev.type, last.content + ev.content, ev.index)
+        else:
+            merged.append(ev)
+    return [
+        _ev("step_segment", {"step_segment": {
+            "step": step_num,
+            "attempt": attempt,
+            "event": ev.kind,
+            "type": ev.type,
+            "index": ev.index,
+            "content": ev.content,
+        }})
+        for ev in merged
+    ]
+
+
 # ─── Biomni Import Fixer ───
 
 def _fix_biomni_imports(code: str, mapping: Dict[str, str]) -> Tuple[str, List[str]]:
@@ -85,22 +175,6 @@ def _fix_biomni_imports(code: str, mapping: Dict[str, str]) -> Tuple[str, List[s
 
 # ─── Step Execute Helpers ───
 
-def _extract_last_execute_block(text: str, behavior: Dict[str, Any]) -> str:
-    """Extract the last <execute>...</execute> block from accumulated text."""
-    exec_fmt = behavior.get("code_execute_format", "<execute>")
-    close_tag = _closing_tag(exec_fmt)
-    pattern = re.escape(exec_fmt) + r'([\s\S]*?)' + re.escape(close_tag)
-    matches = re.findall(pattern, text)
-    if matches:
-        return matches[-1].strip()
-    # Fallback patterns
-    for alt_pat in [r'<execute>([\s\S]*?)</execute>', r'\[EXECUTE\]([\s\S]*?)\[/EXECUTE\]']:
-        matches = re.findall(alt_pat, text, re.IGNORECASE)
-        if matches:
-            return matches[-1].strip()
-    return ""
-
-
 def _extract_observation(text: str) -> str:
     """Extract observation content from execute output text."""
     m = re.search(r'<observation>([\s\S]*?)</observation>', text, re.IGNORECASE)
@@ -144,109 +218,21 @@ def _parse_checked_steps(full_response: str, steps: list) -> set:
     return checked
 
 
-def _parse_segments(full_response: str, behavior: Dict[str, Any]) -> List[Dict[str, str]]:
-    """Parse full_response into ordered typed segments for interleaved rendering.
-
-    Tries behavior-specified format + XML fallback + bracket fallback for each tag type
-    to handle models that output different formats than configured.
-
-    Returns list of {"type": "thinking"|"text"|"code"|"output"|"solution", "content": "..."}.
-    """
-    # For each tag type, try behavior format + XML + bracket fallbacks
-    tag_types: Dict[str, List[str]] = {
-        "thinking": [behavior.get("think_format") or "<think>", "<think>", "[THINK]"],
-        "code": [behavior.get("code_execute_format") or "<execute>", "<execute>", "[EXECUTE]"],
-        "output": [behavior.get("code_result_format") or "<observation>", "<observation>", "[OBSERVATION]"],
-        "solution": [behavior.get("solution_format") or "<solution>", "<solution>", "[SOLUTION]"],
-    }
-
-    # Phase 1: Find ALL tag matches without overlap filtering
-    all_blocks: List[Tuple[int, int, str, str]] = []  # (start, end, type, inner)
-    for seg_type, open_tags in tag_types.items():
-        seen: set = set()
-        for open_tag in open_tags:
-            if open_tag in seen:
-                continue
-            seen.add(open_tag)
-            close_tag = _closing_tag(open_tag)
-            flags = re.IGNORECASE if open_tag.startswith("<") else 0
-            pattern = re.escape(open_tag) + r'([\s\S]*?)' + re.escape(close_tag)
-            for m in re.finditer(pattern, full_response, flags):
-                # Prevent exact-overlap with already-matched blocks (same-level duplicates)
-                overlaps = any(
-                    b[0] <= m.start() < b[1] or b[0] < m.end() <= b[1]
-                    for b in all_blocks
-                    if b[2] == seg_type  # only check same-type overlap
-                )
-                if not overlaps:
-                    all_blocks.append((m.start(), m.end(), seg_type, m.group(1).strip()))
-
-    # Phase 1b: Detect markdown fenced code blocks (```lang\n...\n```)
-    md_code_pat = re.compile(r'```(\w*)\n([\s\S]*?)```')
-    for m in md_code_pat.finditer(full_response):
-        overlaps = any(
-            b[0] <= m.start() < b[1] or b[0] < m.end() <= b[1]
-            for b in all_blocks
-        )
-        if not overlaps and m.group(2).strip():
-            all_blocks.append((m.start(), m.end(), "code", m.group(2).strip()))
-
-    # Phase 2: Remove child blocks that are fully contained within thinking blocks.
-    # This keeps <execute>/<observation> inside [THINK] as part of think content,
-    # so SpecialTokenBlock.processThinkContent() can render them as code/blockquote.
-    thinking_ranges = [(b[0], b[1]) for b in all_blocks if b[2] == "thinking"]
-    blocks: List[Tuple[int, int, str, str]] = [
-        b for b in all_blocks
-        if b[2] == "thinking" or not any(
-            t[0] <= b[0] and b[1] <= t[1]
-            for t in thinking_ranges
-        )
-    ]
-
-    blocks.sort(key=lambda x: x[0])
-
-    segments: List[Dict[str, str]] = []
-    pos = 0
-    for start, end, seg_type, inner in blocks:
-        # Text between blocks = reasoning
-        gap = full_response[pos:start].strip()
-        if gap:
-            segments.append({"type": "text", "content": gap})
-        if inner:
-            segments.append({"type": seg_type, "content": inner})
-        pos = end
-
-    # Trailing text
-    tail = full_response[pos:].strip()
-    if tail:
-        segments.append({"type": "text", "content": tail})
-
-    return segments
-
-
 def _build_step_result_from_response(
     full_response: str, step_result: Optional[Dict[str, Any]],
     behavior: Dict[str, Any], step: Dict[str, Any], has_error: bool,
+    code_blocks: Optional[List[str]] = None,
 ) -> Tuple[Dict[str, Any], str, List[str]]:
     """Extract code blocks, execution, reasoning from full_response.
 
+    code_blocks: execute blocks already collected by the step's SegmentTokenizer;
+    when omitted, full_response is tokenized here.
+
     Returns (final_result, tool_name, code_blocks).
     Shared between normal step completion and error recovery.
     """
-    exec_fmt = behavior.get("code_execute_format", "<execute>")
-    exec_close = _closing_tag(exec_fmt)
-    code_pattern = re.escape(exec_fmt) + r'([\s\S]*?)' + re.escape(exec_close)
-    code_blocks = re.findall(code_pattern, full_response)
-
-    if not code_blocks:
-        # Negative lookahead prevents matching across nested/unclosed execute tags
-        for alt_pat, alt_flags in [
-            (r'<execute>((?:(?!<execute>)[\s\S])*?)</execute>', re.IGNORECASE),
-            (r'\[EXECUTE\]((?:(?!\[EXECUTE\])[\s\S])*?)\[/EXECUTE\]', 0),
-        ]:
-            code_blocks = re.findall(alt_pat, full_response, alt_flags)
-            if code_blocks:
-                break
+    if code_blocks is None:
+        code_blocks = tokenize_response(full_response, behavior).code_blocks
 
     final_result: Dict[str, Any] = {}
     tool_name = "text"
@@ -637,6 +623,11 @@ class ChatHandler:
         self._stop_flags: Dict[str, bool] = {}
         self._plan_states: Dict[str, dict] = {}
         self._import_mapping: Dict[str, str] = {}  # func_name → correct module
+        self._code_executor: Optional[CodeExecutor] = None
+        # Other workers (services/state_backend.py): stop signals, plan state snapshots
+        self._state = get_state_backend()
+        self._state.on("stop", self._on_stop_shared)
+        self._state.on("plan", self._on_plan_shared)
 
     def _ensure_import_fixer(self) -> None:
         """Build import mapping from tool registry (once)."""
@@ -745,6 +736,16 @@ class ChatHandler:
         return self._active_agents[session_id]
 
     def stop(self, conv_id: str) -> bool:
+        """Stop generation for ``conv_id``, also in the other workers."""
+        self._stop_local(conv_id)
+        if self._state.shared:
+            try:
+                asyncio.get_event_loop().create_task(self._state.publish("stop", {"conv_id": conv_id}))
+            except RuntimeError:
+                pass
+        return True
+
+    def _stop_local(self, conv_id: str) -> None:
         self._stop_flags[conv_id] = True
         # Schedule LLM abort in the event loop
         try:
@@ -753,7 +754,43 @@ class ChatHandler:
                 loop.create_task(self._abort_llm_request(conv_id))
         except RuntimeError:
             pass
-        return True
+
+    def _on_stop_shared(self, message: dict) -> None:
+        conv_id = message.get("conv_id", "")
+        # Only where the conversation is generating (handle_chat set its flag)
+        if conv_id in self._stop_flags:
+            self._stop_local(conv_id)
+
+    # ─── Plan state shared between workers ───
+
+    async def _share_plan_state(self, conv_id: str) -> None:
+        """Snapshot ``conv_id``'s plan state for the other workers."""
+        if not self._state.shared or conv_id not in self._plan_states:
+            return
+        try:
+            await self._state.put(f"plan:{conv_id}", self._plan_states[conv_id])
+            await self._state.publish("plan", {"conv_id": conv_id})
+        except Exception as e:
+            logger.warning(f"Plan state of {conv_id} not shared: {e}")
+
+    async def _load_plan_state(self, conv_id: str) -> None:
+        """Take the plan state of ``conv_id`` from another worker's snapshot, if there is one."""
+        if not self._state.shared or conv_id in self._plan_states:
+            return
+        try:
+            plan_state = await self._state.get(f"plan:{conv_id}")
+        except Exception as e:
+            logger.warning(f"Plan state of {conv_id} not loaded: {e}")
+            return
+        if plan_state is not None and conv_id not in self._plan_states:
+            self._plan_states[conv_id] = plan_state
+
+    def _on_plan_shared(self, message: dict) -> None:
+        # Another worker changed the plan: drop the copy here (unless generating
+        # with it); the next turn loads the new snapshot
+        conv_id = message.get("conv_id", "")
+        if conv_id not in self._stop_flags:
+            self._plan_states.pop(conv_id, None)
 
     async def _abort_llm_request(self, conv_id: str) -> None:
         """Close HTTP client to abort in-flight LLM request, then discard agent."""
@@ -844,7 +881,10 @@ class ChatHandler:
             finish_reason = None
             chunk_count = 0
             plan_data = None
+            llm_ticket = get_scheduler().enqueue(f"llm:{model_info.name}", conv_id)
             try:
+                async for queue_ev in _queue_events(llm_ticket):
+                    yield queue_ev
                 async for chunk in plan_llm.astream(plan_messages, config={"callbacks": [lf_handler]}):
                     chunk_count += 1
                     if self._stop_flags.get(conv_id):
@@ -865,6 +905,8 @@ class ChatHandler:
                     yield _ev("plan_retry", {"attempt": attempt + 2, "max_attempts": MAX_RETRIES + 1})
                     continue
                 raise
+            finally:
+                llm_ticket.release()
 
             logger.info(
                 f"Plan attempt {attempt + 1} done: {len(full_response)} chars, "
@@ -927,17 +969,23 @@ class ChatHandler:
             "all_results": [],
             "_plan_raw_response": full_response,
         }
+        await self._share_plan_state(conv_id)
 
     # ─── Phase B: Step Execution Loop ───
 
     async def _run_step_loop(
         self, conv_id: str, history: List,
-        behavior: dict, db
+        behavior: dict, db, stream_segments: bool = False,
     ) -> AsyncGenerator[ChatEvent, None]:
         """Plan step execution loop — delegates each step to A1 agent orchestration.
 
         Flow: tool retrieval (once) → for each step: set A1 system_prompt → astream_events.
         A1's StateGraph handles generate→execute→observe loop internally.
+
+        stream_segments: emit ``step_segment`` open/delta/close/reset events while
+        the step runs; the final ``tool_result`` then omits the segments and
+        thinking fields, which the client rebuilds from them (both are still
+        persisted).
         """
         plan_state = self._plan_states.get(conv_id)
         if not plan_state:
@@ -957,33 +1005,32 @@ class ChatHandler:
         )
 
         biomni_loader = BiomniToolLoader.get_instance()
-        data_lake_items = scan_data_lake(data_lake_path)
+        data_lake_items = await DataLakeCatalog.get_instance().scan(data_lake_path)
         retrieved_tool_names: List[str] = []
         retrieved_data_lake_names: List[str] = []
         retrieved_library_names: List[str] = []
         selected_data_lake: List[Dict[str, Any]] = []
         selected_libraries: List[Dict[str, Any]] = []
+        selected_know_how: List[Dict[str, Any]] = []
+        retrieved_know_how_names: List[str] = []
+        retrieval_stats: Optional[Dict[str, Any]] = None
 
         if biomni_loader.is_initialized():
             retrieval_query = plan_state["goal"] + "\n" + "\n".join(
                 s.get("description", s.get("name", "")) for s in steps
             )
             use_llm_ret = behavior.get("use_llm_retrieval", True)
-            logger.info(f"Tool retrieval mode: use_llm={use_llm_ret}")
-            if use_llm_ret:
-                # Cap max_tokens for retrieval — only needs short index list output
-                llm = await llm_service.get_llm_instance(db=db, max_tokens=8192)
-                logger.info("Calling retrieval_with_llm ...")
+            prompt_layout = behavior.get("retrieval_prompt_layout") or "standard"
+            logger.info(f"Tool retrieval mode: use_llm={use_llm_ret}, layout={prompt_layout}")
+            model_name = llm_service.get_current_model().name
+            top_override = None
+            bottom_override = None
+            if use_llm_ret and use_llm_ret != "embedding":
                 # Load custom retrieval prompt overrides from DB
-                top_override = None
-                bottom_override = None
                 try:
-                    from sqlalchemy import select as sa_select
-                    from models.setting import Setting
-                    result = await db.execute(sa_select(Setting).where(Setting.key == "system_prompt_modes"))
+                    result = await db.execute(select(Setting).where(Setting.key == "system_prompt_modes"))
                     row = result.scalar_one_or_none()
                     if row and row.value:
-                        model_name = llm_service.get_current_model().name
                         custom_raw = row.value.get(model_name, {}).get("tool_retrieval", "")
                         if custom_raw and "===AUTO_TOOLS===" in custom_raw:
                             parts = custom_raw.split("===AUTO_TOOLS===", 1)
@@ -991,21 +1038,79 @@ class ChatHandler:
                             bottom_override = parts[1].strip("\n") or None if len(parts) > 1 else None
                 except Exception as e:
                     logger.debug(f"Could not load custom retrieval prompt: {e}")
-                retrieval_result = await biomni_loader.retrieval_with_llm(
-                    retrieval_query, llm, max_tools=15,
-                    data_lake_items=data_lake_items,
-                    top_override=top_override,
-                    bottom_override=bottom_override,
-                )
-                logger.info(f"retrieval_with_llm returned: {len(retrieval_result.get('tools', []))} tools")
-            else:
-                kw_tools = biomni_loader.keyword_search(retrieval_query, max_results=15)
-                retrieval_result = {"tools": kw_tools, "data_lake": [], "libraries": [], "know_how": []}
+
+            # ── Retrieval cache (query + model + mode + overrides + catalog version) ──
+            retrieval_cache = get_retrieval_cache()
+            cache_key = retrieval_cache_key(
+                retrieval_query, model_name, f"{use_llm_ret}:{prompt_layout}",
+                biomni_loader.catalog_hash(data_lake_items),
+                top_override=top_override, bottom_override=bottom_override,
+            )
+            # Keyword retrieval is a local scan — cheaper to rerun than to cache
+            cacheable = bool(use_llm_ret)
+            retrieval_result = retrieval_cache.get(cache_key) if cacheable else None
+            if retrieval_result is None and cacheable and app_settings.RETRIEVAL_CACHE_PERSIST:
+                names = await load_persisted_retrieval(cache_key)
+                if names is not None:
+                    retrieval_result = biomni_loader.resolve_names(names, data_lake_items)
+                    retrieval_cache.put(cache_key, retrieval_result)
+            cache_hit = retrieval_result is not None
+            # Embedding / LLM retrieval compete for "retrieval" slots across conversations
+            retrieval_ticket = (
+                get_scheduler().enqueue("retrieval", conv_id)
+                if not cache_hit and use_llm_ret else None
+            )
+            try:
+                if retrieval_ticket is not None:
+                    async for queue_ev in _queue_events(retrieval_ticket):
+                        yield queue_ev
+                if cache_hit:
+                    logger.info(f"Retrieval cache hit ({retrieval_cache.stats()['hit_rate']:.0%} hit rate)")
+                elif use_llm_ret == "embedding":
+                    # Local vector similarity — no LLM round trip before the first step
+                    retrieval_result = await asyncio.to_thread(
+                        biomni_loader.embedding_retrieval, retrieval_query,
+                        max_tools=15, data_lake_items=data_lake_items,
+                    )
+                elif use_llm_ret:
+                    # Cap max_tokens for retrieval — only needs short index list output
+                    llm = await llm_service.get_llm_instance(db=db, max_tokens=8192)
+                    logger.info(f"Calling {'hybrid_retrieval' if use_llm_ret == 'hybrid' else 'retrieval_with_llm'} ...")
+                    # hybrid: BM25 shortlist first, LLM only reranks the shortlist
+                    retrieve = (
+                        biomni_loader.hybrid_retrieval if use_llm_ret == "hybrid"
+                        else biomni_loader.retrieval_with_llm
+                    )
+                    retrieval_result = await retrieve(
+                        retrieval_query, llm, max_tools=15,
+                        data_lake_items=data_lake_items,
+                        top_override=top_override,
+                        bottom_override=bottom_override,
+                        layout=prompt_layout,
+                    )
+                    logger.info(f"retrieval_with_llm returned: {len(retrieval_result.get('tools', []))} tools")
+                else:
+                    retrieval_result = biomni_loader.keyword_retrieval(retrieval_query, max_tools=15)
+            finally:
+                if retrieval_ticket is not None:
+                    retrieval_ticket.release()
+
+            # Keyword fallbacks after a failed LLM call are not cached
+            if cacheable and not cache_hit and not (retrieval_result.get("stats") or {}).get("fallback"):
+                retrieval_cache.put(cache_key, RetrievalResult(
+                    tools=retrieval_result["tools"],
+                    data_lake=retrieval_result["data_lake"],
+                    libraries=retrieval_result["libraries"],
+                    know_how=retrieval_result.get("know_how", []),
+                ))
+                if app_settings.RETRIEVAL_CACHE_PERSIST:
+                    await persist_retrieval(cache_key, retrieval_result)
 
             selected_tools = retrieval_result["tools"]
             selected_data_lake = retrieval_result["data_lake"]
             selected_libraries = retrieval_result["libraries"]
             selected_know_how = retrieval_result.get("know_how", [])
+            retrieval_stats = retrieval_result.get("stats")
             tool_desc = biomni_loader.format_tool_desc(selected_tools)
             retrieved_tool_names = [t.get("name", "?") for t in selected_tools]
             retrieved_data_lake_names = [d.get("name", "?") for d in selected_data_lake]
@@ -1026,12 +1131,15 @@ class ChatHandler:
         plan_state["_retrieved_library_names"] = retrieved_library_names
         plan_state["_retrieved_know_how_names"] = retrieved_know_how_names
 
-        yield _ev("tool_retrieval_done", {"tool_retrieval_done": {
+        retrieval_done = {
             "tools": retrieved_tool_names,
             "data_lake": retrieved_data_lake_names,
             "libraries": retrieved_library_names,
             "know_how": retrieved_know_how_names,
-        }})
+        }
+        if retrieval_stats:
+            retrieval_done["stats"] = retrieval_stats
+        yield _ev("tool_retrieval_done", {"tool_retrieval_done": retrieval_done})
 
         # ── Get A1 agent ──
         agent = await self._get_agent(conv_id, db)
@@ -1067,17 +1175,6 @@ class ChatHandler:
             _eb["include_stop_str_in_output"] = True
             agent.llm.model_kwargs = {**(agent.llm.model_kwargs or {}), "extra_body": _eb}
 
-        # ── Extract token format variables for later use ──
-        def _close_tag(tag: str) -> str:
-            if tag.startswith("["):
-                return tag.replace("[", "[/", 1)
-            return tag.replace("<", "</", 1)
-
-        exec_fmt = behavior.get("code_execute_format") or "<execute>"
-        exec_close = _close_tag(exec_fmt)
-        think_fmt = behavior.get("think_format") or "<think>"
-        think_close = _close_tag(think_fmt)
-
         # ── Build available tools text ──
         available_tools_text = self._wrap_available_tools(tool_desc, behavior)
 
@@ -1194,12 +1291,23 @@ class ChatHandler:
             _retry_succeeded = False
             for _attempt in range(_MAX_RETRIES):
                 full_response = ""
+                # Segments/think/code/solution are tokenized as text arrives,
+                # so step completion needs no re-scan of full_response.
+                tokenizer = SegmentTokenizer(behavior)
                 step_result = None
                 has_error = False
                 exec_count = 0
+                # LLM / code slots are held per model call and execute node, not per step
+                slots = _agent_slots(conv_id)
+                attempt_config = {**config, "callbacks": [*config["callbacks"], slots]}
 
                 try:
-                    async for event in agent.app.astream_events(inputs, version="v2", config=config):
+                    async for event in _with_side_events(
+                        agent.app.astream_events(inputs, version="v2", config=attempt_config), slots.events
+                    ):
+                        if isinstance(event, ChatEvent):
+                            yield event  # queue_position
+                            continue
                         if self._stop_flags.get(conv_id):
                             await self._save_plan_complete(conv_id, conv_svc, stopped=True)
                             yield _ev("done", {"done": True, "stopped": True})
@@ -1219,6 +1327,10 @@ class ChatHandler:
                                 )
                             if chunk_text:
                                 full_response += chunk_text
+                                seg_events = tokenizer.feed(chunk_text)
+                                if stream_segments:
+                                    for seg_ev in _segment_events(step_idx + 1, _attempt + 1, seg_events):
+                                        yield seg_ev
 
                         # Execute node started
                         elif kind == "on_chain_start" and event.get("name") == "execute":
@@ -1234,15 +1346,19 @@ class ChatHandler:
                         elif kind == "on_chain_end" and event.get("name") == "execute":
                             output = event["data"].get("output", {})
                             last_msg = ""
+                            seg_events: List[SegmentEvent] = []
                             if output and "messages" in output:
                                 msgs = output["messages"]
                                 # A1 uses .invoke() — no on_chat_model_stream events.
                                 # msgs[-2] = AIMessage (code with <execute>...</execute>)
                                 # msgs[-1] = HumanMessage (<observation>result</observation>)
                                 if len(msgs) >= 2 and hasattr(msgs[-2], 'content'):
-                                    full_response += f"\n{msgs[-2].content}\n"
+                                    code_msg = f"\n{msgs[-2].content}\n"
+                                    full_response += code_msg
+                                    seg_events += tokenizer.feed(code_msg)
                                 last_msg = msgs[-1].content if msgs else ""
                                 full_response += f"\n{last_msg}\n"
+                                seg_events += tokenizer.feed(f"\n{last_msg}\n")
                                 step_result = {
                                     "stdout": last_msg,
                                     "tool": step.get("tool", "code_execution"),
@@ -1254,7 +1370,7 @@ class ChatHandler:
                                 has_error = True
 
                             # ── Emit intermediate execution result ──
-                            exec_code = _extract_last_execute_block(full_response, behavior)
+                            exec_code = tokenizer.code_blocks[-1].strip() if tokenizer.code_blocks else ""
                             if exec_code and self._import_mapping:
                                 exec_code, _ = _fix_biomni_imports(exec_code, self._import_mapping)
                             obs_text = _extract_observation(last_msg)
@@ -1266,6 +1382,9 @@ class ChatHandler:
                                 "iteration": exec_count,
                             }})
                             exec_count += 1
+                            if stream_segments:
+                                for seg_ev in _segment_events(step_idx + 1, _attempt + 1, seg_events):
+                                    yield seg_ev
 
                     _retry_succeeded = True
                     break  # Normal completion — exit retry loop
@@ -1299,9 +1418,14 @@ class ChatHandler:
 
                 except Exception as step_err:
                     logger.error(f"Step {step_idx+1} A1 execution failed: {step_err}")
+                    tail_events: List[SegmentEvent] = []
                     partial_result, partial_tool, _ = _build_step_result_from_response(
                         full_response, step_result, behavior, step, has_error,
+                        code_blocks=tokenizer.finish(tail_events).code_blocks,
                     )
+                    if stream_segments:
+                        for seg_ev in _segment_events(step_idx + 1, _attempt + 1, tail_events):
+                            yield seg_ev
                     _err_data = {"error": f"A1 error: {step_err}", **partial_result}
                     yield _ev("tool_result", {"tool_result": {
                         "success": False, "result": _err_data,
@@ -1315,12 +1439,21 @@ class ChatHandler:
                     history.append(AIMessage(content=f"Step {step_idx+1} failed: {step_err}"))
                     break
 
+                finally:
+                    slots.close()
+
             if not _retry_succeeded:
                 continue
 
             # ── Build final step result (code + execution) ──
+            tail_events: List[SegmentEvent] = []
+            parsed = tokenizer.finish(tail_events)
+            if stream_segments:
+                for seg_ev in _segment_events(step_idx + 1, _attempt + 1, tail_events):
+                    yield seg_ev
             final_result, tool_name, code_blocks = _build_step_result_from_response(
                 full_response, step_result, behavior, step, has_error,
+                code_blocks=parsed.code_blocks,
             )
             # Fix wrong biomni import paths in code
             if code_blocks and final_result.get("code"):
@@ -1333,78 +1466,20 @@ class ChatHandler:
                 final_result["code"] = combined_code
                 logger.info(f"Step {step_idx+1}: code_blocks={len(code_blocks)}, has_code=True, tool={tool_name}")
 
-            # ── Parse ordered segments for interleaved rendering ──
-            segments = _parse_segments(full_response, behavior)
-
-            if segments:
-                final_result["segments"] = segments
-
-            # ── Extract think blocks and reasoning text (flat fields for compat) ──
-            think_pattern = re.escape(think_fmt) + r'([\s\S]*?)' + re.escape(think_close)
-            think_matches = re.findall(think_pattern, full_response)
-            # Fallback: try XML and bracket formats if behavior format didn't match
-            if not think_matches:
-                think_matches = re.findall(r'<think>([\s\S]*?)</think>', full_response, re.IGNORECASE)
-            if not think_matches:
-                think_matches = re.findall(r'\[THINK\]([\s\S]*?)\[/THINK\]', full_response)
-            if think_matches:
-                final_result["thinking"] = "\n".join(b.strip() for b in think_matches)
+            # ── Ordered segments for interleaved rendering ──
+            if parsed.segments:
+                final_result["segments"] = parsed.segments
 
+            # ── Think blocks and reasoning text (flat fields for compat) ──
             # Reasoning = full_response minus think/execute/observation/solution blocks
-            obs_fmt = behavior.get("code_result_format") or "<observation>"
-            obs_close = _closing_tag(obs_fmt)
-            reasoning = re.sub(think_pattern, '', full_response)
-            # Fallback think strip
-            reasoning = re.sub(r'<think>[\s\S]*?</think>', '', reasoning, flags=re.IGNORECASE)
-            reasoning = re.sub(r'\[THINK\][\s\S]*?\[/THINK\]', '', reasoning)
-            # Dynamic execute strip
-            reasoning = re.sub(
-                re.escape(exec_fmt) + r'[\s\S]*?' + re.escape(exec_close), '', reasoning
-            )
-            # Fallback execute strip (negative lookahead to avoid cross-block matching)
-            reasoning = re.sub(r'<execute>(?:(?!<execute>)[\s\S])*?</execute>', '', reasoning, flags=re.IGNORECASE)
-            reasoning = re.sub(r'\[EXECUTE\](?:(?!\[EXECUTE\])[\s\S])*?\[/EXECUTE\]', '', reasoning)
-            # Dynamic observation strip
-            reasoning = re.sub(
-                re.escape(obs_fmt) + r'[\s\S]*?' + re.escape(obs_close), '', reasoning
-            )
-            # Fallback observation patterns
-            reasoning = re.sub(r'<observation>[\s\S]*?</observation>', '', reasoning, flags=re.IGNORECASE)
-            reasoning = re.sub(r'\[OBSERVATION\][\s\S]*?\[/OBSERVATION\]', '', reasoning)
-            reasoning = re.sub(r'<solution>[\s\S]*?</solution>', '', reasoning, flags=re.IGNORECASE)
-            reasoning = re.sub(r'\[SOLUTION\][\s\S]*?\[/SOLUTION\]', '', reasoning)
-            # Incomplete/unclosed blocks
-            reasoning = re.sub(r'<solution>[\s\S]*$', '', reasoning, flags=re.IGNORECASE)
-            reasoning = re.sub(r'\[SOLUTION\][\s\S]*$', '', reasoning)
-            reasoning = re.sub(r'<think>[\s\S]*$', '', reasoning, flags=re.IGNORECASE)
-            reasoning = re.sub(r'\[THINK\][\s\S]*$', '', reasoning)
-            reasoning = re.sub(r'<execute>[\s\S]*$', '', reasoning, flags=re.IGNORECASE)
-            reasoning = re.sub(r'\[EXECUTE\][\s\S]*$', '', reasoning)
-            reasoning = reasoning.strip()
-            if reasoning:
-                final_result["reasoning"] = reasoning
-
-            # ── Extract solution block ──
-            sol_fmt = behavior.get("solution_format") or "<solution>"
-            sol_match = None
-            if sol_fmt:
-                sol_close = _closing_tag(sol_fmt)
-                sol_match = re.search(
-                    re.escape(sol_fmt) + r'([\s\S]*?)' + re.escape(sol_close), full_response
-                )
-                if not sol_match:
-                    # Incomplete: opening tag but no closing
-                    sol_match = re.search(re.escape(sol_fmt) + r'([\s\S]+)$', full_response)
-            else:
-                # Fallback: try both formats (complete + incomplete)
-                sol_match = (
-                    re.search(r'<solution>([\s\S]*?)</solution>', full_response, re.IGNORECASE)
-                    or re.search(r'\[SOLUTION\]([\s\S]*?)\[/SOLUTION\]', full_response)
-                    or re.search(r'<solution>([\s\S]+)$', full_response, re.IGNORECASE)
-                    or re.search(r'\[SOLUTION\]([\s\S]+)$', full_response)
-                )
-            if sol_match:
-                final_result["solution"] = sol_match.group(1).strip()
+            if parsed.thinking:
+                final_result["thinking"] = parsed.thinking
+            if parsed.reasoning:
+                final_result["reasoning"] = parsed.reasoning
+
+            # ── Solution block (closed, or unclosed tail) ──
+            if parsed.solution:
+                final_result["solution"] = parsed.solution
 
             # ── Determine step success ──
             # Success = solution exists OR LLM marked step with [✓]
@@ -1416,9 +1491,17 @@ class ChatHandler:
 
             # ── Emit final tool_result for step completion ──
             # Always emit — contains code, reasoning, thinking, solution fields
+            # (transcript fields are skipped when they were already streamed)
+            emitted_result = final_result
+            if stream_segments:
+                emitted_result = {
+                    k: v for k, v in final_result.items()
+                    if k not in ("segments", "thinking")
+                }
+                emitted_result["segments_streamed"] = True
             yield _ev("tool_result", {"tool_result": {
                 "success": step_success,
-                "result": final_result,
+                "result": emitted_result,
                 "tool": tool_name,
                 "step": step_idx + 1,
             }})
@@ -1814,6 +1897,7 @@ class ChatHandler:
         await conv_svc.replace_last_plan_message(
             UUID(conv_id), f"[PLAN_COMPLETE]{plan_json}"
         )
+        await self._share_plan_state(conv_id)
         return plan_complete_data
 
     async def _run_plan_analysis(self, plan_state: dict, db) -> str:
@@ -1881,6 +1965,9 @@ class ChatHandler:
         )
 
         self._stop_flags[conv_id] = False
+        slots: Optional[SlotCallback] = None
+        # The plan may have run in another worker
+        await self._load_plan_state(conv_id)
 
         try:
             # 1. DB에 유저 메시지 저장
@@ -1919,7 +2006,10 @@ class ChatHandler:
 
                 # Phase B: step 순차 실행
                 try:
-                    async for event in self._run_step_loop(conv_id, lc_history, behavior, db):
+                    async for event in self._run_step_loop(
+                        conv_id, lc_history, behavior, db,
+                        stream_segments=request.stream_segments,
+                    ):
                         yield event
                 except Exception as loop_err:
                     logger.exception("Step loop error")
@@ -1940,8 +2030,12 @@ class ChatHandler:
                     "current_step": 0,
                     "all_results": [],
                 }
+                await self._share_plan_state(conv_id)
                 try:
-                    async for event in self._run_step_loop(conv_id, lc_history, behavior, db):
+                    async for event in self._run_step_loop(
+                        conv_id, lc_history, behavior, db,
+                        stream_segments=request.stream_segments,
+                    ):
                         yield event
                 except Exception as loop_err:
                     logger.exception("Rerun step loop error")
@@ -1960,7 +2054,14 @@ class ChatHandler:
             config = {"recursion_limit": 500, "configurable": {"thread_id": conv_id}}
 
             # 4. LangChain v2 astream_events를 이용한 심층 스트리밍
-            async for event in agent.app.astream_events(inputs, version="v2", config=config):
+            slots = _agent_slots(conv_id)
+            config["callbacks"] = [slots]
+            async for event in _with_side_events(
+                agent.app.astream_events(inputs, version="v2", config=config), slots.events
+            ):
+                if isinstance(event, ChatEvent):
+                    yield event  # queue_position
+                    continue
                 if self._stop_flags.get(conv_id):
                     yield _ev("done", {"done": True, "stopped": True})
                     break
@@ -2034,6 +2135,8 @@ class ChatHandler:
             yield _ev("error", {"error": str(e)})
         finally:
             self._stop_flags.pop(conv_id, None)
+            if slots is not None:
+                slots.close()
 
     async def handle_step_question(self, request: StepQuestionRequest, db) -> AsyncGenerator[ChatEvent, None]:
         chat_req = ChatRequest(conv_id=request.conv_id, message=f"Question regarding current step: {request.question}")
@@ -2045,3 +2148,57 @@ class ChatHandler:
         chat_req = ChatRequest(conv_id=request.conv_id, message=prompt)
         async for event in self.handle_chat(chat_req, db):
             yield event
+
+    async def handle_execute_code(self, request: ExecuteCodeRequest) -> AsyncGenerator[ChatEvent, None]:
+        """Run a code block directly (outside the agent) and stream its output.
+
+        While the code runs, step_execute events with ``progress: true`` carry
+        ``stream`` ("stdout" / "stderr") and an ``output`` chunk; the final
+        step_execute has the usual code / observation / success fields plus
+        the figures and tables the block produced (new ones only; ``artifacts``
+        adds size and sha256) and its resource usage (``usage``: cpu_time_s,
+        peak_rss_mb, limit_exceeded).
+        """
+        if self._code_executor is None:
+            self._code_executor = CodeExecutor()
+        conv_id = request.conv_id or "scratch"
+        if request.conv_id:
+            # Used as an outputs/ path component
+            try:
+                conv_id = str(UUID(request.conv_id))
+            except ValueError:
+                yield _ev("error", {"error": "Invalid conv_id"})
+                return
+        step_num = request.step_index + 1
+        base = {"step": step_num, "iteration": request.iteration}
+        ticket = get_scheduler().enqueue("code", conv_id)
+        try:
+            async for queue_ev in _queue_events(ticket):
+                yield queue_ev
+            async for item in self._code_executor.execute_stream(
+                request.code, request.language, conv_id, str(step_num)
+            ):
+                if isinstance(item, ExecutionChunk):
+                    yield _ev("step_execute", {"step_execute": {
+                        **base, "progress": True, "stream": item.stream, "output": item.text,
+                    }})
+                    continue
+                observation = item.stdout
+                if item.stderr and not item.success:
+                    observation = f"{observation}\n{item.stderr}" if observation else item.stderr
+                yield _ev("step_execute", {"step_execute": {
+                    **base,
+                    "code": request.code,
+                    "observation": observation,
+                    "success": item.success,
+                    "figures": item.figures,
+                    "tables": item.tables,
+                    "artifacts": item.artifacts,
+                    "usage": item.usage(),
+                }})
+            yield _ev("done", {})
+        except Exception as e:
+            logger.exception("Code execution error")
+            yield _ev("error", {"error": str(e)})
+        finally:
+            ticket.release()
@@ -0,0 +1,185 @@
+"""Data-lake catalog — cached, incrementally refreshed data-lake listing.
+
+Replaces the full filesystem walk that scan_data_lake did on every plan run
+(list the directory, open every CSV/TSV/TXT for its header, list every
+subdirectory twice).  File descriptions come from services.schema_sniffer
+(row counts, column names and types for text, Parquet, Arrow and h5ad).  Per-item descriptions are cached keyed by
+(path, mtime, size) and persisted to disk, so after the first scan only a
+directory listing and one stat per item are needed, and within
+DATA_LAKE_REFRESH_INTERVAL not even that.
+
+Refresh is by mtime polling rather than inotify: the data lake usually lives
+on network storage, where inotify does not see changes made by other hosts.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import stat
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config import get_settings
+from services.schema_sniffer import sniff_schema
+
+logger = logging.getLogger("aigen.data_lake_catalog")
+
+# Bump when describe_item output changes so cached descriptions are redone
+_CACHE_VERSION = 2
+
+
+def describe_item(full_path: str, name: str, is_dir: bool) -> str:
+    """One-line schema hint for a data-lake item (schema / directory contents)."""
+    desc = ""
+    if not is_dir:
+        desc = sniff_schema(full_path, name)
+    else:
+        try:
+            all_items = sorted(os.listdir(full_path))
+            if all_items:
+                desc = f"directory containing: {', '.join(all_items[:5])}"
+                if len(all_items) > 5:
+                    desc += f" ... ({len(all_items)} items)"
+        except Exception:
+            pass
+    return desc
+
+
+@dataclass
+class _DirState:
+    mtime_ns: int
+    names: List[str]
+    checked_at: float
+    items: List[Dict[str, str]] = field(default_factory=list)
+
+
+class DataLakeCatalog:
+    """Singleton cache of data-lake item descriptions."""
+
+    _instance: Optional["DataLakeCatalog"] = None
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self._refresh_interval = settings.DATA_LAKE_REFRESH_INTERVAL
+        self._cache_path = os.path.join(settings.CACHE_DIR, "data_lake_catalog.json")
+        # full path → ((mtime_ns, size), description); size is -1 for directories
+        self._entries: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._dirs: Dict[str, _DirState] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def get_instance(cls) -> "DataLakeCatalog":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    async def scan(self, data_lake_path: str, force: bool = False) -> List[Dict[str, str]]:
+        """Non-blocking scan_sync — filesystem work runs in a worker thread."""
+        return await asyncio.to_thread(self.scan_sync, data_lake_path, force)
+
+    def scan_sync(self, data_lake_path: str, force: bool = False) -> List[Dict[str, str]]:
+        """List top-level data-lake items as {"name", "description"} dicts.
+
+        Only items whose (mtime, size) changed since the last scan are
+        re-described.  Returns an empty list if the directory doesn't exist.
+        """
+        if not data_lake_path:
+            return []
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            items, changed = self._refresh(data_lake_path, force)
+            if changed:
+                self._save()
+            return [dict(item) for item in items]
+
+    def _refresh(self, path: str, force: bool) -> Tuple[List[Dict[str, str]], bool]:
+        now = time.monotonic()
+        state = self._dirs.get(path)
+        if state is not None and not force and now - state.checked_at < self._refresh_interval:
+            return state.items, False
+
+        try:
+            dir_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._dirs.pop(path, None)
+            return [], False
+        if state is None or state.mtime_ns != dir_mtime:
+            # Directory mtime changes only when entries are added/removed/renamed
+            try:
+                names = sorted(os.listdir(path))
+            except OSError:
+                return [], False
+        else:
+            names = state.names
+
+        changed = False
+        described = 0
+        items: List[Dict[str, str]] = []
+        live = set()
+        for name in names:
+            full_path = os.path.join(path, name)
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue  # removed since listing
+            is_dir = stat.S_ISDIR(st.st_mode)
+            key = (st.st_mtime_ns, -1 if is_dir else st.st_size)
+            live.add(full_path)
+            entry = self._entries.get(full_path)
+            if entry is None or entry[0] != key:
+                entry = (key, describe_item(full_path, name, is_dir))
+                self._entries[full_path] = entry
+                changed = True
+                described += 1
+            items.append({"name": name, "description": entry[1]})
+
+        prefix = os.path.join(path, "")
+        stale = [p for p in self._entries if p.startswith(prefix) and p not in live]
+        for p in stale:
+            del self._entries[p]
+        changed = changed or bool(stale)
+
+        self._dirs[path] = _DirState(mtime_ns=dir_mtime, names=names, checked_at=now, items=items)
+        if changed:
+            logger.info(
+                f"Data lake {path}: {len(items)} items, {described} re-described, "
+                f"{len(stale)} removed"
+            )
+        return items, changed
+
+    # ─── Persistence ───
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != _CACHE_VERSION:
+                return
+            self._entries = {
+                p: ((int(m), int(s)), d) for p, (m, s, d) in data.get("entries", {}).items()
+            }
+            logger.info(f"Loaded data lake catalog cache: {len(self._entries)} entries")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable data lake catalog cache: {e}")
+
+    def _save(self) -> None:
+        data = {
+            "version": _CACHE_VERSION,
+            "entries": {p: [k[0], k[1], d] for p, (k, d) in self._entries.items()},
+        }
+        tmp = self._cache_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self._cache_path)
+        except OSError as e:
+            logger.debug(f"Could not persist data lake catalog cache: {e}")
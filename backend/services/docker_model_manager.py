@@ -102,7 +102,8 @@ class DockerModelManager:
                 f"--served-model-name {name} "
                 f"--port {VLLM_INTERNAL_PORT} "
                 f"--host 0.0.0.0 "
-                f"--max-model-len {max_model_len}"
+                f"--max-model-len {max_model_len} "
+                f"--enable-prefix-caching"
             ),
             name=VLLM_CONTAINER,
             runtime="nvidia",
@@ -0,0 +1,165 @@
+"""Vector retrieval index — cosine similarity over the Biomni resource catalog.
+
+Used by the ``use_llm_retrieval: embedding`` mode in model_registry.yaml, which
+selects tools / data lake / libraries / know-how without an LLM call.
+
+Two embedders:
+  - "sentence_transformers": CPU sentence embedding model, if
+    RETRIEVAL_EMBEDDING_MODEL is set and the package is installed.
+  - "lsa": TF-IDF + truncated SVD fitted on the catalog itself — no model
+    download, no extra dependency beyond NumPy.
+
+The catalog is embedded once into a row-normalized float32 matrix; a query
+is one encode + one matrix-vector product.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from services.retrieval_index import tokenize
+
+logger = logging.getLogger("aigen.embedding_index")
+
+# Latent dimensions kept by the LSA embedder
+_LSA_DIMS = 128
+
+
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
+
+
+# ─── Embedders ───
+
+class Embedder(ABC):
+    """Maps texts to L2-normalized vectors."""
+
+    name: str = ""
+
+    @abstractmethod
+    def fit(self, corpus: Sequence[str]) -> None:
+        """Prepare the embedder for a catalog (no-op for pretrained models)."""
+
+    @abstractmethod
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a (len(texts), dim) float32 matrix with unit-norm rows."""
+
+
+class LsaEmbedder(Embedder):
+    """TF-IDF (sublinear tf) projected onto the catalog's top singular vectors."""
+
+    name = "lsa"
+
+    def __init__(self, dims: int = _LSA_DIMS) -> None:
+        self._dims = dims
+        self._vocab: Dict[str, int] = {}
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._components = np.zeros((0, 0), dtype=np.float32)
+
+    def _tfidf(self, texts: Sequence[str]) -> np.ndarray:
+        m = np.zeros((len(texts), len(self._vocab)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for tok in tokenize(text):
+                col = self._vocab.get(tok)
+                if col is not None:
+                    m[row, col] += 1.0
+        np.log1p(m, out=m)
+        m *= self._idf
+        return _normalize_rows(m)
+
+    def fit(self, corpus: Sequence[str]) -> None:
+        df: Dict[str, int] = {}
+        for text in corpus:
+            for tok in set(tokenize(text)):
+                df[tok] = df.get(tok, 0) + 1
+        self._vocab = {tok: i for i, tok in enumerate(sorted(df))}
+        n = max(len(corpus), 1)
+        self._idf = np.array(
+            [np.log((1 + n) / (1 + df[tok])) + 1.0 for tok in sorted(df)], dtype=np.float32
+        )
+        x = self._tfidf(corpus)
+        if x.size == 0:
+            self._components = np.zeros((len(self._vocab), 0), dtype=np.float32)
+            return
+        # Right singular vectors span the latent "topic" space of the catalog
+        _, _, vt = np.linalg.svd(x, full_matrices=False)
+        self._components = vt[: min(self._dims, vt.shape[0])].T.astype(np.float32)
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        return _normalize_rows(self._tfidf(texts) @ self._components)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """Pretrained sentence embedding model (sentence-transformers, CPU)."""
+
+    name = "sentence_transformers"
+
+    def __init__(self, model_name: str) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        self._model = SentenceTransformer(model_name, device="cpu")
+
+    def fit(self, corpus: Sequence[str]) -> None:
+        pass
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vecs = self._model.encode(
+            list(texts), batch_size=64, normalize_embeddings=True, show_progress_bar=False
+        )
+        return np.asarray(vecs, dtype=np.float32)
+
+
+def create_embedder(model_name: str = "") -> Embedder:
+    """Sentence-transformers model if configured and installed, else LSA."""
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except ImportError:
+            logger.warning("sentence-transformers not installed — using TF-IDF/LSA embeddings")
+        except Exception as e:
+            logger.warning(f"Embedding model '{model_name}' failed to load ({e}) — using TF-IDF/LSA embeddings")
+    return LsaEmbedder()
+
+
+# ─── Catalog matrix ───
+
+class CatalogEmbeddings:
+    """Precomputed embedding matrix for several named catalog categories."""
+
+    def __init__(self, embedder: Embedder, categories: Dict[str, List[str]]) -> None:
+        self.embedder = embedder
+        corpus: List[str] = []
+        self._ranges: Dict[str, Tuple[int, int]] = {}
+        for category, texts in categories.items():
+            self._ranges[category] = (len(corpus), len(corpus) + len(texts))
+            corpus.extend(texts)
+        embedder.fit(corpus)
+        self._matrix = embedder.encode(corpus) if corpus else np.zeros((0, 0), dtype=np.float32)
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        return self.embedder.encode(texts)
+
+    def search(
+        self, category: str, query_vec: np.ndarray, top_k: int, min_score: float = 0.0,
+    ) -> List[Tuple[int, float]]:
+        """(index within category, cosine) pairs, best first."""
+        start, end = self._ranges.get(category, (0, 0))
+        if end <= start or top_k <= 0:
+            return []
+        return self.rank(self._matrix[start:end], query_vec, top_k, min_score)
+
+    @staticmethod
+    def rank(
+        matrix: np.ndarray, query_vec: np.ndarray, top_k: int, min_score: float = 0.0,
+    ) -> List[Tuple[int, float]]:
+        if matrix.shape[0] == 0 or top_k <= 0:
+            return []
+        scores = matrix @ query_vec
+        k = min(top_k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > min_score]
@@ -0,0 +1,152 @@
+"""Wire framing for ChatEvent streams (SSE and WebSocket).
+
+Two per-event costs dominated streaming at high token rates: serializing a
+fresh payload for every token, and writing one SSE frame / WS message per
+token.  This module provides
+
+  - ``dumps`` / ``dumps_bytes``: orjson when installed (non-ASCII kept as
+    UTF-8, unknown types via str()), else the json module with the same
+    output;
+  - ``coalesce_tokens``: merges consecutive ``token`` events into one until
+    STREAM_TOKEN_FLUSH_MS have passed since the first of them or
+    STREAM_TOKEN_FLUSH_CHARS characters are pending.  Any other event
+    flushes the pending tokens first, so ordering is preserved, and a
+    stalled upstream (LLM pause, code execution) never holds tokens back
+    longer than the interval.
+
+The upstream generator is driven by a single producer task, so it always
+runs in the same task (async context managers held across its yields — HTTP
+streams, DB sessions — are entered and exited in one task) and is cancelled
+with the consumer.  The producer buffers tokens itself and hands whole
+frames to the consumer through a bounded queue; the flush deadline is a
+loop timer whose callback hands over the pending frame, so a token costs a
+list append and the consumer wakes once per frame.
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, List, Optional
+
+from config import get_settings
+from models.schemas import ChatEvent
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+# Events buffered between the producer task and the coalescer
+_QUEUE_SIZE = 256
+_END = object()
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """JSON-encode ``obj`` to UTF-8 bytes."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except (orjson.JSONEncodeError, TypeError):
+            pass  # e.g. integers beyond 64 bits; json handles them
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    """JSON-encode ``obj`` to str (for WebSocket text frames)."""
+    if orjson is not None:
+        return dumps_bytes(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def _token(event: ChatEvent) -> Optional[str]:
+    """The text of a plain ``{"token": str}`` event, else None."""
+    if event.type != "token" or len(event.data) != 1:
+        return None
+    token = event.data.get("token")
+    return token if isinstance(token, str) else None
+
+
+async def coalesce_tokens(
+    events: AsyncIterator[ChatEvent],
+    flush_ms: Optional[int] = None,
+    flush_chars: Optional[int] = None,
+) -> AsyncIterator[ChatEvent]:
+    """``events`` with runs of token events merged (see module docstring).
+
+    ``flush_ms`` / ``flush_chars`` default to the STREAM_TOKEN_FLUSH_*
+    settings; a flush interval of 0 passes events through unchanged.
+    Exceptions from ``events`` are re-raised after the pending tokens.
+    """
+    settings = get_settings()
+    flush_ms = settings.STREAM_TOKEN_FLUSH_MS if flush_ms is None else flush_ms
+    flush_chars = settings.STREAM_TOKEN_FLUSH_CHARS if flush_chars is None else flush_chars
+    if flush_ms <= 0:
+        async for event in events:
+            yield event
+        return
+
+    queue: asyncio.Queue = asyncio.Queue(_QUEUE_SIZE)
+    loop = asyncio.get_running_loop()
+    interval = flush_ms / 1000
+    parts: List[str] = []
+    size = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+    def take() -> ChatEvent:
+        nonlocal size, timer
+        if timer is not None:
+            timer.cancel()
+            timer = None
+        event = ChatEvent(type="token", data={"token": "".join(parts)})
+        parts.clear()
+        size = 0
+        return event
+
+    def on_deadline() -> None:
+        nonlocal timer
+        if queue.full():
+            # Slow consumer: try again later (or on the next token)
+            timer = loop.call_later(interval, on_deadline)
+            return
+        timer = None
+        queue.put_nowait(take())
+
+    async def produce() -> None:
+        nonlocal size, timer
+        try:
+            async for event in events:
+                token = _token(event)
+                if token is None:
+                    if parts:
+                        await queue.put(take())
+                    await queue.put(event)
+                    continue
+                if not parts:
+                    timer = loop.call_later(interval, on_deadline)
+                parts.append(token)
+                size += len(token)
+                if size >= flush_chars or loop.time() >= timer.when():
+                    await queue.put(take())
+        except Exception as e:
+            end = (_END, e)
+        else:
+            end = (_END, None)
+        if parts:
+            await queue.put(take())
+        await queue.put(end)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if isinstance(item, tuple):
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not producer.done():
+            producer.cancel()
+            # Let the upstream's cleanup run; wait() doesn't raise its CancelledError
+            await asyncio.wait([producer])
@@ -0,0 +1,275 @@
+"""Per-run event log: ids, bounded in-memory history, disk spill, subscriptions.
+
+Every event a run produces gets the next integer id (1, 2, ...).  The last
+RUN_EVENT_BUFFER events stay in a ring buffer; older ones are spilled to a
+JSON-lines file under CACHE_DIR/runs in batches (written from a worker
+thread), so a client can replay a long run from any id while memory stays
+bounded.  Subscribers read at their own pace from the log itself — there is
+no per-subscriber queue, so a slow reader costs nothing until it reads.
+
+With several workers (services/state_backend.py) the log is written
+through: every event reaches the spill file shortly after it is appended,
+and other workers follow the run with a SpillReader on that file.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, List, Optional, Tuple
+
+from models.schemas import ChatEvent
+from services.event_frames import dumps_bytes
+
+logger = logging.getLogger("aigen.event_log")
+
+# Evicted events written to disk per batch
+_SPILL_BATCH = 256
+# Events read back from disk per read() call
+_REPLAY_CHUNK = 4 * _SPILL_BATCH
+# Seconds a SpillReader waits for a progress message before polling
+_POLL_INTERVAL = 1.0
+
+Entry = Tuple[int, ChatEvent]
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _Reader:
+    """Subscription on top of ``read``; subclasses keep ``_changed`` current."""
+
+    last_id: int
+    closed: bool
+    _changed: asyncio.Event
+
+    async def read(self, after: int) -> List[Entry]:
+        raise NotImplementedError
+
+    async def _wait(self, changed: asyncio.Event) -> None:
+        await changed.wait()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self, after: int = 0) -> AsyncIterator[Entry]:
+        """Events with id > ``after``, then live ones until the log is closed."""
+        while True:
+            # Taken before reading: a change during the read is not missed
+            changed = self._changed
+            batch = await self.read(after)
+            for entry in batch:
+                yield entry
+                after = entry[0]
+            if batch:
+                continue
+            if self.closed and not changed.is_set():
+                return
+            await self._wait(changed)
+
+
+class EventLog(_Reader):
+    """Append-only event log of one run (see module docstring).
+
+    ``write_through`` spills every event, not just evicted ones, and calls
+    ``on_written(last id on disk)`` after each write.
+    """
+
+    def __init__(
+        self, spill_path: str, capacity: int,
+        write_through: bool = False, on_written: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        self.spill_path = spill_path
+        self._capacity = max(1, capacity)
+        self._write_through = write_through
+        self._on_written = on_written
+        self._ring: Deque[Entry] = deque()
+        # Not yet on disk: evicted from the ring, or written through (ids contiguous, ascending)
+        self._pending: List[Entry] = []
+        # (first id, byte offset) of every batch in the spill file
+        self._batches: List[Tuple[int, int]] = []
+        self._spilled_upto = 0
+        self._spill_size = 0
+        self._spill_task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self.last_id = 0
+        self.closed = False
+
+    # ─── Writing ───
+
+    def append(self, event: ChatEvent) -> int:
+        self.last_id += 1
+        entry = (self.last_id, event)
+        self._ring.append(entry)
+        if self._write_through:
+            self._pending.append(entry)
+            if len(self._ring) > self._capacity:
+                self._ring.popleft()
+            if self._spill_task is None:
+                self._spill_task = asyncio.create_task(self._spill())
+        elif len(self._ring) > self._capacity:
+            self._pending.append(self._ring.popleft())
+            if len(self._pending) >= _SPILL_BATCH and self._spill_task is None:
+                self._spill_task = asyncio.create_task(self._spill())
+        self._wake()
+        return self.last_id
+
+    def close(self) -> None:
+        """No more events; subscribers end once they have read everything."""
+        self.closed = True
+        self._wake()
+
+    async def flush(self) -> None:
+        """Wait for events being spilled (in write-through mode: all of them)."""
+        while self._spill_task is not None:
+            await asyncio.wait([self._spill_task])
+
+    async def _spill(self) -> None:
+        threshold = 1 if self._write_through else _SPILL_BATCH
+        try:
+            while len(self._pending) >= threshold:
+                batch = self._pending[:_SPILL_BATCH]
+                data = b"".join(
+                    dumps_bytes({"id": i, "type": ev.type, "data": ev.data}) + b"\n"
+                    for i, ev in batch
+                )
+                try:
+                    await asyncio.to_thread(self._write, data)
+                except OSError as e:
+                    logger.warning(f"Event spill to {self.spill_path} failed: {e}; events dropped")
+                else:
+                    self._batches.append((batch[0][0], self._spill_size))
+                    self._spill_size += len(data)
+                    self._spilled_upto = batch[-1][0]
+                    if self._on_written is not None:
+                        self._on_written(self._spilled_upto)
+                del self._pending[:len(batch)]
+        finally:
+            self._spill_task = None
+
+    def _write(self, data: bytes) -> None:
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        with open(self.spill_path, "ab") as f:
+            f.write(data)
+
+    def discard(self) -> None:
+        """Drop the spill file (the run is being forgotten)."""
+        if self._spill_task is not None:
+            self._spill_task.cancel()
+        if self._batches or self._spill_task is not None:
+            asyncio.get_running_loop().run_in_executor(None, _remove, self.spill_path)
+
+    # ─── Reading ───
+
+    async def read(self, after: int) -> List[Entry]:
+        """Events with id > ``after`` currently in the log (oldest first).
+
+        Replays from disk return at most _REPLAY_CHUNK events per call.
+        """
+        ring = self._ring
+        if ring and after >= ring[0][0] - 1:
+            return list(itertools.islice(ring, after - ring[0][0] + 1, None))
+        upto, batches = self._spilled_upto, list(self._batches)
+        pending, ring = list(self._pending), list(ring)
+        older: List[Entry] = []
+        if after < upto:
+            older = await asyncio.to_thread(self._read_spill, after, upto, batches)
+            if len(older) >= _REPLAY_CHUNK:
+                return older
+        # Written through, pending events are still in the ring as well
+        entries = older + [e for e in pending if e[0] > max(after, upto)]
+        last = entries[-1][0] if entries else after
+        return entries + [e for e in ring if e[0] > last]
+
+    def _read_spill(self, after: int, upto: int, batches: List[Tuple[int, int]]) -> List[Entry]:
+        offset = 0
+        for first_id, batch_offset in batches:
+            if first_id > after + 1:
+                break
+            offset = batch_offset
+        entries: List[Entry] = []
+        try:
+            with open(self.spill_path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    rec = json.loads(line)
+                    if rec["id"] > upto:
+                        break
+                    if rec["id"] > after:
+                        entries.append((rec["id"], ChatEvent(type=rec["type"], data=rec["data"])))
+                        if len(entries) >= _REPLAY_CHUNK:
+                            break
+        except (OSError, ValueError) as e:
+            logger.warning(f"Event spill {self.spill_path} unreadable: {e}")
+        return entries
+
+
+class SpillReader(_Reader):
+    """Reads the write-through log of a run executing in another worker.
+
+    ``notify`` is called on progress messages from the owning worker; when
+    none arrives for _POLL_INTERVAL, the file is read anyway and
+    ``refresh()`` is asked for (last id, finished) from the run's record.
+    """
+
+    def __init__(self, spill_path: str, refresh: Callable[[], Awaitable[Tuple[int, bool]]]) -> None:
+        self.spill_path = spill_path
+        self._refresh = refresh
+        self._changed = asyncio.Event()
+        # (id of the last event read, file offset after it)
+        self._position: Tuple[int, int] = (0, 0)
+        self.last_id = 0
+        self.closed = False
+
+    def notify(self, last_id: int, closed: bool = False) -> None:
+        self.last_id = max(self.last_id, last_id)
+        self.closed = self.closed or closed
+        self._wake()
+
+    async def _wait(self, changed: asyncio.Event) -> None:
+        try:
+            await asyncio.wait_for(changed.wait(), _POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            last_id, closed = await self._refresh()
+            self.notify(last_id, closed)
+
+    async def read(self, after: int) -> List[Entry]:
+        last_read, offset = self._position
+        if after < last_read:
+            offset = 0
+        entries, position = await asyncio.to_thread(self._read_from, offset, after)
+        if position[0] >= self._position[0]:
+            self._position = position
+        if entries:
+            self.last_id = max(self.last_id, entries[-1][0])
+        return entries
+
+    def _read_from(self, offset: int, after: int) -> Tuple[List[Entry], Tuple[int, int]]:
+        entries: List[Entry] = []
+        last_read = 0
+        try:
+            with open(self.spill_path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # being written
+                    rec = json.loads(line)
+                    offset += len(line)
+                    last_read = rec["id"]
+                    if rec["id"] > after:
+                        entries.append((rec["id"], ChatEvent(type=rec["type"], data=rec["data"])))
+                        if len(entries) >= _REPLAY_CHUNK:
+                            break
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Event spill {self.spill_path} unreadable: {e}")
+        position = (last_read, offset) if last_read else self._position
+        return entries, position
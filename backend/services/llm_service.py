@@ -336,10 +336,12 @@ class LLMService:
             "tool_result_format": mc.get("tool_result_format"),
             "solution_format": mc.get("solution_format"),
             "tool_calls_format": mc.get("tool_calls_format"),
-            "use_llm_retrieval": mc.get("use_llm_retrieval", True),
             "refusal": refusal if refusal else None,
             "system_prompt": mc.get("system_prompt"),
+            # true (LLM picks from the catalog) | false (BM25) | "embedding" | "hybrid"
             "use_llm_retrieval": mc.get("use_llm_retrieval", False),
+            # "standard" (training format) | "prefix" (catalog first, for vLLM prefix caching)
+            "retrieval_prompt_layout": mc.get("retrieval_prompt_layout", "standard"),
         }
 
     # ─── API Key Management ───
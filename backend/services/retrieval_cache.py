@@ -0,0 +1,161 @@
+"""Retrieval result cache — skip the retrieval call for repeated plans.
+
+Reruns (request.rerun), step retries and near-identical goals all run plan
+resource retrieval again.  Results are cached in-process (LRU + TTL) under a
+key built from the normalized retrieval query, the model, the retrieval mode,
+the retrieval prompt overrides and a hash of the catalog (tools, registry and
+scanned data lake, libraries, know-how), so any catalog change is a miss.
+
+With RETRIEVAL_CACHE_PERSIST the selections are also stored by name in the
+``settings`` table (key "retrieval_cache") so they survive restarts; they are
+resolved back to catalog items on load.  Persistence uses its own session, so
+a failure never touches the caller's transaction.
+
+Only embedding / LLM / hybrid retrieval is cached; keyword retrieval is a
+local scan that costs less than the lookup.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+from config import get_settings
+from db.database import async_session_factory
+from db.models import Setting
+
+logger = logging.getLogger("aigen.retrieval_cache")
+
+_KEY_PERSISTED = "retrieval_cache"
+
+_CATEGORIES = ("tools", "data_lake", "libraries", "know_how")
+
+
+def normalize_query(query: str) -> str:
+    """Case/whitespace/punctuation-insensitive form of a retrieval query."""
+    text = unicodedata.normalize("NFKC", query).lower()
+    return re.sub(r"[\W_]+", " ", text).strip()
+
+
+def make_key(
+    query: str, model: str, mode: Any, catalog_hash: str,
+    top_override: Optional[str] = None, bottom_override: Optional[str] = None,
+    max_tools: int = 15,
+) -> str:
+    payload = json.dumps(
+        [normalize_query(query), model, str(mode), catalog_hash,
+         top_override or "", bottom_override or "", max_tools],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RetrievalCache:
+    """In-memory LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= self._ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self._max_entries,
+            "ttl_seconds": self._ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache: Optional[RetrievalCache] = None
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = RetrievalCache(
+            max_entries=settings.RETRIEVAL_CACHE_SIZE,
+            ttl_seconds=settings.RETRIEVAL_CACHE_TTL,
+        )
+    return _cache
+
+
+# ─── Persistence (settings table, selections stored by name) ───
+
+def _to_names(result: Dict[str, Any]) -> Dict[str, List[str]]:
+    return {c: [item.get("name", "") for item in result.get(c, [])] for c in _CATEGORIES}
+
+
+async def load_persisted(key: str) -> Optional[Dict[str, List[str]]]:
+    """Names per category for a persisted, unexpired entry (or None)."""
+    try:
+        async with async_session_factory() as db:
+            row = (await db.execute(select(Setting).where(Setting.key == _KEY_PERSISTED))).scalar_one_or_none()
+        entry = (row.value or {}).get(key) if row else None
+        if entry and time.time() - entry.get("ts", 0) <= get_settings().RETRIEVAL_CACHE_TTL:
+            return entry.get("names")
+    except Exception as e:
+        logger.debug(f"Persisted retrieval cache lookup failed: {e}")
+    return None
+
+
+async def persist(key: str, result: Dict[str, Any]) -> None:
+    """Store a result's selections by name; oldest entries beyond the size cap are dropped."""
+    try:
+        async with async_session_factory() as db:
+            row = (await db.execute(select(Setting).where(Setting.key == _KEY_PERSISTED))).scalar_one_or_none()
+            entries = dict(row.value or {}) if row else {}
+            entries[key] = {"ts": time.time(), "names": _to_names(result)}
+            cap = get_settings().RETRIEVAL_CACHE_SIZE
+            if len(entries) > cap:
+                newest = sorted(entries.items(), key=lambda kv: kv[1].get("ts", 0))[-cap:]
+                entries = dict(newest)
+            if row:
+                row.value = entries
+            else:
+                db.add(Setting(key=_KEY_PERSISTED, value=entries))
+            await db.commit()
+    except Exception as e:
+        logger.warning(f"Persisting retrieval cache entry failed: {e}")
+
+
+async def clear_persisted() -> None:
+    """Drop every persisted entry."""
+    async with async_session_factory() as db:
+        await db.execute(delete(Setting).where(Setting.key == _KEY_PERSISTED))
+        await db.commit()
@@ -0,0 +1,108 @@
+"""Lexical retrieval index — BM25 over the Biomni resource catalog.
+
+Built once by BiomniToolLoader.initialize() for each catalog category
+(tools, data lake, libraries, know-how docs).  Documents are tokenized at
+build time into an inverted index, so a query touches only the postings of
+its own terms instead of substring-testing every catalog entry.
+
+Scoring is BM25 with per-field weights folded into the term frequency
+(name > module > description), so a keyword in a tool name still outranks
+the same keyword buried in a description.  Query terms also match index
+terms they prefix ("gene" → "genes", "genomic"…) at reduced weight, which
+keeps the recall of the old substring matching.
+"""
+
+import heapq
+import math
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Weight of a prefix (non-exact) term match relative to an exact match
+_PREFIX_WEIGHT = 0.5
+# Shortest query term that is expanded to prefix matches
+_MIN_PREFIX_LEN = 4
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens (underscores and punctuation split words)."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Inverted index with BM25 scoring over weighted multi-field documents."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self._k1 = k1
+        self._b = b
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        self._idf: Dict[str, float] = {}
+        self._doc_len: List[float] = []
+        self._avgdl = 0.0
+        self._vocab: List[str] = []  # sorted, for prefix expansion
+
+    @classmethod
+    def build(cls, docs: Iterable[Sequence[Tuple[str, float]]], **kwargs) -> "BM25Index":
+        """Index documents given as sequences of (field_text, field_weight)."""
+        index = cls(**kwargs)
+        tf_by_term: Dict[str, List[Tuple[int, float]]] = {}
+        for doc_id, fields in enumerate(docs):
+            tf: Dict[str, float] = {}
+            length = 0.0
+            for text, weight in fields:
+                for tok in tokenize(text or ""):
+                    tf[tok] = tf.get(tok, 0.0) + weight
+                    length += weight
+            for term, freq in tf.items():
+                tf_by_term.setdefault(term, []).append((doc_id, freq))
+            index._doc_len.append(length)
+
+        n_docs = len(index._doc_len)
+        index._avgdl = (sum(index._doc_len) / n_docs) if n_docs else 0.0
+        index._postings = tf_by_term
+        index._idf = {
+            term: math.log(1.0 + (n_docs - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in tf_by_term.items()
+        }
+        index._vocab = sorted(tf_by_term)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Index terms matched by a query term: exact, then prefix matches."""
+        matches = [(term, 1.0)] if term in self._postings else []
+        if len(term) >= _MIN_PREFIX_LEN:
+            i = bisect_left(self._vocab, term)
+            while i < len(self._vocab) and self._vocab[i].startswith(term):
+                if self._vocab[i] != term:
+                    matches.append((self._vocab[i], _PREFIX_WEIGHT))
+                i += 1
+        return matches
+
+    def search(self, query_terms: Iterable[str], top_k: int = 10) -> List[Tuple[int, float]]:
+        """Return up to top_k (doc_id, score) pairs, best first."""
+        if not self._doc_len or top_k <= 0:
+            return []
+        k1, b, avgdl = self._k1, self._b, self._avgdl or 1.0
+        scores: Dict[int, float] = {}
+        for q in dict.fromkeys(query_terms):
+            for term, weight in self._expand(q):
+                idf = self._idf[term] * weight
+                for doc_id, tf in self._postings[term]:
+                    norm = k1 * (1.0 - b + b * self._doc_len[doc_id] / avgdl)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1.0) / (tf + norm)
+        # Ties keep catalog order (lower doc_id first)
+        return heapq.nsmallest(top_k, scores.items(), key=lambda x: (-x[1], x[0]))
+
+
+def max_normalized(hits: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+    """Scale (doc_id, score) hits by the best score, so hits from separate
+    indexes (each with its own IDF and average length) can be merged."""
+    if not hits or hits[0][1] <= 0:
+        return hits
+    top = hits[0][1]
+    return [(doc_id, score / top) for doc_id, score in hits]
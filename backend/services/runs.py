@@ -0,0 +1,455 @@
+"""Runs: ChatHandler streams executed independently of the client connection.
+
+A run drives one handler generator (chat, step question, retry, code
+execution) in a background task with its own DB session and writes the
+events — tokens already coalesced — to an EventLog.  SSE responses and
+WebSocket connections only subscribe to that log, so a dropped connection
+detaches without stopping the run, and the client reattaches with the last
+event id it saw (SSE ``Last-Event-ID`` / WS ``attach``) to get exactly the
+events it missed.  Finished runs stay replayable for RUN_RETENTION seconds.
+
+Each run belongs to a user (``owner_of``: the X-User-Id header, else the
+client address), who may have at most RUN_MAX_PER_USER active runs (off by
+default — neither identifies a user until there is authentication).  On
+shutdown active runs get RUN_SHUTDOWN_GRACE seconds to finish; the rest are
+cancelled, which makes an interrupted plan save its partial results
+(``_save_plan_complete(stopped=True)``) before the DB is closed.
+
+With several workers (STATE_BACKEND, services/state_backend.py) a run
+executes in the worker that started it, and its record (``run:<run_id>``,
+``latest:<conv_id>``) is shared.  Another worker asked for the run follows
+it through a SpillReader on its write-through spill file; the owning worker
+sends progress messages while someone watches, and cancellation is a
+message to the owning worker.  The run limit counts all workers' runs.
+A record left unfinished by a worker whose heartbeat lapsed (killed, OOM)
+is finished as ``error`` by whichever worker reads it, and removed
+RUN_RETENTION seconds later.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+from starlette.requests import HTTPConnection
+
+from config import get_settings
+from db.database import async_session_factory
+from models.schemas import ChatEvent, RunInfo
+from services.event_frames import coalesce_tokens
+from services.event_log import EventLog, SpillReader
+from services.state_backend import get_state_backend
+
+logger = logging.getLogger("aigen.runs")
+
+# Seconds cancelled runs get to unwind (and persist) on shutdown
+_CANCEL_TIMEOUT = 10.0
+# Seconds between record checks while waiting for a run of another worker
+_REMOTE_POLL = 0.25
+
+
+class RunLimitExceeded(Exception):
+    """The owner already has RUN_MAX_PER_USER active runs."""
+
+    def __init__(self, limit: int) -> None:
+        super().__init__(f"Too many active runs (limit {limit}); wait for one to finish or stop it")
+        self.limit = limit
+
+
+def owner_of(connection: HTTPConnection) -> str:
+    """User a request or WebSocket starts runs for.
+
+    There is no auth: the header is client-controlled and behind a proxy
+    every client has the proxy's address, so this is only a best-effort key.
+    """
+    user = connection.headers.get("x-user-id")
+    if user:
+        return user
+    return connection.client.host if connection.client else "anonymous"
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def with_db_session(make: Callable) -> Callable[[], AsyncIterator[ChatEvent]]:
+    """Event factory that opens the run's own DB session around ``make(db)``."""
+
+    async def events() -> AsyncIterator[ChatEvent]:
+        async with async_session_factory() as db:
+            async for event in make(db):
+                yield event
+
+    return events
+
+
+@dataclass
+class Run:
+    run_id: str
+    conv_id: str
+    kind: str
+    log: Union[EventLog, SpillReader]
+    owner: str = ""
+    status: str = "running"  # running | done | error | stopped
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    # Executing in another worker (log is a SpillReader, task is None)
+    remote: bool = False
+    # Another worker follows this run: send it progress messages
+    watched: bool = False
+
+    @property
+    def active(self) -> bool:
+        return self.finished_at is None
+
+    def info(self) -> RunInfo:
+        def ts(t: Optional[float]) -> Optional[datetime]:
+            return datetime.fromtimestamp(t, tz=timezone.utc) if t is not None else None
+
+        return RunInfo(
+            run_id=self.run_id, conv_id=self.conv_id, kind=self.kind, status=self.status,
+            started_at=ts(self.started_at), finished_at=ts(self.finished_at),
+            last_event_id=self.log.last_id,
+        )
+
+    def record(self, worker: str) -> Dict[str, Any]:
+        """Shared-state record of this run, executing in ``worker``."""
+        return {
+            "run_id": self.run_id, "conv_id": self.conv_id, "kind": self.kind,
+            "owner": self.owner, "status": self.status, "started_at": self.started_at,
+            "finished_at": self.finished_at, "last_event_id": self.log.last_id,
+            "worker": worker, "spill": self.log.spill_path,
+        }
+
+
+class RunRegistry:
+    """Singleton owning the running and recently finished runs."""
+
+    _instance: Optional["RunRegistry"] = None
+
+    def __init__(self) -> None:
+        self._runs: Dict[str, Run] = {}  # own runs and followed runs of other workers
+        self._latest: Dict[str, str] = {}  # conv_id → most recent own run_id
+        self._state = get_state_backend()
+        self._background: set = set()
+        self._state.on("cancel", self._on_cancel)
+        self._state.on("watch", self._on_watch)
+        self._state.on("progress", self._on_progress)
+
+    @classmethod
+    def get_instance(cls) -> "RunRegistry":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    async def start(
+        self, conv_id: str, kind: str, events: Callable[[], AsyncIterator[ChatEvent]],
+        owner: str = "",
+    ) -> Run:
+        """Start ``events()`` as a run of ``conv_id``; returns once it is registered.
+
+        Raises RunLimitExceeded if ``owner`` already has RUN_MAX_PER_USER
+        active runs.
+        """
+        settings = get_settings()
+        limit = settings.RUN_MAX_PER_USER
+        if owner and limit > 0 and await self._active_count(owner) >= limit:
+            raise RunLimitExceeded(limit)
+        run_id = uuid.uuid4().hex
+        log = EventLog(
+            os.path.join(settings.CACHE_DIR, "runs", f"{run_id}.jsonl"),
+            settings.RUN_EVENT_BUFFER,
+            write_through=self._state.shared,
+            on_written=lambda upto: self._written(run_id, upto),
+        )
+        run = Run(run_id=run_id, conv_id=conv_id, kind=kind, log=log, owner=owner)
+        self._runs[run_id] = run
+        if conv_id:
+            self._latest[conv_id] = run_id
+        if self._state.shared:
+            # Shared before the client can ask another worker for it
+            try:
+                await self._state.put(f"run:{run_id}", run.record(self._state.worker_id))
+                if conv_id:
+                    await self._state.put(f"latest:{conv_id}", run_id)
+            except Exception as e:
+                logger.warning(f"Run {run_id[:8]} not shared with other workers: {e}")
+            self._publish("started", {"run_id": run_id, "conv_id": conv_id})
+        run.task = asyncio.create_task(self._drive(run, events))
+        logger.info(f"Run {run_id[:8]} started: {kind} conv_id={conv_id} owner={owner}")
+        return run
+
+    def get(self, run_id: str) -> Optional[Run]:
+        """A run this worker executes or already follows."""
+        return self._runs.get(run_id)
+
+    async def find(self, run_id: str) -> Optional[Run]:
+        """Like ``get``, but also finds runs executing in other workers."""
+        run = self._runs.get(run_id)
+        if run is not None and run.remote and run.active:
+            run.log.notify(*await self._refresh(run_id))
+        if run is not None or not self._state.shared:
+            return run
+        rec = await self._state.get(f"run:{run_id}")
+        if rec is None:
+            return None
+        await self._check_records([rec])
+        run = self._runs.get(run_id)  # found meanwhile
+        if run is None:
+            run = self._remote_run(rec)
+            self._runs[run_id] = run
+            if run.active:
+                self._publish("watch", {"run_id": run_id})
+            else:
+                self._forget_later(run)
+        return run
+
+    async def find_latest(self, conv_id: str) -> Optional[Run]:
+        """Most recent run of ``conv_id`` in any worker."""
+        if self._state.shared:
+            run_id = await self._state.get(f"latest:{conv_id}")
+            if run_id:
+                return await self.find(run_id)
+        run_id = self._latest.get(conv_id)
+        return self._runs.get(run_id) if run_id else None
+
+    async def list_runs(self, conv_id: Optional[str] = None, active: Optional[bool] = None) -> List[RunInfo]:
+        """Runs of all workers (newest first), optionally of one conversation / by activity."""
+        runs = {r.run_id: r.info() for r in self._runs.values() if not r.remote}
+        if self._state.shared:
+            for rec in await self._shared_records():
+                if rec["run_id"] not in runs:
+                    runs[rec["run_id"]] = self._remote_run(rec).info()
+        infos = [
+            i for i in runs.values()
+            if (conv_id is None or i.conv_id == conv_id)
+            and (active is None or (i.finished_at is None) == active)
+        ]
+        return sorted(infos, key=lambda i: i.started_at, reverse=True)
+
+    async def cancel_run(self, run_id: str) -> bool:
+        """Cancel one run of any worker; True if it was active."""
+        run = await self.find(run_id)
+        if run is None or not run.active:
+            return False
+        if run.remote:
+            await self._state.publish("cancel", {"run_id": run_id})
+        elif run.task is not None:
+            run.task.cancel()
+        return True
+
+    async def cancel(self, conv_id: str) -> bool:
+        """Cancel the active runs of ``conv_id`` in every worker; True if there were any."""
+        cancelled = self._cancel_local(conv_id)
+        if self._state.shared:
+            await self._state.publish("cancel", {"conv_id": conv_id})
+            cancelled = cancelled or any(
+                rec["conv_id"] == conv_id and rec["finished_at"] is None
+                and rec["worker"] != self._state.worker_id
+                for rec in await self._shared_records()
+            )
+        return cancelled
+
+    async def wait(self, run: Run, timeout: float) -> None:
+        """Wait up to ``timeout`` seconds for ``run`` to finish."""
+        if run.task is not None:
+            await asyncio.wait([run.task], timeout=timeout)
+            return
+        deadline = time.monotonic() + timeout
+        while run.active and time.monotonic() < deadline:
+            await asyncio.sleep(_REMOTE_POLL)
+            await self._refresh(run.run_id)
+
+    async def shutdown(self, grace: float) -> None:
+        """Let active runs finish for up to ``grace`` seconds, then cancel the rest.
+
+        Call before the DB is closed: cancelled runs still write to it while
+        unwinding.
+        """
+        tasks = [r.task for r in self._runs.values() if r.active and r.task is not None]
+        if not tasks:
+            return
+        logger.info(f"Waiting up to {grace:.0f}s for {len(tasks)} active run(s)")
+        _, pending = await asyncio.wait(tasks, timeout=grace)
+        if pending:
+            logger.warning(f"Stopping {len(pending)} run(s) still active at shutdown")
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending, timeout=_CANCEL_TIMEOUT)
+
+    async def _drive(self, run: Run, events: Callable[[], AsyncIterator[ChatEvent]]) -> None:
+        try:
+            async for event in coalesce_tokens(events()):
+                run.log.append(event)
+            run.status = "done"
+        except asyncio.CancelledError:
+            run.status = "stopped"
+            run.log.append(ChatEvent(type="done", data={"stopped": True}))
+        except Exception as e:
+            logger.exception(f"Run {run.run_id[:8]} failed")
+            run.status = "error"
+            run.log.append(ChatEvent(type="error", data={"error": str(e)}))
+        finally:
+            run.finished_at = time.time()
+            run.log.close()
+            self._forget_later(run)
+            logger.info(f"Run {run.run_id[:8]} {run.status} after {run.finished_at - run.started_at:.1f}s")
+        if self._state.shared:
+            await run.log.flush()
+            try:
+                await self._state.put(f"run:{run.run_id}", run.record(self._state.worker_id))
+            except Exception as e:
+                logger.warning(f"Run {run.run_id[:8]} record not updated: {e}")
+            await self._state.publish("progress", {
+                "run_id": run.run_id, "last_id": run.log.last_id, "closed": True,
+                "status": run.status, "finished_at": run.finished_at,
+            })
+
+    def _forget_later(self, run: Run) -> None:
+        asyncio.get_running_loop().call_later(get_settings().RUN_RETENTION, self._forget, run.run_id)
+
+    def _forget(self, run_id: str) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None or run.remote:
+            return  # the owning worker removes the record and the file
+        if self._latest.get(run.conv_id) == run_id:
+            del self._latest[run.conv_id]
+        run.log.discard()
+        if self._state.shared:
+            self._spawn(self._unshare(run))
+
+    async def _unshare(self, run: Run) -> None:
+        try:
+            await self._state.delete(f"run:{run.run_id}")
+            if run.conv_id and await self._state.get(f"latest:{run.conv_id}") == run.run_id:
+                await self._state.delete(f"latest:{run.conv_id}")
+        except Exception as e:
+            logger.warning(f"Run {run.run_id[:8]} record not removed: {e}")
+
+    # ─── Other workers ───
+
+    async def _active_count(self, owner: str) -> int:
+        count = sum(1 for r in self._runs.values() if r.owner == owner and r.active and not r.remote)
+        if self._state.shared:
+            count += sum(
+                1 for rec in await self._shared_records()
+                if rec["owner"] == owner and rec["finished_at"] is None
+                and rec["worker"] != self._state.worker_id
+            )
+        return count
+
+    async def _shared_records(self) -> List[Dict[str, Any]]:
+        """Run records of all workers, checked against the live workers."""
+        return await self._check_records(list((await self._state.items("run:")).values()))
+
+    async def _check_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Finish unfinished records of dead workers as errors; drop expired ones.
+
+        A dead worker can neither finish its runs nor forget them, so the
+        reader does both (the records are updated in place).
+        """
+        others = [r for r in records if r["worker"] != self._state.worker_id]
+        if not others:
+            return records
+        live = await self._state.live_workers()
+        expired = set()
+        now = time.time()
+        for rec in others:
+            if rec["worker"] in live:
+                continue
+            try:
+                if rec["finished_at"] is None:
+                    rec["status"], rec["finished_at"] = "error", now
+                    logger.warning(f"Run {rec['run_id'][:8]} of dead worker {rec['worker']} marked as error")
+                    await self._state.put(f"run:{rec['run_id']}", rec)
+                elif now - rec["finished_at"] > get_settings().RUN_RETENTION:
+                    expired.add(rec["run_id"])
+                    await self._state.delete(f"run:{rec['run_id']}")
+                    if rec["conv_id"] and await self._state.get(f"latest:{rec['conv_id']}") == rec["run_id"]:
+                        await self._state.delete(f"latest:{rec['conv_id']}")
+                    if rec.get("spill"):
+                        await asyncio.to_thread(_remove, rec["spill"])
+            except Exception as e:
+                logger.warning(f"Record of run {rec['run_id'][:8]} (dead worker) not updated: {e}")
+        return [r for r in records if r["run_id"] not in expired]
+
+    def _remote_run(self, rec: Dict[str, Any]) -> Run:
+        run_id = rec["run_id"]
+        run = Run(
+            run_id=run_id, conv_id=rec["conv_id"], kind=rec["kind"],
+            log=SpillReader(rec["spill"], lambda: self._refresh(run_id)),
+            owner=rec["owner"], status=rec["status"], started_at=rec["started_at"],
+            finished_at=rec["finished_at"], remote=True,
+        )
+        run.log.notify(rec["last_event_id"], closed=rec["finished_at"] is not None)
+        return run
+
+    async def _refresh(self, run_id: str) -> Tuple[int, bool]:
+        """(last event id, finished) of a remote run from its record."""
+        run = self._runs.get(run_id)
+        rec = await self._state.get(f"run:{run_id}")
+        if rec is None:
+            # Forgotten, or its worker is gone without finishing it
+            if run is not None and run.active:
+                run.status, run.finished_at = "error", time.time()
+                self._forget_later(run)
+            return (run.log.last_id if run else 0), True
+        if rec["finished_at"] is None:
+            await self._check_records([rec])
+        if run is not None and run.active and rec["finished_at"] is not None:
+            run.status, run.finished_at = rec["status"], rec["finished_at"]
+            self._forget_later(run)
+        return rec["last_event_id"], rec["finished_at"] is not None
+
+    def _cancel_local(self, conv_id: str) -> bool:
+        cancelled = False
+        for run in list(self._runs.values()):
+            if run.conv_id == conv_id and run.active and run.task is not None:
+                run.task.cancel()
+                cancelled = True
+        return cancelled
+
+    def _written(self, run_id: str, upto: int) -> None:
+        run = self._runs.get(run_id)
+        if run is not None and run.watched and run.active:
+            self._publish("progress", {"run_id": run_id, "last_id": upto})
+
+    def _on_cancel(self, message: Dict[str, Any]) -> None:
+        if message.get("run_id"):
+            run = self._runs.get(message["run_id"])
+            if run is not None and run.active and run.task is not None:
+                run.task.cancel()
+        elif message.get("conv_id"):
+            self._cancel_local(message["conv_id"])
+
+    def _on_watch(self, message: Dict[str, Any]) -> None:
+        run = self._runs.get(message.get("run_id", ""))
+        if run is not None and not run.remote and run.active:
+            run.watched = True
+
+    def _on_progress(self, message: Dict[str, Any]) -> None:
+        run = self._runs.get(message.get("run_id", ""))
+        if run is None or not run.remote:
+            return
+        closed = bool(message.get("closed"))
+        if closed and run.active:
+            run.status = message.get("status", run.status)
+            run.finished_at = message.get("finished_at") or time.time()
+            self._forget_later(run)
+        run.log.notify(message.get("last_id", 0), closed)
+
+    def _publish(self, channel: str, message: Dict[str, Any]) -> None:
+        self._spawn(self._state.publish(channel, message))
+
+    def _spawn(self, coro: Any) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
@@ -0,0 +1,299 @@
+"""Resource scheduler — bounded, fair concurrency for expensive work.
+
+Each resource ("code", "retrieval", "llm:<model>") has a slot limit.  Work
+takes a Ticket; when no slot is free the ticket waits in a per-conversation
+queue and slots are handed out round-robin across conversations, so one
+conversation with many queued jobs can't starve the others.  While waiting,
+Ticket.wait() yields the ticket's queue position so the caller can forward
+``queue_position`` events to the client.
+
+Wait times are recorded per resource (stats() / GET /api/scheduler/stats).
+
+Tickets live on the app's event loop.  Agent runs are scheduled through
+SlotCallback, a LangChain callback that holds a slot only while the work runs:
+each chat model call holds ``llm:<model>`` and each A1 "execute" node holds
+``code``.  Both are taken before the work starts (the execute node waits on
+the loop, before LangGraph hands it to a worker thread), so waiting never
+parks an executor thread on the loop's behalf.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from config import get_settings
+
+logger = logging.getLogger("aigen.scheduler")
+
+# Wait-time samples kept per resource for percentiles
+_WAIT_SAMPLES = 1000
+
+
+class Ticket:
+    """One unit of scheduled work; release() exactly once when done (idempotent)."""
+
+    def __init__(self, queue: "_FairQueue", key: str) -> None:
+        self.queue = queue
+        self.key = key
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.released = False
+        self._granted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def granted(self) -> bool:
+        return self._granted.done()
+
+    @property
+    def waited_ms(self) -> float:
+        end = self.granted_at if self.granted_at is not None else time.monotonic()
+        return (end - self.enqueued_at) * 1e3
+
+    async def wait(self) -> AsyncIterator[int]:
+        """Yield the queue position (1 = next) whenever it changes, until granted."""
+        last = None
+        while not self.granted:
+            position = self.queue.position(self)
+            if position != last:
+                last = position
+                yield position
+            changed = asyncio.ensure_future(self.queue.changed.wait())
+            try:
+                await asyncio.wait({self._granted, changed}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed.cancel()
+
+    def release(self) -> None:
+        self.queue.release(self)
+
+
+class _FairQueue:
+    """Slot-limited resource with round-robin queues keyed by conversation."""
+
+    def __init__(self, name: str, limit: int) -> None:
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self.granted_total = 0
+        self.changed = asyncio.Event()
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def enqueue(self, key: str) -> Ticket:
+        ticket = Ticket(self, key)
+        if self.active < self.limit and not self._queues:
+            self._grant(ticket)
+        else:
+            self._queues.setdefault(key, deque()).append(ticket)
+            self._notify()
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted:
+            self.active -= 1
+            self._dispatch()
+        else:
+            # Abandoned while queued (client stop / disconnect)
+            q = self._queues.get(ticket.key)
+            if q is not None and ticket in q:
+                q.remove(ticket)
+                if not q:
+                    del self._queues[ticket.key]
+            ticket._granted.cancel()
+            self._notify()
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based position under round-robin order (0 once granted)."""
+        if ticket.granted:
+            return 0
+        keys = list(self._queues)
+        if ticket.key not in self._queues:
+            return 0
+        own = self._queues[ticket.key]
+        index, rank = own.index(ticket), keys.index(ticket.key)
+        ahead = index
+        for i, key in enumerate(keys):
+            if key != ticket.key:
+                ahead += min(len(self._queues[key]), index + (1 if i < rank else 0))
+        return ahead + 1
+
+    def _grant(self, ticket: Ticket) -> None:
+        self.active += 1
+        self.granted_total += 1
+        ticket.granted_at = time.monotonic()
+        ticket._granted.set_result(None)
+        self._waits.append(ticket.waited_ms)
+
+    def _dispatch(self) -> None:
+        while self.active < self.limit and self._queues:
+            key, q = next(iter(self._queues.items()))
+            ticket = q.popleft()
+            if q:
+                self._queues.move_to_end(key)  # this conversation goes to the back
+            else:
+                del self._queues[key]
+            self._grant(ticket)
+        self._notify()
+
+    def _notify(self) -> None:
+        # Wake every waiter to re-read its position, then arm a fresh event
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def pct(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 1) if waits else 0.0
+
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "conversations_waiting": len(self._queues),
+            "granted": self.granted_total,
+            "wait_ms": {
+                "avg": round(sum(waits) / len(waits), 1) if waits else 0.0,
+                "p50": pct(0.5),
+                "p95": pct(0.95),
+                "max": round(waits[-1], 1) if waits else 0.0,
+            },
+        }
+
+
+class ResourceScheduler:
+    """Registry of fair queues, created on first use with limits from config."""
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self._limits = {
+            "code": settings.SCHED_CODE_SLOTS or os.cpu_count() or 4,
+            "retrieval": settings.SCHED_RETRIEVAL_SLOTS,
+            "llm": settings.SCHED_LLM_STREAMS_PER_MODEL,
+        }
+        self._queues: Dict[str, _FairQueue] = {}
+
+    def _queue(self, resource: str) -> _FairQueue:
+        q = self._queues.get(resource)
+        if q is None:
+            limit = self._limits.get(resource.split(":", 1)[0], 4)
+            q = self._queues[resource] = _FairQueue(resource, limit)
+        return q
+
+    def enqueue(self, resource: str, key: str) -> Ticket:
+        """Take a ticket for ``resource`` on behalf of conversation ``key`` (event loop only)."""
+        return self._queue(resource).enqueue(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: q.stats() for name, q in sorted(self._queues.items())}
+
+
+class SlotCallback(AsyncCallbackHandler):
+    """Holds scheduler slots for the model calls and code runs of one agent run.
+
+    Pass it in the run's config callbacks.  A chat model call holds ``llm``
+    (an ``llm:<model>`` resource) from on_chat_model_start until on_llm_end /
+    on_llm_error; a chain named in ``chains`` holds the mapped resource for
+    its run.  LangChain awaits these callbacks before starting the work, so
+    the work waits for its slot; calls made from worker threads wait for the
+    loop's ticket from there.
+
+    With ``wait``, the items it yields for a queued ticket (queue_position
+    events) are put on ``events`` for the caller to forward.  close() returns
+    any slots still held.
+    """
+
+    def __init__(
+        self, key: str, llm: str,
+        chains: Optional[Dict[str, str]] = None,
+        wait: Optional[Callable[[Ticket], AsyncIterator[Any]]] = None,
+    ) -> None:
+        self._key = key
+        self._llm = llm
+        self._chains = chains or {}
+        self._wait = wait
+        self._loop = asyncio.get_running_loop()
+        self._tickets: Dict[UUID, Ticket] = {}
+        self.events: asyncio.Queue = asyncio.Queue()
+
+    async def _acquire(self, resource: str, run_id: UUID) -> None:
+        ticket = get_scheduler().enqueue(resource, self._key)
+        try:
+            if self._wait is not None:
+                async for item in self._wait(ticket):
+                    self.events.put_nowait(item)
+            else:
+                async for _ in ticket.wait():
+                    pass
+        except BaseException:
+            ticket.release()
+            raise
+        self._tickets[run_id] = ticket
+
+    async def _hold(self, resource: str, run_id: UUID) -> None:
+        if _on_loop(self._loop):
+            await self._acquire(resource, run_id)
+        else:
+            await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self._acquire(resource, run_id), self._loop)
+            )
+
+    def _release(self, run_id: UUID) -> None:
+        ticket = self._tickets.pop(run_id, None)
+        if ticket is not None:
+            self._loop.call_soon_threadsafe(ticket.release)
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        await self._hold(self._llm, run_id)
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        self._release(run_id)
+
+    async def on_llm_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        self._release(run_id)
+
+    async def on_chain_start(self, serialized, inputs, *, run_id: UUID, **kwargs: Any) -> None:
+        resource = self._chains.get(kwargs.get("name") or (serialized or {}).get("name", ""))
+        if resource:
+            await self._hold(resource, run_id)
+
+    async def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._release(run_id)
+
+    async def on_chain_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        self._release(run_id)
+
+    def close(self) -> None:
+        """Return slots whose end callback never came (run stopped or cancelled)."""
+        for run_id in list(self._tickets):
+            self._release(run_id)
+
+
+def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+_scheduler: Optional[ResourceScheduler] = None
+
+
+def get_scheduler() -> ResourceScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ResourceScheduler()
+    return _scheduler
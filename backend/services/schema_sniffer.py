@@ -0,0 +1,211 @@
+"""Schema sniffing for data-lake files — one-line summaries for the LLM.
+
+Reads only what is needed to describe a file, never the whole file:
+  - Parquet: footer metadata (memory-mapped) — row count, column names/types
+  - Arrow IPC / Feather: schema + record-batch headers (memory-mapped)
+  - CSV / TSV / TXT, plain or .gz / .bz2: the first block only — delimiter,
+    header, per-column types inferred from sample rows, row estimate
+  - h5ad (AnnData): obs/var sizes and obs/var column names via h5py
+
+pyarrow and h5py are optional; without them those formats get a generic
+description.  Summaries are cached by DataLakeCatalog, keyed by
+(path, mtime, size).
+"""
+
+import bz2
+import csv
+import gzip
+import io
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("aigen.schema_sniffer")
+
+# Bytes of (decompressed) text read to sniff a delimited file
+_SAMPLE_BYTES = 64 * 1024
+# Sample rows used for column type inference
+_SAMPLE_ROWS = 50
+# Columns listed in a summary
+_MAX_COLS = 20
+
+_TEXT_EXTS = (".csv", ".tsv", ".txt")
+_OPENERS: Dict[str, Callable[..., io.IOBase]] = {".gz": gzip.open, ".bz2": bz2.open}
+
+
+def _format_columns(cols: List[Tuple[str, str]]) -> str:
+    parts = [f"{name} ({dtype})" if dtype else name for name, dtype in cols[:_MAX_COLS]]
+    text = ", ".join(parts)
+    if len(cols) > _MAX_COLS:
+        text += f" ... ({len(cols)} total)"
+    return text
+
+
+def _summary(kind: str, rows: Optional[str], cols: List[Tuple[str, str]]) -> str:
+    head = kind
+    if rows:
+        head += f", {rows} rows"
+    if cols:
+        head += f" x {len(cols)} cols"
+        return f"{head}; columns: {_format_columns(cols)}"
+    return head
+
+
+# ─── Delimited text ───
+
+def _infer_type(values: List[str]) -> str:
+    seen = [v for v in values if v not in ("", "NA", "NaN", "nan", "null", "None")]
+    if not seen:
+        return ""
+    for cast, name in ((int, "int"), (float, "float")):
+        try:
+            for v in seen:
+                cast(v)
+            return name
+        except ValueError:
+            continue
+    return "str"
+
+
+def _sniff_delimited(path: str, name: str) -> str:
+    lower = name.lower()
+    compression = next((ext for ext in _OPENERS if lower.endswith(ext)), "")
+    base = lower[: -len(compression)] if compression else lower
+    opener = _OPENERS.get(compression)
+    if opener is not None:
+        with opener(path, "rt", encoding="utf-8", errors="ignore") as f:
+            sample = f.read(_SAMPLE_BYTES)
+    else:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            sample = f.read(_SAMPLE_BYTES)
+    if not sample.strip():
+        return ""
+
+    lines = sample.splitlines()
+    complete = lines if len(sample) < _SAMPLE_BYTES else lines[:-1]  # last line may be cut
+    if base.endswith(".tsv"):
+        delimiter = "\t"
+    elif base.endswith(".csv"):
+        delimiter = ","
+    else:
+        try:
+            delimiter = csv.Sniffer().sniff("\n".join(complete[:20]), delimiters="\t,;|").delimiter
+        except csv.Error:
+            delimiter = None
+
+    if delimiter is None:
+        # Free text: just report size
+        return f"text, {len(complete)}+ lines" if len(sample) >= _SAMPLE_BYTES else f"text, {len(complete)} lines"
+
+    rows = list(csv.reader(complete[: _SAMPLE_ROWS + 1], delimiter=delimiter))
+    if not rows:
+        return ""
+    header, body = rows[0], rows[1:]
+    cols = [
+        (h.strip().strip('"'), _infer_type([r[i].strip() for r in body if i < len(r)]))
+        for i, h in enumerate(header)
+    ]
+
+    kind = base.rsplit(".", 1)[-1] + (f" ({compression[1:]})" if compression else "")
+    if len(sample) < _SAMPLE_BYTES:
+        row_count = f"{max(len(complete) - 1, 0):,}"
+    elif opener is None and complete:
+        # Extrapolate from the average line length of the sample
+        avg = len(sample.encode("utf-8", errors="ignore")) / max(len(lines), 1)
+        row_count = f"~{int(os.path.getsize(path) / avg):,}"
+    else:
+        row_count = None
+    return _summary(kind, row_count, cols)
+
+
+# ─── Columnar formats (pyarrow) ───
+
+def _sniff_parquet(path: str) -> str:
+    import pyarrow.parquet as pq
+
+    meta = pq.read_metadata(path, memory_map=True)
+    schema = meta.schema.to_arrow_schema()
+    cols = [(f.name, str(f.type)) for f in schema]
+    return _summary("parquet", f"{meta.num_rows:,}", cols)
+
+
+def _sniff_arrow(path: str) -> str:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    with pa.memory_map(path, "r") as source:
+        try:
+            reader = ipc.open_file(source)
+            n_rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+            schema = reader.schema
+        except pa.ArrowInvalid:
+            # Feather v1 / stream format
+            import pyarrow.feather as feather
+            table = feather.read_table(path, memory_map=True)
+            n_rows, schema = table.num_rows, table.schema
+    cols = [(f.name, str(f.type)) for f in schema]
+    return _summary("arrow", f"{n_rows:,}", cols)
+
+
+# ─── AnnData (h5py) ───
+
+def _h5_columns(group) -> List[Tuple[str, str]]:
+    order = group.attrs.get("column-order", None)
+    names = [str(n) for n in order] if order is not None else [
+        k for k in group.keys() if k not in ("_index", "__categories")
+    ]
+    return [(n, "") for n in names]
+
+
+def _h5_len(group) -> Optional[int]:
+    index_key = group.attrs.get("_index", "_index")
+    if isinstance(index_key, bytes):
+        index_key = index_key.decode()
+    if index_key in group:
+        return int(group[index_key].shape[0])
+    return None
+
+
+def _sniff_h5ad(path: str) -> str:
+    import h5py
+
+    with h5py.File(path, "r") as f:
+        obs, var = f.get("obs"), f.get("var")
+        n_obs = _h5_len(obs) if obs is not None else None
+        n_var = _h5_len(var) if var is not None else None
+        parts = ["AnnData h5ad"]
+        if n_obs is not None and n_var is not None:
+            parts.append(f"{n_obs:,} obs x {n_var:,} vars")
+        if obs is not None:
+            parts.append(f"obs columns: {_format_columns(_h5_columns(obs))}")
+        if var is not None:
+            parts.append(f"var columns: {_format_columns(_h5_columns(var))}")
+        layers = list(f["layers"].keys()) if "layers" in f else []
+        if layers:
+            parts.append(f"layers: {', '.join(layers[:10])}")
+    return "; ".join(parts)
+
+
+# ─── Dispatch ───
+
+def sniff_schema(path: str, name: str) -> str:
+    """Schema summary for a data-lake file, or "" if unknown / unreadable."""
+    lower = name.lower()
+    try:
+        if lower.endswith(".parquet") or lower.endswith(".pq"):
+            return _sniff_parquet(path)
+        if lower.endswith((".feather", ".arrow", ".ipc")):
+            return _sniff_arrow(path)
+        if lower.endswith(".h5ad"):
+            return _sniff_h5ad(path)
+        stem = lower
+        for ext in _OPENERS:
+            if stem.endswith(ext):
+                stem = stem[: -len(ext)]
+        if stem.endswith(_TEXT_EXTS):
+            return _sniff_delimited(path, name)
+    except ImportError as e:
+        logger.debug(f"Schema sniffing for {name} needs {e.name}")
+    except Exception as e:
+        logger.debug(f"Schema sniffing failed for {name}: {e}")
+    return ""
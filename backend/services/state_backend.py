@@ -0,0 +1,410 @@
+"""Cross-worker state, so the backend can run as several uvicorn workers.
+
+ChatHandler and RunRegistry keep their working state in process memory
+(agents, stop flags, the plan being executed, run event logs).  With more
+than one worker a request may reach a worker other than the one executing
+the conversation's run, so a StateBackend shares
+
+  - a key-value store with JSON values: plan state snapshots
+    (``plan:<conv_id>``) and run records (``run:<run_id>``,
+    ``latest:<conv_id>``);
+  - messages to the other workers (``publish`` / ``on``): stop signals, run
+    cancellation, plan-state invalidation, run starts and progress.
+
+Run events themselves are written through to the run's spill file under
+CACHE_DIR/runs (services/event_log.py) and other workers read them from
+there, so the workers must share CACHE_DIR (same host or a shared volume).
+A1 agents stay per worker: each turn passes the full history from the DB.
+
+STATE_BACKEND selects the implementation:
+
+  local     — one worker (default).  Nothing is shared (``shared`` is
+              False) and callers skip the store entirely.
+  socket    — workers on one host: a Unix datagram socket per worker in
+              STATE_SOCKET_DIR for messages, JSON files there for the store.
+  postgres  — LISTEN/NOTIFY on DATABASE_URL for messages, the shared_state
+              table for the store.
+
+Messages are small dicts delivered to the *other* workers only — callers
+apply a change locally themselves.  Delivery is best effort (a restarting
+worker misses messages), so readers that mustn't miss anything also poll
+the store.
+
+Shared backends keep a heartbeat (``worker:<worker_id>``) in the store;
+``live_workers()`` is the set renewed within STATE_WORKER_LEASE, so records
+left by a worker that was killed can be told apart from running ones.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+from urllib.parse import quote, unquote
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from config import get_settings
+from db.database import async_session_factory
+from db.models import SharedState
+from services.event_frames import dumps_bytes
+
+logger = logging.getLogger("aigen.state_backend")
+
+Handler = Callable[[Dict[str, Any]], None]
+
+# Seconds a listing of the other workers' sockets / heartbeats is reused
+_PEER_REFRESH = 1.0
+# NOTIFY channel and payload limit (Postgres rejects payloads of 8000 bytes)
+_CHANNEL = "aigen_state"
+_NOTIFY_MAX = 7900
+# Seconds between LISTEN reconnection attempts
+_RECONNECT_DELAY = 2.0
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class StateBackend:
+    """Single-worker backend (STATE_BACKEND=local); base class of the shared ones."""
+
+    shared = False
+
+    def __init__(self) -> None:
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._store: Dict[str, Any] = {}
+        self._lease = get_settings().STATE_WORKER_LEASE
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._live: Optional[Set[str]] = None
+        self._live_at = 0.0
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    # ─── Liveness ───
+
+    async def live_workers(self) -> Set[str]:
+        """Ids of the workers whose heartbeat is current (always includes this one)."""
+        if not self.shared:
+            return {self.worker_id}
+        now = time.monotonic()
+        if self._live is None or now - self._live_at >= _PEER_REFRESH:
+            cutoff = time.time() - self._lease
+            beats = await self.items("worker:")
+            self._live = {
+                key[len("worker:"):] for key, beat in beats.items()
+                if isinstance(beat, dict) and beat.get("at", 0) >= cutoff
+            } | {self.worker_id}
+            self._live_at = now
+        return self._live
+
+    def _start_heartbeat(self) -> None:
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _stop_heartbeat(self) -> None:
+        if self._heartbeat_task is None:
+            return
+        self._heartbeat_task.cancel()
+        await asyncio.wait([self._heartbeat_task])
+        self._heartbeat_task = None
+        try:
+            await self.delete(f"worker:{self.worker_id}")
+        except Exception as e:
+            logger.warning(f"Heartbeat of worker {self.worker_id} not removed: {e}")
+
+    async def _heartbeat(self) -> None:
+        while True:
+            try:
+                await self.put(f"worker:{self.worker_id}", {"at": time.time(), "pid": os.getpid()})
+            except Exception as e:
+                logger.warning(f"Heartbeat failed: {e}")
+            await asyncio.sleep(max(self._lease / 3, 1.0))
+
+    # ─── Store ───
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._store.get(key)
+
+    async def put(self, key: str, value: Any) -> None:
+        self._store[key] = value
+
+    async def delete(self, key: str) -> None:
+        self._store.pop(key, None)
+
+    async def items(self, prefix: str) -> Dict[str, Any]:
+        return {k: v for k, v in self._store.items() if k.startswith(prefix)}
+
+    # ─── Messages ───
+
+    def on(self, channel: str, handler: Handler) -> None:
+        """Call ``handler(message)`` (on the event loop) for messages of other workers."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        pass  # no other workers
+
+    def _encode(self, channel: str, message: Dict[str, Any]) -> bytes:
+        return dumps_bytes({"w": self.worker_id, "c": channel, "m": message})
+
+    def _dispatch(self, data: bytes) -> None:
+        """Hand a message received from another worker to the local handlers."""
+        try:
+            envelope = json.loads(data)
+        except ValueError:
+            return
+        if envelope.get("w") == self.worker_id:
+            return
+        for handler in self._handlers.get(envelope.get("c"), ()):
+            try:
+                handler(envelope.get("m") or {})
+            except Exception:
+                logger.exception(f"State message handler failed ({envelope.get('c')})")
+
+
+# ─── Workers on one host ───
+
+def _read_json(path: str) -> Optional[Any]:
+    try:
+        with open(path, "rb") as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class _Receiver(asyncio.DatagramProtocol):
+    def __init__(self, dispatch: Callable[[bytes], None]) -> None:
+        self._dispatch = dispatch
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        self._dispatch(data)
+
+
+class SocketBackend(StateBackend):
+    """Unix datagram sockets for messages, JSON files for the store."""
+
+    shared = True
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self._dir = directory
+        self._store_dir = os.path.join(directory, "store")
+        self._path = os.path.join(directory, f"{self.worker_id}.sock")
+        self._transport: Optional[asyncio.BaseTransport] = None
+        self._out: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+
+    async def start(self) -> None:
+        os.makedirs(self._store_dir, exist_ok=True)
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _Receiver(self._dispatch), local_addr=self._path, family=socket.AF_UNIX,
+        )
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._out.setblocking(False)
+        self._start_heartbeat()
+        logger.info(f"Worker {self.worker_id} sharing state via {self._dir}")
+
+    async def close(self) -> None:
+        await self._stop_heartbeat()
+        if self._transport is not None:
+            self._transport.close()
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        _unlink(self._path)
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self._store_dir, quote(key, safe="") + ".json")
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(_read_json, self._key_path(key))
+
+    async def put(self, key: str, value: Any) -> None:
+        await asyncio.to_thread(_write_atomic, self._key_path(key), dumps_bytes(value))
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(_unlink, self._key_path(key))
+
+    async def items(self, prefix: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._scan, prefix)
+
+    def _scan(self, prefix: str) -> Dict[str, Any]:
+        quoted = quote(prefix, safe="")
+        try:
+            names = os.listdir(self._store_dir)
+        except OSError:
+            return {}
+        found = {}
+        for name in names:
+            if name.startswith(quoted) and name.endswith(".json"):
+                value = _read_json(os.path.join(self._store_dir, name))
+                if value is not None:
+                    found[unquote(name[:-len(".json")])] = value
+        return found
+
+    def _peer_paths(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at >= _PEER_REFRESH:
+            try:
+                names = os.listdir(self._dir)
+            except OSError:
+                names = []
+            self._peers = [
+                os.path.join(self._dir, name) for name in names
+                if name.endswith(".sock") and os.path.join(self._dir, name) != self._path
+            ]
+            self._peers_at = now
+        return self._peers
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        if self._out is None:
+            return
+        data = self._encode(channel, message)
+        for path in self._peer_paths():
+            try:
+                self._out.sendto(data, path)
+            except ConnectionRefusedError:
+                # Socket left behind by a worker that died
+                _unlink(path)
+                self._peers_at = 0.0
+            except FileNotFoundError:
+                self._peers_at = 0.0
+            except BlockingIOError:
+                logger.warning(f"Worker {os.path.basename(path)} isn't reading; {channel} message dropped")
+            except OSError as e:
+                logger.warning(f"Message to worker {os.path.basename(path)} failed: {e}")
+
+
+# ─── Postgres ───
+
+class PostgresBackend(StateBackend):
+    """LISTEN/NOTIFY for messages, the shared_state table for the store."""
+
+    shared = True
+
+    def __init__(self, dsn: str) -> None:
+        super().__init__()
+        self._dsn = dsn  # plain postgresql:// URL for asyncpg
+        self._listen_task: Optional[asyncio.Task] = None
+        self._listening = asyncio.Event()
+
+    async def start(self) -> None:
+        self._listen_task = asyncio.create_task(self._listen())
+        self._start_heartbeat()
+        try:
+            await asyncio.wait_for(self._listening.wait(), timeout=10)
+            logger.info(f"Worker {self.worker_id} sharing state via Postgres")
+        except asyncio.TimeoutError:
+            logger.warning("Postgres LISTEN not ready yet; messages from other workers are missed until it is")
+
+    async def close(self) -> None:
+        await self._stop_heartbeat()
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            await asyncio.wait([self._listen_task])
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                conn = await asyncpg.connect(self._dsn)
+            except Exception as e:
+                logger.warning(f"Postgres LISTEN connection failed: {e}")
+                await asyncio.sleep(_RECONNECT_DELAY)
+                continue
+            lost = loop.create_future()
+            conn.add_termination_listener(lambda _conn: lost.done() or lost.set_result(None))
+            try:
+                await conn.add_listener(_CHANNEL, self._on_notify)
+                self._listening.set()
+                await lost
+                logger.warning("Postgres LISTEN connection lost; reconnecting")
+            finally:
+                self._listening.clear()
+                if not conn.is_closed():
+                    await conn.close()
+
+    def _on_notify(self, conn: Any, pid: int, channel: str, payload: str) -> None:
+        self._dispatch(payload.encode("utf-8"))
+
+    async def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        payload = self._encode(channel, message).decode("utf-8")
+        if len(payload) > _NOTIFY_MAX:
+            logger.warning(f"{channel} message too large for NOTIFY ({len(payload)} bytes); dropped")
+            return
+        try:
+            async with async_session_factory() as db:
+                await db.execute(select(func.pg_notify(_CHANNEL, payload)))
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"NOTIFY failed: {e}")
+
+    async def get(self, key: str) -> Optional[Any]:
+        async with async_session_factory() as db:
+            row = await db.get(SharedState, key)
+            return row.value if row else None
+
+    async def put(self, key: str, value: Any) -> None:
+        # Through dumps_bytes so values with non-JSON types store like on the wire
+        value = json.loads(dumps_bytes(value))
+        stmt = insert(SharedState).values(key=key, value=value, updated_at=datetime.utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SharedState.key],
+            set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+        )
+        async with async_session_factory() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def delete(self, key: str) -> None:
+        async with async_session_factory() as db:
+            await db.execute(delete(SharedState).where(SharedState.key == key))
+            await db.commit()
+
+    async def items(self, prefix: str) -> Dict[str, Any]:
+        async with async_session_factory() as db:
+            rows = (await db.execute(
+                select(SharedState).where(SharedState.key.startswith(prefix, autoescape=True))
+            )).scalars()
+            return {row.key: row.value for row in rows}
+
+
+_backend: Optional[StateBackend] = None
+
+
+def get_state_backend() -> StateBackend:
+    global _backend
+    if _backend is None:
+        settings = get_settings()
+        kind = settings.STATE_BACKEND
+        if kind == "socket":
+            _backend = SocketBackend(settings.STATE_SOCKET_DIR or os.path.join(settings.CACHE_DIR, "state"))
+        elif kind == "postgres":
+            _backend = PostgresBackend(settings.DATABASE_URL.replace("+asyncpg", "", 1))
+        else:
+            if kind != "local":
+                logger.warning(f"Unknown STATE_BACKEND {kind!r}; using local")
+            _backend = StateBackend()
+    return _backend
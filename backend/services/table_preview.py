@@ -0,0 +1,254 @@
+"""Paged previews of tabular output files — rows without loading the file.
+
+  - Parquet: only the row groups overlapping the requested range are read
+    (memory-mapped); the total row count comes from the footer.
+  - Arrow IPC (.arrow / .feather): memory-mapped, record batches located from
+    their lengths, so only the touched batches are materialised.
+  - CSV / TSV: streamed with the csv module up to offset + limit; the total
+    row count is unknown (``total_rows`` is None, ``has_more`` tells the UI
+    whether to offer the next page).
+
+``columns`` restricts the page to a subset of columns (columnar formats
+then only decode those).  ``stats`` adds per-column min / max / null count:
+exact and free for Parquet (row-group statistics in the footer), computed
+over the memory-mapped data for Arrow, and over the first _CSV_STATS_ROWS
+rows for CSV (``exact`` is false).
+
+pyarrow is optional; without it columnar files raise ImportError.
+"""
+
+import csv
+import datetime
+import itertools
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+_DELIMITERS = {".csv": ",", ".tsv": "\t"}
+# Rows sampled for CSV / TSV column stats
+_CSV_STATS_ROWS = 10_000
+PREVIEW_EXTENSIONS = (".parquet", ".arrow", ".feather", *_DELIMITERS)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    return str(value)
+
+
+def _page(columns: List[str], rows: List[list], offset: int, limit: int,
+          total: Optional[int], has_more: bool) -> Dict[str, Any]:
+    return {
+        "columns": columns,
+        "rows": rows,
+        "offset": offset,
+        "limit": limit,
+        "total_rows": total,
+        "has_more": has_more,
+    }
+
+
+def _select(all_columns: List[str], columns: Optional[List[str]]) -> List[str]:
+    if not columns:
+        return all_columns
+    missing = [c for c in columns if c not in all_columns]
+    if missing:
+        raise ValueError(f"Unknown columns: {', '.join(missing)}")
+    return columns
+
+
+def _stats(columns: Dict[str, Dict[str, Any]], exact: bool, rows: Optional[int]) -> Dict[str, Any]:
+    return {"exact": exact, "rows": rows, "columns": columns}
+
+
+def _rows_from_table(table) -> List[list]:
+    columns = [table.column(i).to_pylist() for i in range(table.num_columns)]
+    return [[_json_value(v) for v in row] for row in zip(*columns)]
+
+
+def _parquet_stats(meta, columns: List[str]) -> Dict[str, Any]:
+    found: Dict[str, Dict[str, Any]] = {}
+    exact = True
+    for i in range(meta.num_row_groups):
+        rg = meta.row_group(i)
+        for j in range(rg.num_columns):
+            chunk = rg.column(j)
+            name = chunk.path_in_schema
+            if name not in columns:
+                continue
+            col = found.setdefault(name, {"min": None, "max": None, "null_count": 0})
+            st = chunk.statistics
+            if st is None or not st.has_min_max:
+                exact = False
+                continue
+            if st.has_null_count:
+                col["null_count"] += st.null_count
+            try:
+                col["min"] = st.min if col["min"] is None else min(col["min"], st.min)
+                col["max"] = st.max if col["max"] is None else max(col["max"], st.max)
+            except TypeError:
+                exact = False
+    columns_stats = {
+        name: {k: _json_value(v) for k, v in found.get(name, {}).items()} for name in columns
+    }
+    return _stats(columns_stats, exact, meta.num_rows)
+
+
+def _preview_parquet(
+    path: str, offset: int, limit: int, columns: Optional[List[str]], stats: bool
+) -> Dict[str, Any]:
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(path, memory_map=True)
+    meta = pf.metadata
+    total = meta.num_rows
+    columns = _select(list(pf.schema_arrow.names), columns)
+    wanted, first_row, start = [], None, 0
+    for i in range(meta.num_row_groups):
+        n = meta.row_group(i).num_rows
+        if start + n > offset and start < offset + limit:
+            wanted.append(i)
+            if first_row is None:
+                first_row = start
+        start += n
+    page = _page(columns, [], offset, limit, total, offset + limit < total)
+    if wanted:
+        table = pf.read_row_groups(wanted, columns=columns).slice(offset - first_row, limit)
+        page["rows"] = _rows_from_table(table)
+    if stats:
+        page["stats"] = _parquet_stats(meta, columns)
+    return page
+
+
+def _arrow_stats(batches: list, columns: List[str]) -> Dict[str, Any]:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = pa.Table.from_batches(batches).select(columns)
+    found: Dict[str, Dict[str, Any]] = {}
+    exact = True
+    for name in columns:
+        col = table.column(name)
+        entry: Dict[str, Any] = {"min": None, "max": None, "null_count": col.null_count}
+        try:
+            mm = pc.min_max(col)
+            entry["min"], entry["max"] = _json_value(mm["min"].as_py()), _json_value(mm["max"].as_py())
+        except (pa.ArrowNotImplementedError, pa.ArrowInvalid):
+            exact = False
+        found[name] = entry
+    return _stats(found, exact, table.num_rows)
+
+
+def _preview_arrow(
+    path: str, offset: int, limit: int, columns: Optional[List[str]], stats: bool
+) -> Dict[str, Any]:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    with pa.memory_map(path, "r") as source:
+        try:
+            reader = ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            reader = ipc.open_stream(source)
+            batches = iter(reader)
+        columns = _select(list(reader.schema.names), columns)
+        picked, start, first_row = [], 0, None
+        every = [] if stats else None
+        for batch in batches:
+            if every is not None:
+                every.append(batch)  # zero-copy views of the mapped file
+            n = batch.num_rows
+            if start + n > offset and start < offset + limit:
+                picked.append(batch)
+                if first_row is None:
+                    first_row = start
+            start += n
+        page = _page(columns, [], offset, limit, start, offset + limit < start)
+        if picked:
+            table = pa.Table.from_batches(picked).select(columns).slice(offset - first_row, limit)
+            page["rows"] = _rows_from_table(table)
+        if every is not None:
+            page["stats"] = _arrow_stats(every, columns) if every else _stats({}, True, 0)
+    return page
+
+
+def _csv_stats(path: str, delimiter: str, header: List[str], columns: List[str]) -> Dict[str, Any]:
+    idx = [header.index(c) for c in columns]
+    nulls = [0] * len(idx)
+    lows: List[Optional[float]] = [None] * len(idx)
+    highs: List[Optional[float]] = [None] * len(idx)
+    numeric = [True] * len(idx)
+    n = 0
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        next(reader, None)
+        for row in itertools.islice(reader, _CSV_STATS_ROWS):
+            n += 1
+            for k, i in enumerate(idx):
+                cell = row[i].strip() if i < len(row) else ""
+                if cell == "" or cell.lower() in ("nan", "na", "null", "none"):
+                    nulls[k] += 1
+                    continue
+                if not numeric[k]:
+                    continue
+                try:
+                    value = float(cell)
+                except ValueError:
+                    numeric[k] = False
+                    continue
+                lows[k] = value if lows[k] is None else min(lows[k], value)
+                highs[k] = value if highs[k] is None else max(highs[k], value)
+    found = {
+        name: {
+            "min": _json_value(lows[k]) if numeric[k] else None,
+            "max": _json_value(highs[k]) if numeric[k] else None,
+            "null_count": nulls[k],
+        }
+        for k, name in enumerate(columns)
+    }
+    return _stats(found, False, n)
+
+
+def _preview_delimited(
+    path: str, offset: int, limit: int, delimiter: str, columns: Optional[List[str]], stats: bool
+) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, [])
+        columns = _select(header, columns)
+        rows = list(itertools.islice(reader, offset, offset + limit))
+        has_more = next(reader, None) is not None
+    if columns != header:
+        idx = [header.index(c) for c in columns]
+        rows = [[row[i] if i < len(row) else "" for i in idx] for row in rows]
+    page = _page(columns, rows, offset, limit, None, has_more)
+    if stats:
+        page["stats"] = _csv_stats(path, delimiter, header, columns)
+    return page
+
+
+def preview_table(
+    path: str, offset: int = 0, limit: int = 100,
+    columns: Optional[List[str]] = None, stats: bool = False,
+) -> Dict[str, Any]:
+    """Rows [offset, offset + limit) of a tabular file, plus its column names.
+
+    Raises ValueError for unsupported extensions or unknown ``columns``.
+    """
+    name = path.lower()
+    if name.endswith(".parquet"):
+        return _preview_parquet(path, offset, limit, columns, stats)
+    if name.endswith((".arrow", ".feather")):
+        return _preview_arrow(path, offset, limit, columns, stats)
+    ext = os.path.splitext(name)[1]
+    if ext in _DELIMITERS:
+        return _preview_delimited(path, offset, limit, _DELIMITERS[ext], columns, stats)
+    raise ValueError(f"No table preview for {os.path.basename(path)}")
@@ -0,0 +1,170 @@
+"""In-memory index of UPLOADS_DIR for list_files.
+
+Entries are added and removed by UploadManager as uploads are stored and
+deleted (in the worker threads that do that filesystem work), so a listing
+is served from memory: a slice of a sorted view that is rebuilt only when
+the index changes.  The first listing builds the index in a worker thread;
+after that, an index older than UPLOAD_INDEX_REFRESH_INTERVAL is reconciled
+with the directory (files added or removed by other means) in the
+background while the current one keeps being served.
+
+``version`` changes with every change to the listing; together with the
+per-process ``generation`` it is the listing's ETag.
+"""
+
+import asyncio
+import logging
+import mimetypes
+import os
+import stat
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from config import get_settings
+from models.schemas import FileInfo
+
+logger = logging.getLogger("aigen.upload_index")
+
+
+def _entry(uploads: str, name: str) -> Optional[FileInfo]:
+    """FileInfo for a listed upload; None for companions, directories and vanished files."""
+    if name.endswith(".extracted.txt") or name.startswith("."):
+        return None
+    try:
+        st = os.stat(os.path.join(uploads, name))
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return FileInfo(
+        filename=name,
+        size=st.st_size,
+        type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+        uploaded_at=datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+    )
+
+
+def _sort_key(key: str):
+    if key == "filename":
+        return lambda f: f.filename.lower()
+    if key == "size":
+        return lambda f: f.size
+    return lambda f: f.uploaded_at
+
+
+class UploadIndex:
+    """Singleton listing of UPLOADS_DIR kept in memory."""
+
+    _instance: Optional["UploadIndex"] = None
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self._uploads = settings.UPLOADS_DIR
+        self._refresh_interval = settings.UPLOAD_INDEX_REFRESH_INTERVAL
+        self._entries: Dict[str, FileInfo] = {}
+        self._views: Dict[Tuple[str, bool], List[FileInfo]] = {}
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        # Changes made while a reconcile scans the directory win over its result
+        self._overlay: Optional[Dict[str, Optional[FileInfo]]] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.generation = uuid.uuid4().hex[:8]
+        self.version = 0
+
+    @classmethod
+    def get_instance(cls) -> "UploadIndex":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.generation}-{self.version:x}"'
+
+    # ─── Updates (blocking; called from worker threads) ───
+
+    def _set(self, name: str, info: Optional[FileInfo]) -> None:
+        # Caller holds the lock
+        if self._overlay is not None:
+            self._overlay[name] = info
+        if info is None:
+            if self._entries.pop(name, None) is None:
+                return
+        else:
+            self._entries[name] = info
+        self._views.clear()
+        self.version += 1
+
+    def note_stored(self, name: str) -> None:
+        """An upload was stored under ``name`` (stats it)."""
+        info = _entry(self._uploads, name)
+        with self._lock:
+            self._set(name, info)
+
+    def note_removed(self, name: str) -> None:
+        with self._lock:
+            self._set(name, None)
+
+    def reconcile(self) -> None:
+        """Re-list UPLOADS_DIR and apply whatever changed behind our back."""
+        with self._lock:
+            self._overlay = {}
+        try:
+            try:
+                names = os.listdir(self._uploads)
+            except OSError:
+                names = []
+            scanned = {}
+            for name in names:
+                info = _entry(self._uploads, name)
+                if info is not None:
+                    scanned[name] = info
+        finally:
+            with self._lock:
+                overlay, self._overlay = self._overlay, None
+        with self._lock:
+            for name, info in overlay.items():
+                if info is None:
+                    scanned.pop(name, None)
+                else:
+                    scanned[name] = info
+            if scanned != self._entries:
+                self._entries = scanned
+                self._views.clear()
+                self.version += 1
+            self._loaded_at = time.monotonic()
+
+    # ─── Reads ───
+
+    async def ensure_fresh(self) -> None:
+        """Build the index on first use; afterwards refresh a stale one in the background."""
+        stale = (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at >= self._refresh_interval
+        )
+        if stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh())
+        if self._loaded_at is None:
+            await asyncio.shield(self._refresh_task)
+
+    async def _refresh(self) -> None:
+        try:
+            await asyncio.to_thread(self.reconcile)
+        except Exception as e:
+            logger.warning(f"Upload index refresh failed: {e}")
+
+    def page(
+        self, sort: str = "uploaded_at", descending: bool = True,
+        offset: int = 0, limit: Optional[int] = None,
+    ) -> Tuple[List[FileInfo], int]:
+        """(entries[offset:offset + limit] in the given order, total count)."""
+        with self._lock:
+            view = self._views.get((sort, descending))
+            if view is None:
+                view = sorted(self._entries.values(), key=_sort_key(sort), reverse=descending)
+                self._views[(sort, descending)] = view
+        end = None if limit is None else offset + limit
+        return view[offset:end], len(view)
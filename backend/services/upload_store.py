@@ -0,0 +1,196 @@
+"""Content-addressed storage behind UPLOADS_DIR.
+
+Upload bytes are stored once per SHA-256 under
+``UPLOAD_STORE_DIR/blobs/ab/<sha>``; the names users see
+(``UPLOADS_DIR/<filename>``) are aliases of a blob — hardlinks where the
+filesystem allows, else symlinks, else copies — so list_files, the /uploads
+static mount and code reading uploads by path keep working on plain paths.
+The text extracted from a blob is stored once as ``<sha>.txt`` and aliased as
+``<filename>.extracted.txt`` in the same way.  The store lives outside
+UPLOADS_DIR so the /uploads mount never serves blobs or the index.
+
+``UPLOAD_STORE_DIR/aliases.json`` maps each alias to its blob; a blob (and
+its text) is removed when its last alias is deleted.  Files placed in
+UPLOADS_DIR by other means are not in the index and are treated as ordinary
+files.
+
+Blobs are made read-only, but that does not stop root (the default in the
+container): code running as root that opens an upload for writing changes
+every alias sharing the blob.  Write results to new files.
+
+All methods are blocking (call them via asyncio.to_thread) and serialised
+by one lock.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("aigen.upload_store")
+
+BLOB_DIR = "blobs"
+_INDEX = "aliases.json"
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_sha256(value: str) -> bool:
+    return bool(_SHA256_RE.match(value))
+
+
+def _link(src: str, dest: str) -> None:
+    """Make ``dest`` an alias of ``src``: hardlink, else symlink, else copy."""
+    try:
+        os.link(src, dest)
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.relpath(src, os.path.dirname(dest)), dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class BlobStore:
+    """Blobs keyed by SHA-256 plus the alias index of one uploads directory."""
+
+    def __init__(self, uploads: str, root: str) -> None:
+        self.uploads = uploads
+        self.root = root
+        self._blobs = os.path.join(root, BLOB_DIR)
+        self._lock = threading.Lock()
+        self._aliases: Optional[Dict[str, str]] = None
+
+    # ─── Paths / index ───
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self._blobs, digest[:2], digest)
+
+    def _text_path(self, digest: str) -> str:
+        return self.blob_path(digest) + ".txt"
+
+    def _index(self) -> Dict[str, str]:
+        if self._aliases is None:
+            try:
+                with open(os.path.join(self.root, _INDEX), "r", encoding="utf-8") as f:
+                    aliases = json.load(f)
+            except (OSError, ValueError):
+                aliases = {}
+            # Drop aliases deleted behind our back
+            self._aliases = {
+                name: digest for name, digest in aliases.items()
+                if os.path.lexists(os.path.join(self.uploads, name))
+            }
+        return self._aliases
+
+    def _save_index(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, _INDEX)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._aliases, f)
+        os.replace(tmp, path)
+
+    def has_blob(self, digest: str) -> bool:
+        return os.path.isfile(self.blob_path(digest))
+
+    # ─── Writes ───
+
+    def store(
+        self,
+        part: Optional[str],
+        digest: str,
+        filename: str,
+        size: int,
+        text: Optional[Callable[[str], str]] = None,
+    ) -> Dict:
+        """Adopt ``part`` as blob ``digest`` (dropped if the blob exists) and alias it.
+
+        ``part`` may be None when the blob is already stored (hash-first
+        upload).  A name that already aliases the same blob is reused; a name
+        taken by other content gets a ``_N`` suffix.  ``text(blob_path)``
+        returns the text preview, called only if the blob has none yet.
+        """
+        blob = self.blob_path(digest)
+        with self._lock:
+            aliases = self._index()
+            if os.path.isfile(blob):
+                if part:
+                    _remove(part)
+            elif part:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(part, blob)
+                # Aliases share the inode: keep writes through one name from
+                # changing the rest (not enforced for root, see module docstring)
+                os.chmod(blob, 0o444)
+            else:
+                raise FileNotFoundError(digest)
+
+            if aliases.get(filename) == digest:
+                name, created = filename, False
+            else:
+                name, created = self._free_name(filename), True
+                _link(blob, os.path.join(self.uploads, name))
+                os.utime(blob)  # hardlinked aliases share the mtime list_files shows
+                aliases[name] = digest
+                self._save_index()
+
+            text_content = None
+            if text is not None:
+                text_path = self._text_path(digest)
+                if os.path.isfile(text_path):
+                    with open(text_path, "r", encoding="utf-8") as f:
+                        text_content = f.read()
+                else:
+                    text_content = text(blob)
+                    with open(text_path, "w", encoding="utf-8") as f:
+                        f.write(text_content)
+                companion = os.path.join(self.uploads, name + ".extracted.txt")
+                if not os.path.lexists(companion):
+                    _link(text_path, companion)
+
+        logger.info(
+            f"Upload {'stored' if created else 'unchanged'}: {name} "
+            f"({size:,} bytes, sha256 {digest[:12]})"
+        )
+        return {"filename": name, "text_content": text_content, "size": size, "sha256": digest}
+
+    def _free_name(self, safe_name: str) -> str:
+        base, ext = os.path.splitext(safe_name)
+        name, counter = safe_name, 1
+        while os.path.lexists(os.path.join(self.uploads, name)):
+            name = f"{base}_{counter}{ext}"
+            counter += 1
+        return name
+
+    def remove(self, name: str) -> bool:
+        """Delete an alias and its text companion; the blob goes with its last alias.
+
+        Returns False if there is no such file.
+        """
+        path = os.path.join(self.uploads, name)
+        with self._lock:
+            if not os.path.isfile(path):
+                return False
+            _remove(path)
+            _remove(os.path.join(self.uploads, name + ".extracted.txt"))
+            aliases = self._index()
+            digest = aliases.pop(name, None)
+            if digest is None:
+                return True
+            self._save_index()
+            if digest not in aliases.values():
+                _remove(self.blob_path(digest))
+                _remove(self._text_path(digest))
+                logger.info(f"Blob {digest[:12]} removed (no aliases left)")
+            return True
@@ -0,0 +1,379 @@
+"""Streaming, resumable uploads into UPLOADS_DIR.
+
+Uploads are never held in memory: chunks are appended to a ``.part`` file
+from a worker thread while a SHA-256 of the content and a text preview (the
+first _PREVIEW_CHARS characters, for text formats) are computed from the same
+bytes, so nothing is read back afterwards.  Finished uploads go into the
+content-addressed store (services/upload_store.py): identical content is
+kept once, and an upload whose hash is already known needs no bytes at all.
+
+Two ways in:
+  - ``receive()`` consumes a whole multipart UploadFile (POST /api/data/upload);
+  - chunked sessions (POST /api/data/uploads, PUT chunks at an offset, then
+    complete) for multi-GB files.  Session state lives next to the partial
+    data in ``UPLOAD_STORE_DIR/partial`` (outside the served UPLOADS_DIR) so
+    an interrupted upload resumes from the bytes already on disk, also after
+    a restart.
+
+The ``.part`` file is the session's only state: chunks are appended under
+an flock on it and the offset is its size, so chunks of one session may
+reach different workers.  Each process hashes the bytes it appends itself
+and catches up on bytes appended elsewhere (the file only grows) before its
+next write or the completion.
+"""
+
+import asyncio
+import codecs
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional
+
+from config import get_settings
+from services.upload_index import UploadIndex
+from services.upload_store import BlobStore
+
+logger = logging.getLogger("aigen.uploads")
+
+_PARTIAL_DIR = "partial"
+# Bytes handed to a worker thread per write
+_WRITE_BUFFER = 1024 * 1024
+# Characters of text kept as the extracted preview
+_PREVIEW_CHARS = 1_000_000
+
+TEXT_EXTENSIONS = {".txt", ".csv", ".tsv", ".json", ".jsonl", ".md", ".xml", ".yaml", ".yml", ".log"}
+
+
+class UploadOffsetMismatch(Exception):
+    """A chunk was sent for an offset other than the bytes received so far."""
+
+    def __init__(self, expected: int) -> None:
+        super().__init__(f"Expected offset {expected}")
+        self.expected = expected
+
+
+class _TextPreview:
+    """Incrementally decodes the head of a text upload (utf-8, lenient)."""
+
+    def __init__(self) -> None:
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._parts: list = []
+        self._chars = 0
+
+    @property
+    def full(self) -> bool:
+        return self._chars >= _PREVIEW_CHARS
+
+    def feed(self, data: bytes) -> None:
+        if self.full:
+            return
+        text = self._decoder.decode(data)[: _PREVIEW_CHARS - self._chars]
+        self._parts.append(text)
+        self._chars += len(text)
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+
+@dataclass
+class UploadSession:
+    upload_id: str
+    filename: str
+    size: Optional[int] = None  # declared total, if the client knows it
+    offset: int = 0  # size of the .part file when last seen
+    hashed: int = 0  # bytes of the .part file fed to hasher / preview by this process
+    created_at: float = field(default_factory=time.time)
+    hasher: "hashlib._Hash" = field(default_factory=hashlib.sha256, repr=False)
+    preview: Optional[_TextPreview] = field(default=None, repr=False)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def to_json(self) -> dict:
+        return {"upload_id": self.upload_id, "filename": self.filename,
+                "size": self.size, "created_at": self.created_at}
+
+
+def _wants_preview(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS
+
+
+def _append(path: str, data: bytes, hasher, preview: Optional[_TextPreview]) -> None:
+    """Worker-thread part of a write: append, hash, feed the preview."""
+    with open(path, "ab") as f:
+        f.write(data)
+    hasher.update(data)
+    if preview is not None:
+        preview.feed(data)
+
+
+def _lock_part(path: str) -> int:
+    """Open ``path`` and take an exclusive flock on it (blocking); close the fd to release."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _catch_up(session: "UploadSession", fd: int) -> int:
+    """Feed bytes appended by other processes to the session's hash; returns the .part size."""
+    size = os.fstat(fd).st_size
+    while session.hashed < size:
+        data = os.pread(fd, min(_WRITE_BUFFER, size - session.hashed), session.hashed)
+        if not data:
+            break
+        session.hasher.update(data)
+        if session.preview is not None:
+            session.preview.feed(data)
+        session.hashed += len(data)
+    session.offset = size
+    return size
+
+
+def _read_preview(path: str) -> str:
+    preview = _TextPreview()
+    with open(path, "rb") as f:
+        while not preview.full and (data := f.read(_WRITE_BUFFER)):
+            preview.feed(data)
+    return preview.text()
+
+
+class UploadManager:
+    """Singleton owning chunked-upload sessions and the upload write path."""
+
+    _instance: Optional["UploadManager"] = None
+
+    def __init__(self) -> None:
+        self._sessions: Dict[str, UploadSession] = {}
+        self._store: Optional[BlobStore] = None
+
+    @classmethod
+    def get_instance(cls) -> "UploadManager":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    # ─── Paths ───
+
+    @staticmethod
+    def _partial_dir() -> str:
+        return os.path.join(get_settings().UPLOAD_STORE_DIR, _PARTIAL_DIR)
+
+    def _partial(self, upload_id: str, suffix: str) -> str:
+        return os.path.join(self._partial_dir(), f"{upload_id}{suffix}")
+
+    @property
+    def store(self) -> BlobStore:
+        settings = get_settings()
+        uploads, root = settings.UPLOADS_DIR, settings.UPLOAD_STORE_DIR
+        if self._store is None or (self._store.uploads, self._store.root) != (uploads, root):
+            self._store = BlobStore(uploads, root)
+        return self._store
+
+    # ─── Finalizing ───
+
+    def _finalize(self, part: Optional[str], filename: str, digest: str, size: int,
+                  preview: Optional[_TextPreview]) -> Dict:
+        """Hand a complete .part (None: blob already stored) to the blob store."""
+        text = None
+        if _wants_preview(filename):
+            text = (lambda blob: preview.text()) if preview is not None else _read_preview
+        result = self.store.store(part, digest, filename, size, text)
+        UploadIndex.get_instance().note_stored(result["filename"])
+        return result
+
+    async def link(self, filename: str, digest: str) -> Optional[Dict]:
+        """Store ``filename`` as an alias of a known blob; None if the hash is unknown."""
+        store = self.store
+
+        def attach() -> Optional[Dict]:
+            if not store.has_blob(digest):
+                return None
+            try:
+                size = os.path.getsize(store.blob_path(digest))
+                return self._finalize(None, filename, digest, size, None)
+            except FileNotFoundError:  # removed meanwhile
+                return None
+
+        return await asyncio.to_thread(attach)
+
+    async def delete(self, name: str) -> bool:
+        """Remove an uploaded file (an alias) and, with its last alias, the blob.
+
+        Returns False if there is no such file.
+        """
+        def remove() -> bool:
+            if not self.store.remove(name):
+                return False
+            UploadIndex.get_instance().note_removed(name)
+            return True
+
+        return await asyncio.to_thread(remove)
+
+    # ─── Single-request upload ───
+
+    async def receive(self, filename: str, chunks: AsyncIterator[bytes]) -> Dict:
+        """Stream ``chunks`` to disk and store them as ``filename`` (already sanitized)."""
+        os.makedirs(self._partial_dir(), exist_ok=True)
+        part = self._partial(uuid.uuid4().hex, ".part")
+        hasher = hashlib.sha256()
+        preview = _TextPreview() if _wants_preview(filename) else None
+        size = 0
+        try:
+            async for data in _buffered(chunks):
+                await asyncio.to_thread(_append, part, data, hasher, preview)
+                size += len(data)
+            if size == 0:
+                open(part, "wb").close()
+            return await asyncio.to_thread(
+                self._finalize, part, filename, hasher.hexdigest(), size, preview
+            )
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+
+    # ─── Chunked, resumable sessions ───
+
+    async def create(self, filename: str, size: Optional[int]) -> UploadSession:
+        await asyncio.to_thread(self._prune_stale)
+        session = UploadSession(upload_id=uuid.uuid4().hex, filename=filename, size=size)
+        if _wants_preview(filename):
+            session.preview = _TextPreview()
+
+        def init() -> None:
+            os.makedirs(self._partial_dir(), exist_ok=True)
+            open(self._partial(session.upload_id, ".part"), "wb").close()
+            with open(self._partial(session.upload_id, ".json"), "w", encoding="utf-8") as f:
+                json.dump(session.to_json(), f)
+
+        await asyncio.to_thread(init)
+        self._sessions[session.upload_id] = session
+        return session
+
+    async def get(self, upload_id: str) -> Optional[UploadSession]:
+        """The session with its current offset, loaded from disk if this process doesn't have it.
+
+        None if it doesn't exist (also when another worker completed or
+        aborted it).
+        """
+        if not upload_id.isalnum():
+            return None
+        session = self._sessions.get(upload_id)
+        if session is None:
+            loaded = await asyncio.to_thread(self._load, upload_id)
+            if loaded is None:
+                return None
+            # Another request may have loaded it meanwhile
+            session = self._sessions.setdefault(upload_id, loaded)
+        try:
+            session.offset = (await asyncio.to_thread(os.stat, self._partial(upload_id, ".part"))).st_size
+        except OSError:
+            self._sessions.pop(upload_id, None)
+            return None
+        return session
+
+    def _load(self, upload_id: str) -> Optional[UploadSession]:
+        """Session metadata only; the hash catches up from the .part on first use."""
+        try:
+            with open(self._partial(upload_id, ".json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if "filename" not in meta:
+            return None
+        return UploadSession(
+            upload_id=upload_id, filename=meta["filename"], size=meta.get("size"),
+            created_at=meta.get("created_at", time.time()),
+            preview=_TextPreview() if _wants_preview(meta["filename"]) else None,
+        )
+
+    async def write(self, session: UploadSession, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """Append a chunk sent for ``offset``; returns the new offset.
+
+        A retried chunk that overlaps bytes already received is rejected
+        with UploadOffsetMismatch carrying the offset to resume from.
+        """
+        async with session.lock:
+            part = self._partial(session.upload_id, ".part")
+            fd = await asyncio.to_thread(_lock_part, part)
+            try:
+                size = await asyncio.to_thread(_catch_up, session, fd)
+                if offset != size:
+                    raise UploadOffsetMismatch(size)
+                async for data in _buffered(chunks):
+                    await asyncio.to_thread(_append, part, data, session.hasher, session.preview)
+                    session.offset += len(data)
+                    session.hashed += len(data)
+                return session.offset
+            finally:
+                os.close(fd)
+
+    async def complete(self, session: UploadSession) -> Dict:
+        async with session.lock:
+            part = self._partial(session.upload_id, ".part")
+            fd = await asyncio.to_thread(_lock_part, part)
+            try:
+                size = await asyncio.to_thread(_catch_up, session, fd)
+                if session.size is not None and size != session.size:
+                    raise UploadOffsetMismatch(size)
+                result = await asyncio.to_thread(
+                    self._finalize, part, session.filename,
+                    session.hasher.hexdigest(), size, session.preview,
+                )
+                self._discard(session.upload_id)
+                return result
+            finally:
+                os.close(fd)
+
+    async def abort(self, upload_id: str) -> None:
+        await asyncio.to_thread(self._discard, upload_id)
+
+    def _discard(self, upload_id: str) -> None:
+        self._sessions.pop(upload_id, None)
+        for suffix in (".part", ".json"):
+            try:
+                os.remove(self._partial(upload_id, suffix))
+            except OSError:
+                pass
+
+    def _prune_stale(self) -> None:
+        """Drop sessions untouched for UPLOAD_SESSION_TTL seconds."""
+        partial_dir = self._partial_dir()
+        if not os.path.isdir(partial_dir):
+            return
+        cutoff = time.time() - get_settings().UPLOAD_SESSION_TTL
+        for name in os.listdir(partial_dir):
+            upload_id, _, suffix = name.partition(".")
+            if suffix != "part":
+                continue
+            try:
+                stale = os.stat(os.path.join(partial_dir, name)).st_mtime < cutoff
+            except OSError:
+                continue
+            if stale:
+                self._discard(upload_id)
+                logger.info(f"Stale upload session {upload_id} removed")
+
+
+async def _buffered(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Coalesce small network chunks into _WRITE_BUFFER-sized writes."""
+    buf = bytearray()
+    async for chunk in chunks:
+        buf += chunk
+        if len(buf) >= _WRITE_BUFFER:
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
+
+
+async def iter_upload_file(file, chunk_size: int = _WRITE_BUFFER) -> AsyncIterator[bytes]:
+    """Chunks of a Starlette UploadFile without reading it whole."""
+    while data := await file.read(chunk_size):
+        yield data
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# Tests import backend modules the way the app does (``from tools...``)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def data_dirs(tmp_path, monkeypatch):
+    """Point UPLOADS_DIR / UPLOAD_STORE_DIR / OUTPUTS_DIR at fresh temp dirs."""
+    from config import get_settings
+    from services.upload_index import UploadIndex
+    from services.uploads import UploadManager
+
+    settings = get_settings()
+    dirs = {}
+    for key, name in (("UPLOADS_DIR", "uploads"), ("UPLOAD_STORE_DIR", "upload_store"),
+                      ("OUTPUTS_DIR", "outputs")):
+        path = tmp_path / name
+        path.mkdir()
+        monkeypatch.setattr(settings, key, str(path))
+        dirs[name] = path
+    # Singletons bound to the previous directories
+    monkeypatch.setattr(UploadIndex, "_instance", None)
+    monkeypatch.setattr(UploadManager, "_instance", None)
+    return dirs
+
+
+@pytest.fixture
+def client(data_dirs):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from routers.files import router
+
+    app = FastAPI()
+    app.include_router(router)
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,84 @@
+import pytest
+
+CONTENT = bytes(range(256)) * 4  # 1024 bytes
+URL = "/api/outputs/conv1/7/data.bin"
+
+
+@pytest.fixture
+def output_file(data_dirs):
+    step_dir = data_dirs["outputs"] / "conv1" / "step_7"
+    step_dir.mkdir(parents=True)
+    path = step_dir / "data.bin"
+    path.write_bytes(CONTENT)
+    return path
+
+
+def test_full_response_has_validators(client, output_file):
+    r = client.get(URL)
+    assert r.status_code == 200
+    assert r.content == CONTENT
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["etag"].startswith('"')
+
+
+def test_if_none_match_revalidates(client, output_file):
+    etag = client.get(URL).headers["etag"]
+    r = client.get(URL, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert client.get(URL, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_etag_changes_with_content(client, output_file):
+    etag = client.get(URL).headers["etag"]
+    output_file.write_bytes(CONTENT + b"more")
+    assert client.get(URL, headers={"If-None-Match": etag}).status_code == 200
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-9", 0, 9),
+    ("bytes=100-199", 100, 199),
+    ("bytes=1000-", 1000, 1023),
+    ("bytes=1000-5000", 1000, 1023),
+    ("bytes=-24", 1000, 1023),
+    ("bytes=-5000", 0, 1023),
+])
+def test_single_range(client, output_file, header, start, end):
+    r = client.get(URL, headers={"Range": header})
+    assert r.status_code == 206
+    assert r.content == CONTENT[start:end + 1]
+    assert r.headers["content-range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+    assert r.headers["content-length"] == str(end - start + 1)
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=2000-3000", "bytes=20-10"])
+def test_unsatisfiable_range(client, output_file, header):
+    r = client.get(URL, headers={"Range": header})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "bytes=-", "items=0-5", "bytes=a-b"])
+def test_multiple_or_malformed_range_sends_whole_file(client, output_file, header):
+    r = client.get(URL, headers={"Range": header})
+    assert r.status_code == 200
+    assert r.content == CONTENT
+
+
+def test_if_range_current_etag_gets_range(client, output_file):
+    etag = client.get(URL).headers["etag"]
+    r = client.get(URL, headers={"Range": "bytes=0-3", "If-Range": etag})
+    assert r.status_code == 206
+    assert r.content == CONTENT[:4]
+
+
+def test_if_range_stale_etag_gets_whole_file(client, output_file):
+    etag = client.get(URL).headers["etag"]
+    output_file.write_bytes(b"replaced")
+    r = client.get(URL, headers={"Range": "bytes=0-3", "If-Range": etag})
+    assert r.status_code == 200
+    assert r.content == b"replaced"
+
+
+def test_missing_output_is_404(client, data_dirs):
+    assert client.get("/api/outputs/conv1/7/nope.bin").status_code == 404
@@ -0,0 +1,155 @@
+import random
+
+import pytest
+
+from tools.segment_tokenizer import SegmentTokenizer, tokenize_response
+
+XML = {
+    "think_format": None,
+    "code_execute_format": "<execute>",
+    "code_result_format": "<observation>",
+    "solution_format": "<solution>",
+}
+BRACKET = {
+    "think_format": "[THINK]",
+    "code_execute_format": "[EXECUTE]",
+    "code_result_format": "[OBSERVATION]",
+    "solution_format": "[SOLUTION]",
+}
+
+
+def _stream(text, behavior=XML, chunk=3):
+    tok = SegmentTokenizer(behavior)
+    events = []
+    for i in range(0, len(text), chunk):
+        events += tok.feed(text[i:i + chunk])
+    return tok.finish(events), events
+
+
+def _replay(events):
+    """Rebuild the segment list a client sees from the event stream."""
+    segments = []
+    for e in events:
+        if e.kind == "open":
+            assert e.index == len(segments)
+            segments.append({"type": e.type, "content": ""})
+        elif e.kind == "delta":
+            assert segments[e.index]["type"] == e.type
+            segments[e.index]["content"] += e.content
+        elif e.kind == "reset":
+            del segments[e.index:]
+            segments.append({"type": e.type, "content": e.content})
+    return segments
+
+
+def test_blocks_in_order():
+    text = (
+        "Plan first.\n<execute>\nprint(1)\n</execute>\n"
+        "<observation>1</observation>\nSo <solution>done</solution>"
+    )
+    result = tokenize_response(text, XML)
+    assert result.segments == [
+        {"type": "text", "content": "Plan first."},
+        {"type": "code", "content": "print(1)"},
+        {"type": "output", "content": "1"},
+        {"type": "text", "content": "So"},
+        {"type": "solution", "content": "done"},
+    ]
+    assert result.code_blocks == ["\nprint(1)\n"]
+    assert result.solution == "done"
+    assert result.reasoning == "Plan first.\n\n\nSo"
+
+
+def test_thinking_keeps_nested_blocks_but_reports_code():
+    text = "<think>try <execute>x = 1</execute> then</think>Answer"
+    result = tokenize_response(text, XML)
+    assert result.thinking == "try <execute>x = 1</execute> then"
+    assert result.code_blocks == ["x = 1"]
+    assert result.segments[-1] == {"type": "text", "content": "Answer"}
+
+
+def test_markdown_fence_is_code_and_reasoning():
+    result = tokenize_response("See:\n```python\nx = 1\n```\nok", XML)
+    assert {"type": "code", "content": "x = 1"} in result.segments
+    assert "```python\nx = 1\n```" in result.reasoning
+    assert result.code_blocks == []
+
+
+def test_mentioned_execute_does_not_swallow_solution():
+    text = "I will respond with <execute> blocks…\n<solution>The answer is 42</solution>"
+    result = tokenize_response(text, XML)
+    assert result.solution == "The answer is 42"
+    assert result.segments == [
+        {"type": "text", "content": "I will respond with <execute> blocks…"},
+        {"type": "solution", "content": "The answer is 42"},
+    ]
+    assert result.code_blocks == []
+
+
+def test_mentioned_tag_before_real_blocks():
+    text = (
+        "Use <execute> or <solution> tags.\n"
+        "<execute>print(2)</execute>\n<observation>2</observation>\n"
+        "```python\ny = 2\n```\n<solution>two</solution>"
+    )
+    result = tokenize_response(text, XML)
+    assert result.code_blocks == ["print(2)"]
+    assert result.solution == "two"
+    assert [s["type"] for s in result.segments] == ["text", "code", "output", "code", "solution"]
+    assert result.segments[0]["content"] == "Use <execute> or <solution> tags."
+
+
+def test_unclosed_execute_at_end_is_text():
+    result = tokenize_response("Next I will <execute> the plan", XML)
+    assert result.code_blocks == []
+    assert result.segments == [{"type": "text", "content": "Next I will <execute> the plan"}]
+    assert result.reasoning == "Next I will"
+
+
+def test_reopened_execute_keeps_the_second_block():
+    result = tokenize_response("<execute> then <execute>print(3)</execute>", XML)
+    assert result.code_blocks == ["print(3)"]
+
+
+def test_unclosed_solution_counts():
+    result = tokenize_response("Done.\n<solution>partial answer", XML)
+    assert result.solution == "partial answer"
+
+
+def test_solution_only_in_behavior_format():
+    result = tokenize_response("<solution>xml</solution>[SOLUTION]bracket[/SOLUTION]", BRACKET)
+    assert result.solution == "bracket"
+    assert [s["content"] for s in result.segments] == ["xml", "bracket"]
+
+
+def test_unclosed_thinking_rescans_tail():
+    result = tokenize_response("<think>hmm <execute>a = 1</execute>", XML)
+    assert result.code_blocks == ["a = 1"]
+    assert result.thinking == ""
+
+
+@pytest.mark.parametrize("text", [
+    "I will respond with <execute> blocks…\n<solution>The answer is 42</solution>",
+    "Use <execute> or <solution> tags.\n<execute>print(2)</execute>\n<observation>2</observation>",
+    "<think>a</think>\n\n<execute>x</execute>   tail  <solution>",
+    "```python\nx = 1\n```\n[EXECUTE]y[/EXECUTE]",
+])
+@pytest.mark.parametrize("chunk", [1, 2, 5, 64])
+def test_streaming_matches_oneshot(text, chunk):
+    result, events = _stream(text, XML, chunk)
+    assert result == tokenize_response(text, XML)
+    assert _replay(events) == result.segments
+
+
+def test_streamed_events_add_up_to_segments_for_random_input():
+    pieces = [
+        "hello ", "\n\n", "  ", "<think>", "</think>", "<execute>", "</execute>",
+        "<observation>", "</observation>", "<solution>", "</solution>",
+        "```python\n", "```", "[THINK]", "[/THINK]", "[EXECUTE]", "[/EXECUTE]", "x=1\n",
+    ]
+    rng = random.Random(7)
+    for _ in range(2000):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+        result, events = _stream(text, XML, rng.randint(1, 6))
+        assert _replay(events) == result.segments, text
+        assert result == tokenize_response(text, XML), text
@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+
+from services.uploads import UploadManager, UploadOffsetMismatch
+
+DATA = b"gene,value\n" + b"".join(b"G%d,%d\n" % (i, i) for i in range(5000))
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_chunked_upload_resumes_at_offset(client, data_dirs):
+    r = client.post("/api/data/uploads", json={"filename": "table.csv", "size": len(DATA)})
+    upload_id = r.json()["upload_id"]
+    assert r.json()["offset"] == 0
+
+    half = len(DATA) // 2
+    r = client.put(f"/api/data/uploads/{upload_id}?offset=0", content=DATA[:half])
+    assert r.json()["offset"] == half
+
+    # A retried chunk for bytes already received is refused with the resume point
+    r = client.put(f"/api/data/uploads/{upload_id}?offset=0", content=DATA[:half])
+    assert r.status_code == 409
+    assert r.json()["offset"] == half
+
+    # Completing early reports how far the upload got
+    r = client.post(f"/api/data/uploads/{upload_id}/complete")
+    assert r.status_code == 409
+    assert r.json()["offset"] == half
+
+    assert client.get(f"/api/data/uploads/{upload_id}").json()["offset"] == half
+    client.put(f"/api/data/uploads/{upload_id}?offset={half}", content=DATA[half:])
+    r = client.post(f"/api/data/uploads/{upload_id}/complete")
+    assert r.status_code == 200
+    body = r.json()
+    assert body["filename"] == "table.csv"
+    assert body["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert body["text_content"] == DATA.decode()
+    assert (data_dirs["uploads"] / "table.csv").read_bytes() == DATA
+    # The session is gone, and nothing partial is left behind
+    assert client.get(f"/api/data/uploads/{upload_id}").status_code == 404
+    assert not list((data_dirs["upload_store"] / "partial").iterdir())
+
+
+def test_session_survives_restart(client, data_dirs, monkeypatch):
+    upload_id = client.post("/api/data/uploads", json={"filename": "a.bin"}).json()["upload_id"]
+    client.put(f"/api/data/uploads/{upload_id}?offset=0", content=DATA[:100])
+
+    monkeypatch.setattr(UploadManager, "_instance", None)  # a new process
+    assert client.get(f"/api/data/uploads/{upload_id}").json()["offset"] == 100
+    client.put(f"/api/data/uploads/{upload_id}?offset=100", content=DATA[100:])
+    body = client.post(f"/api/data/uploads/{upload_id}/complete").json()
+    assert body["sha256"] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_abort_discards_partial_data(client, data_dirs):
+    upload_id = client.post("/api/data/uploads", json={"filename": "a.bin"}).json()["upload_id"]
+    client.put(f"/api/data/uploads/{upload_id}?offset=0", content=b"abc")
+    assert client.delete(f"/api/data/uploads/{upload_id}").status_code == 200
+    assert client.get(f"/api/data/uploads/{upload_id}").status_code == 404
+    assert not list((data_dirs["upload_store"] / "partial").iterdir())
+
+
+def test_workers_share_a_session(data_dirs):
+    """Chunks of one session reaching different workers: the .part file and its
+    flock are the only shared state; each worker catches up on the other's bytes."""
+    async def run():
+        first, second = UploadManager(), UploadManager()
+        session = await first.create("a.csv", len(DATA))
+        other = await second.get(session.upload_id)
+        assert other is not session
+
+        await first.write(session, 0, _chunks(DATA[:1000]))
+        await second.write(await second.get(session.upload_id), 1000, _chunks(DATA[1000:3000]))
+        await first.write(await first.get(session.upload_id), 3000, _chunks(DATA[3000:]))
+        return await second.complete(await second.get(session.upload_id))
+
+    result = asyncio.run(run())
+    assert result["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert (data_dirs["uploads"] / "a.csv").read_bytes() == DATA
+
+
+def test_concurrent_writes_at_one_offset(data_dirs):
+    """Two workers racing for the same offset: the flock lets one append, the
+    other sees the grown file and gets the new offset back."""
+    async def run():
+        first, second = UploadManager(), UploadManager()
+        session = await first.create("a.bin", None)
+        other = await second.get(session.upload_id)
+        return await asyncio.gather(
+            first.write(session, 0, _chunks(b"x" * 4096)),
+            second.write(other, 0, _chunks(b"y" * 4096)),
+            return_exceptions=True,
+        ), first._partial(session.upload_id, ".part")
+
+    results, part = asyncio.run(run())
+    assert sorted(type(r).__name__ for r in results) == ["UploadOffsetMismatch", "int"]
+    mismatch = next(r for r in results if isinstance(r, UploadOffsetMismatch))
+    assert mismatch.expected == 4096
+    with open(part, "rb") as f:
+        assert f.read() in (b"x" * 4096, b"y" * 4096)
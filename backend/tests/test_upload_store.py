@@ -0,0 +1,78 @@
+import hashlib
+
+import pytest
+
+DATA = b"gene,value\n" + b"".join(b"G%d,%d\n" % (i, i) for i in range(5000))
+
+
+def _blobs(data_dirs):
+    return [p for p in (data_dirs["upload_store"] / "blobs").rglob("*") if p.is_file()]
+
+
+def test_identical_uploads_share_one_blob(client, data_dirs):
+    a = client.post("/api/data/upload", files={"file": ("a.csv", DATA)}).json()
+    b = client.post("/api/data/upload", files={"file": ("b.csv", DATA)}).json()
+    assert a["sha256"] == b["sha256"]
+    assert len([p for p in _blobs(data_dirs) if not p.name.endswith(".txt")]) == 1
+    assert (data_dirs["uploads"] / "b.csv").read_bytes() == DATA
+    assert (data_dirs["uploads"] / "b.csv.extracted.txt").read_text() == DATA.decode()
+
+
+def test_same_name_other_content_gets_suffix(client, data_dirs):
+    client.post("/api/data/upload", files={"file": ("a.csv", b"one")})
+    body = client.post("/api/data/upload", files={"file": ("a.csv", b"two")}).json()
+    assert body["filename"] == "a_1.csv"
+    again = client.post("/api/data/upload", files={"file": ("a.csv", b"one")}).json()
+    assert again["filename"] == "a.csv"
+
+
+def test_delete_keeps_blob_until_last_alias(client, data_dirs):
+    client.post("/api/data/upload", files={"file": ("a.csv", DATA)})
+    client.post("/api/data/upload", files={"file": ("b.csv", DATA)})
+
+    assert client.delete("/api/data/a.csv").status_code == 200
+    assert not (data_dirs["uploads"] / "a.csv").exists()
+    assert not (data_dirs["uploads"] / "a.csv.extracted.txt").exists()
+    assert (data_dirs["uploads"] / "b.csv").read_bytes() == DATA
+    assert _blobs(data_dirs)
+
+    assert client.delete("/api/data/b.csv").status_code == 200
+    assert _blobs(data_dirs) == []
+    assert client.delete("/api/data/b.csv").status_code == 404
+
+
+def test_upload_by_hash(client, data_dirs):
+    digest = hashlib.sha256(DATA).hexdigest()
+    r = client.post("/api/data/upload/by-hash", json={"filename": "c.csv", "sha256": digest})
+    assert r.status_code == 404
+
+    client.post("/api/data/upload", files={"file": ("a.csv", DATA)})
+    r = client.post("/api/data/upload/by-hash", json={"filename": "c.csv", "sha256": digest})
+    assert r.status_code == 200
+    assert r.json()["size"] == len(DATA)
+    assert (data_dirs["uploads"] / "c.csv").read_bytes() == DATA
+
+    # The blob outlives the alias it was first uploaded under
+    client.delete("/api/data/a.csv")
+    assert (data_dirs["uploads"] / "c.csv").read_bytes() == DATA
+
+
+@pytest.mark.parametrize("digest", ["abc", "z" * 64])
+def test_upload_by_hash_rejects_bad_digest(client, digest):
+    r = client.post("/api/data/upload/by-hash", json={"filename": "c.csv", "sha256": digest})
+    assert r.status_code == 400
+
+
+def test_listing_follows_uploads_and_deletes(client, data_dirs):
+    client.post("/api/data/upload", files={"file": ("a.csv", b"one")})
+    client.post("/api/data/upload", files={"file": ("b.csv", b"two")})
+    r = client.get("/api/data/list", params={"sort": "filename", "order": "asc"})
+    assert [f["filename"] for f in r.json()] == ["a.csv", "b.csv"]
+    assert r.headers["x-total-count"] == "2"
+
+    etag = r.headers["etag"]
+    assert client.get("/api/data/list", headers={"If-None-Match": etag}).status_code == 304
+    client.delete("/api/data/a.csv")
+    r = client.get("/api/data/list", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert [f["filename"] for f in r.json()] == ["b.csv"]
@@ -3,22 +3,63 @@
 Ported from inference.py _execute_code_subprocess() (lines 1414-1551).
 Runs user code in a subprocess with preamble/postamble for matplotlib patching,
 _prev_data.json loading, and auto-save of figures/tables.
+
+With CODE_EXEC_MODE="kernel" Python code runs in a warm per-conversation
+worker from tools.kernel_pool instead of a fresh interpreter; with "fork" it
+runs in a child forked from a preloaded zygote (tools.kernel_pool.ForkServer).
+
+execute_stream() yields stdout/stderr as it is produced; output kept for the
+result is capped at CODE_OUTPUT_MAX_CHARS per stream (head + tail, the middle
+is dropped as it arrives).
+
+Every execution runs under CODE_MEMORY_LIMIT_MB / CODE_CPU_TIME_LIMIT (see
+tools.resource_limits) and reports its CPU time and peak RSS in the result.
+
+Steps iterate in the same step_<id> directory, so outputs are tracked in a
+``_manifest.json`` there (size, mtime, sha256 per file): each result reports
+only the figures / tables that are new or whose content changed.
 """
 
 import asyncio
+import codecs
+import hashlib
+import json
 import logging
 import os
 import re
+import selectors
+import signal
 import subprocess
 import sys
 import tempfile
+import time
+from collections import deque
 from dataclasses import dataclass, field
+from functools import partial
+from typing import AsyncIterator, Union
 
 from config import get_settings
 from langfuse.decorators import observe, langfuse_context
+from tools.kernel_pool import ForkServer, JobHandle, KernelPool, KernelTimeout, capture_files
+from tools.resource_limits import (
+    ExecLimits, create_exec_cgroup, describe_exit, limit_process, rusage_usage,
+)
 
 logger = logging.getLogger("aigen.code_executor")
 
+# Wall-clock limit per code block (seconds)
+_EXEC_TIMEOUT = 60
+# Pipe / capture-file read size and capture-file poll interval for streaming
+_READ_CHUNK = 64 * 1024
+_TAIL_INTERVAL = 0.1
+
+# Per-step-directory record of already reported outputs
+_MANIFEST = "_manifest.json"
+_FRAME_EXPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frame_export.py")
+_HASH_CHUNK = 1024 * 1024
+
+_STREAM_TRUNCATED = "\n... [output truncated — the end is shown when the block finishes] ...\n"
+
 
 @dataclass
 class CodeExecutionResult:
@@ -29,6 +70,87 @@ class CodeExecutionResult:
     stderr: str = ""
     figures: list[str] = field(default_factory=list)
     tables: list[str] = field(default_factory=list)
+    # New outputs with url / name / kind / size / sha256 (figures and tables are their URLs)
+    artifacts: list[dict] = field(default_factory=list)
+    cpu_time_s: float = 0.0
+    peak_rss_mb: float = 0.0
+    limit_exceeded: str = ""  # "cpu" | "memory" | ""
+
+    def usage(self) -> dict:
+        return {
+            "cpu_time_s": round(self.cpu_time_s, 3),
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+            "limit_exceeded": self.limit_exceeded,
+        }
+
+
+@dataclass
+class ExecutionChunk:
+    """Incremental output from CodeExecutor.execute_stream()."""
+
+    stream: str  # "stdout" | "stderr"
+    text: str
+
+
+class OutputCap:
+    """Bounded text buffer keeping the first and last max_chars / 2 characters.
+
+    The middle is discarded as it arrives, so a block printing gigabytes never
+    holds more than max_chars in memory.
+    """
+
+    def __init__(self, max_chars: int) -> None:
+        self._head_max = max_chars // 2
+        self._tail_max = max_chars - self._head_max
+        self._head: list[str] = []
+        self._head_len = 0
+        self._tail: deque[str] = deque()
+        self._tail_len = 0
+        self.dropped = 0
+
+    def write(self, text: str) -> None:
+        if self._head_len < self._head_max:
+            part = text[: self._head_max - self._head_len]
+            self._head.append(part)
+            self._head_len += len(part)
+            text = text[len(part):]
+        if not text:
+            return
+        self._tail.append(text)
+        self._tail_len += len(text)
+        while self._tail_len > self._tail_max:
+            excess = self._tail_len - self._tail_max
+            first = self._tail[0]
+            if len(first) <= excess:
+                self._tail.popleft()
+                cut = len(first)
+            else:
+                self._tail[0] = first[excess:]
+                cut = excess
+            self._tail_len -= cut
+            self.dropped += cut
+
+    def getvalue(self) -> str:
+        head, tail = "".join(self._head), "".join(self._tail)
+        if self.dropped:
+            return f"{head}\n\n... [{self.dropped:,} characters truncated] ...\n\n{tail}"
+        return head + tail
+
+
+class _FileTail:
+    """Incrementally reads text appended to a capture file."""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._pos = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def read(self) -> str:
+        with open(self._path, "rb") as f:
+            f.seek(self._pos)
+            data = f.read(_READ_CHUNK)
+        self._pos += len(data)
+        return self._decoder.decode(data)
 
 
 class CodeExecutor:
@@ -50,7 +172,7 @@ class CodeExecutor:
         )
         
         langfuse_context.update_current_span(
-            output={"success": res.success, "stdout": res.stdout, "stderr": res.stderr}
+            output={"success": res.success, "stdout": res.stdout, "stderr": res.stderr, **res.usage()}
         )
         return res
 
@@ -61,9 +183,42 @@ class CodeExecutor:
     def _execute_sync(
         self, code: str, language: str, conv_id: str, step_id: str
     ) -> CodeExecutionResult:
-        out_dir = os.path.join(
-            self._settings.OUTPUTS_DIR, str(conv_id), f"step_{step_id}"
-        ).replace("\\", "/")
+        out_dir, full_code, ext, cmd_prefix = self._prepare(code, language, conv_id, step_id)
+
+        mode = self._mode(language)
+        status = _new_status()
+        if mode in ("kernel", "fork"):
+            stdout, stderr = self._run_warm(mode, full_code, conv_id, out_dir, status)
+        else:
+            stdout, stderr = self._run_subprocess(full_code, ext, cmd_prefix, out_dir, status)
+        self._check_memory_error(status, stderr)
+
+        # Both runners already cap each stream at CODE_OUTPUT_MAX_CHARS
+        artifacts = self._collect_outputs(out_dir, conv_id, step_id)
+        return CodeExecutionResult(
+            success=status["success"],
+            stdout=stdout,
+            stderr=stderr,
+            figures=_urls(artifacts, "figure"),
+            tables=_urls(artifacts, "table"),
+            artifacts=artifacts,
+            cpu_time_s=status["cpu_time_s"],
+            peak_rss_mb=status["peak_rss_mb"],
+            limit_exceeded=status["limit_exceeded"],
+        )
+
+    def _mode(self, language: str) -> str:
+        return self._settings.CODE_EXEC_MODE if language == "python" else "subprocess"
+
+    def _prepare(
+        self, code: str, language: str, conv_id: str, step_id: str
+    ) -> tuple[str, str, str, list[str]]:
+        """Create the output dir and wrap ``code``; returns (out_dir, full_code, ext, cmd_prefix)."""
+        base = os.path.normpath(self._settings.OUTPUTS_DIR)
+        out_dir = os.path.normpath(os.path.join(base, str(conv_id), f"step_{step_id}"))
+        if os.path.commonpath([base, out_dir]) != base:
+            raise ValueError(f"Invalid output path for conversation {conv_id!r}, step {step_id!r}")
+        out_dir = out_dir.replace("\\", "/")
         os.makedirs(out_dir, exist_ok=True)
 
         if language == "r":
@@ -83,54 +238,305 @@ class CodeExecutor:
             if has_main_def and not has_main_call:
                 code += "\n\nmain()\n"
 
-        full_code = preamble + code + postamble
+        return out_dir, preamble + code + postamble, ext, cmd_prefix
 
-        tmp_file = None
+    def _run_subprocess(
+        self, full_code: str, ext: str, cmd_prefix: list[str], out_dir: str, status: dict
+    ) -> tuple[str, str]:
+        """Blocking run with blocking pipe reads (called from the worker thread)."""
+        max_chars = self._settings.CODE_OUTPUT_MAX_CHARS
+        caps = {"stdout": OutputCap(max_chars), "stderr": OutputCap(max_chars)}
+        limits = ExecLimits.from_settings(self._settings)
+        cgroup = create_exec_cgroup(self._settings, limits)
+        proc = script = None
+        timed_out = False
         try:
-            tmp_file = tempfile.NamedTemporaryFile(
-                mode="w", suffix=ext, delete=False, encoding="utf-8"
-            )
-            tmp_file.write(full_code)
-            tmp_file.close()
-
-            proc = subprocess.run(
-                cmd_prefix + [tmp_file.name],
-                capture_output=True,
-                text=True,
-                timeout=60,
+            proc, script = self._popen(full_code, ext, cmd_prefix, out_dir, limits, cgroup)
+            deadline = time.monotonic() + _EXEC_TIMEOUT
+            with selectors.DefaultSelector() as sel:
+                for pipe, name in ((proc.stdout, "stdout"), (proc.stderr, "stderr")):
+                    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                    sel.register(pipe, selectors.EVENT_READ, (name, decoder))
+                while sel.get_map() and not timed_out:
+                    remaining = deadline - time.monotonic()
+                    timed_out = remaining <= 0
+                    for key, _ in sel.select(max(remaining, 0)):
+                        name, decoder = key.data
+                        data = os.read(key.fd, _READ_CHUNK)
+                        if data:
+                            caps[name].write(decoder.decode(data))
+                        else:
+                            sel.unregister(key.fileobj)
+            exited = None
+            while not timed_out and exited is None:
+                exited = _wait4_nohang(proc.pid)
+                if exited is None:
+                    timed_out = time.monotonic() >= deadline
+                    time.sleep(_TAIL_INTERVAL)
+            if timed_out:
+                status["error"] = f"Code execution timed out ({_EXEC_TIMEOUT}s limit)"
+                _kill_group(proc.pid)
+                exited = os.wait4(proc.pid, 0)
+            _record_exit(proc, exited[1], exited[2], status, limits)
+        except Exception as e:
+            status["error"] = str(e)
+            if proc is not None and proc.returncode is None:
+                _kill_group(proc.pid)
+                proc.wait()
+        finally:
+            self._cleanup_subprocess(proc, script, cgroup, status, limits)
+        if status["error"]:
+            caps["stderr"].write(status["error"])
+        stdout, stderr = caps["stdout"].getvalue(), caps["stderr"].getvalue()
+        logger.info(
+            f"[exec] success={status['success']}, stdout={len(stdout)}c, stderr={len(stderr)}c, "
+            f"cpu={status['cpu_time_s']:.2f}s, peak_rss={status['peak_rss_mb']:.0f}MB, cwd={out_dir}"
+        )
+        if stderr.strip():
+            logger.debug(f"[exec] stderr: {stderr[:300]}")
+        return stdout, stderr
+
+    def _popen(
+        self, full_code: str, ext: str, cmd_prefix: list[str], out_dir: str,
+        limits: ExecLimits, cgroup,
+    ) -> tuple[subprocess.Popen, str]:
+        """Write the script to a temp file and start it; returns (proc, script path)."""
+        if ext == ".py":
+            # Line-buffered pipes: one chunk per printed line, not per write()
+            full_code = (
+                "import sys as _sys\n"
+                "_sys.stdout.reconfigure(line_buffering=True)\n"
+                "_sys.stderr.reconfigure(line_buffering=True)\n"
+            ) + full_code
+        fd, script = tempfile.mkstemp(suffix=ext)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(full_code)
+        try:
+            # Popen + wait4 rather than subprocess.run: wait4 returns the
+            # child's rusage (CPU time, peak RSS) along with its exit status
+            proc = subprocess.Popen(
+                [*cmd_prefix, script],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.DEVNULL,
                 cwd=out_dir,
+                # Docker images often set PYTHONUNBUFFERED, which would undo the line buffering
+                env={k: v for k, v in os.environ.items() if k != "PYTHONUNBUFFERED"},
+                start_new_session=True,
             )
+        except Exception:
+            os.unlink(script)
+            raise
+        limit_process(proc.pid, limits, cgroup)
+        return proc, script
 
-            stdout = proc.stdout or ""
-            stderr = proc.stderr or ""
-            success = proc.returncode == 0
-            logger.info(
-                f"[exec] rc={proc.returncode}, "
-                f"stdout={len(stdout)}c, stderr={len(stderr)}c, cwd={out_dir}"
+    @staticmethod
+    def _cleanup_subprocess(proc, script, cgroup, status: dict, limits: ExecLimits) -> None:
+        if cgroup is not None:
+            usage = cgroup.finish()
+            status["cpu_time_s"] = usage.get("cpu_s", status["cpu_time_s"])
+            status["peak_rss_mb"] = usage.get("peak_rss_mb", status["peak_rss_mb"])
+            if usage.get("limit"):
+                status["limit_exceeded"] = usage["limit"]
+                status["error"] = status["error"] or f"\nMemory limit exceeded ({limits.memory_mb} MB)"
+        if proc is not None:
+            proc.stdout.close()
+            proc.stderr.close()
+        if script:
+            os.unlink(script)
+
+    def _warm_call(
+        self, mode: str, full_code: str, conv_id: str, out_dir: str, capture, handle=None
+    ) -> partial:
+        limits = ExecLimits.from_settings(self._settings)
+        if mode == "fork":
+            return partial(
+                ForkServer.get_instance().run, full_code, out_dir, _EXEC_TIMEOUT, capture, limits, handle
             )
-            if stderr.strip():
-                logger.debug(f"[exec] stderr: {stderr[:300]}")
-        except subprocess.TimeoutExpired:
-            stdout = ""
-            stderr = "Code execution timed out (60s limit)"
-            success = False
-        except Exception as e:
-            stdout = ""
-            stderr = str(e)
-            success = False
-        finally:
-            if tmp_file and os.path.exists(tmp_file.name):
-                os.unlink(tmp_file.name)
+        return partial(
+            KernelPool.get_instance().run,
+            str(conv_id), full_code, out_dir, _EXEC_TIMEOUT, capture, limits, handle,
+        )
 
-        figures, tables = self._collect_outputs(out_dir, conv_id, step_id)
-        return CodeExecutionResult(
-            success=success,
-            stdout=stdout,
+    def _run_warm(
+        self, mode: str, full_code: str, conv_id: str, out_dir: str, status: dict
+    ) -> tuple[str, str]:
+        """Blocking warm run; the capture files are read in chunks through OutputCap."""
+        max_chars = self._settings.CODE_OUTPUT_MAX_CHARS
+        caps = {"stdout": OutputCap(max_chars), "stderr": OutputCap(max_chars)}
+        with capture_files() as (out, err):
+            try:
+                _apply_run_result(status, self._warm_call(mode, full_code, conv_id, out_dir, (out, err))())
+            except KernelTimeout:
+                status["error"] = f"Code execution timed out ({_EXEC_TIMEOUT}s limit)"
+            except Exception as e:
+                status["error"] = str(e)
+            for name, path in (("stdout", out), ("stderr", err)):
+                tail = _FileTail(path)
+                while text := tail.read():
+                    caps[name].write(text)
+        if status["error"]:
+            caps["stderr"].write(status["error"])
+        stdout, stderr = caps["stdout"].getvalue(), caps["stderr"].getvalue()
+        logger.info(
+            f"[exec:{mode}] success={status['success']}, stdout={len(stdout)}c, stderr={len(stderr)}c, "
+            f"cpu={status['cpu_time_s']:.2f}s, peak_rss={status['peak_rss_mb']:.0f}MB, cwd={out_dir}"
+        )
+        if stderr.strip():
+            logger.debug(f"[exec:{mode}] stderr: {stderr[:300]}")
+        return stdout, stderr
+
+    def _check_memory_error(self, status: dict, stderr: str) -> None:
+        """Attribute a MemoryError under CODE_MEMORY_LIMIT_MB to the limit."""
+        if status["success"] or status["limit_exceeded"] or not self._settings.CODE_MEMORY_LIMIT_MB:
+            return
+        if "MemoryError" in stderr[-2000:]:
+            status["limit_exceeded"] = "memory"
+
+    # ------------------------------------------------------------------
+    # Streaming execution
+    # ------------------------------------------------------------------
+
+    async def execute_stream(
+        self, code: str, language: str, conv_id: str, step_id: str
+    ) -> AsyncIterator[Union[ExecutionChunk, CodeExecutionResult]]:
+        """Like execute(), but yields ExecutionChunks while the code runs.
+
+        The last item is the CodeExecutionResult.  Streamed chunks stop once a
+        stream has sent half of CODE_OUTPUT_MAX_CHARS; the result carries the
+        capped head + tail.
+        """
+        out_dir, full_code, ext, cmd_prefix = await asyncio.to_thread(
+            self._prepare, code, language, conv_id, step_id
+        )
+        max_chars = self._settings.CODE_OUTPUT_MAX_CHARS
+        caps = {"stdout": OutputCap(max_chars), "stderr": OutputCap(max_chars)}
+        sent = {"stdout": 0, "stderr": 0}
+        budget = max_chars // 2
+        status = _new_status()
+
+        mode = self._mode(language)
+        if mode in ("kernel", "fork"):
+            source = self._stream_warm(mode, full_code, conv_id, out_dir, status)
+        else:
+            source = self._stream_subprocess(full_code, ext, cmd_prefix, out_dir, status)
+
+        async for stream, text in source:
+            caps[stream].write(text)
+            if sent[stream] < budget:
+                part = text[: budget - sent[stream]]
+                yield ExecutionChunk(stream, part)
+                if len(part) < len(text):
+                    yield ExecutionChunk(stream, _STREAM_TRUNCATED)
+            sent[stream] += len(text)
+
+        if status["error"]:
+            caps["stderr"].write(status["error"])
+        stderr = caps["stderr"].getvalue()
+        self._check_memory_error(status, stderr)
+        logger.info(
+            f"[exec:{mode}:stream] success={status['success']}, "
+            f"stdout={sent['stdout']}c, stderr={sent['stderr']}c, "
+            f"cpu={status['cpu_time_s']:.2f}s, peak_rss={status['peak_rss_mb']:.0f}MB, cwd={out_dir}"
+        )
+        artifacts = await asyncio.to_thread(self._collect_outputs, out_dir, conv_id, step_id)
+        yield CodeExecutionResult(
+            success=status["success"],
+            stdout=caps["stdout"].getvalue(),
             stderr=stderr,
-            figures=figures,
-            tables=tables,
+            figures=_urls(artifacts, "figure"),
+            tables=_urls(artifacts, "table"),
+            artifacts=artifacts,
+            cpu_time_s=status["cpu_time_s"],
+            peak_rss_mb=status["peak_rss_mb"],
+            limit_exceeded=status["limit_exceeded"],
         )
 
+    async def _stream_subprocess(
+        self, full_code: str, ext: str, cmd_prefix: list[str], out_dir: str, status: dict
+    ) -> AsyncIterator[tuple[str, str]]:
+        limits = ExecLimits.from_settings(self._settings)
+        cgroup = create_exec_cgroup(self._settings, limits)
+        loop = asyncio.get_running_loop()
+        proc = script = None
+        reaper = None
+        pumps: list[asyncio.Task] = []
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump(pipe, name: str) -> None:
+            reader = asyncio.StreamReader()
+            transport, _ = await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), pipe
+            )
+            try:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                while data := await reader.read(_READ_CHUNK):
+                    await queue.put((name, decoder.decode(data)))
+            finally:
+                transport.close()
+                await queue.put((name, None))
+
+        try:
+            proc, script = await asyncio.to_thread(
+                self._popen, full_code, ext, cmd_prefix, out_dir, limits, cgroup
+            )
+            reaper = asyncio.ensure_future(asyncio.to_thread(os.wait4, proc.pid, 0))
+            pumps = [
+                asyncio.create_task(pump(proc.stdout, "stdout")),
+                asyncio.create_task(pump(proc.stderr, "stderr")),
+            ]
+            deadline = loop.time() + _EXEC_TIMEOUT
+            open_streams = 2
+            while open_streams:
+                name, text = await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0))
+                if text is None:
+                    open_streams -= 1
+                elif text:
+                    yield name, text
+            await asyncio.wait_for(asyncio.shield(reaper), max(deadline - loop.time(), 0.1))
+        except asyncio.TimeoutError:
+            status["error"] = f"Code execution timed out ({_EXEC_TIMEOUT}s limit)"
+        except Exception as e:
+            status["error"] = str(e)
+        finally:
+            if reaper is not None:
+                if not reaper.done():
+                    _kill_group(proc.pid)
+                _, wait_status, rusage = await reaper
+                _record_exit(proc, wait_status, rusage, status, limits)
+            for task in pumps:
+                task.cancel()
+            # The pumps' transports own the pipes and close them
+            self._cleanup_subprocess(None, script, cgroup, status, limits)
+
+    async def _stream_warm(
+        self, mode: str, full_code: str, conv_id: str, out_dir: str, status: dict
+    ) -> AsyncIterator[tuple[str, str]]:
+        with capture_files() as (out, err):
+            handle = JobHandle()
+            call = self._warm_call(mode, full_code, conv_id, out_dir, (out, err), handle)
+            job = asyncio.ensure_future(asyncio.to_thread(call))
+            tails = {"stdout": _FileTail(out), "stderr": _FileTail(err)}
+            try:
+                while True:
+                    finished = job.done()
+                    for name, tail in tails.items():
+                        while text := tail.read():
+                            yield name, text
+                    if finished:
+                        break
+                    await asyncio.wait({job}, timeout=_TAIL_INTERVAL)
+            finally:
+                if not job.done():
+                    # Consumer went away (stop / run cancelled): don't let the code run on
+                    handle.cancel()
+            try:
+                _apply_run_result(status, job.result())
+            except KernelTimeout:
+                status["error"] = f"Code execution timed out ({_EXEC_TIMEOUT}s limit)"
+            except Exception as e:
+                status["error"] = str(e)
+
     # ------------------------------------------------------------------
     # Preamble / Postamble  (inference.py lines 1432-1491)
     # ------------------------------------------------------------------
@@ -144,7 +550,9 @@ class CodeExecutor:
             "import matplotlib.pyplot as _plt\n"
             f"_out_dir = {repr(out_dir)}\n"
             f"_data_dir = {repr(out_dir)}\n"
-            "_fig_count = [0]\n"
+            "# Number new figures after earlier iterations' so they aren't overwritten\n"
+            "_fig_count = [max([int(_f[4:-4]) for _f in _os.listdir(_out_dir)\n"
+            "                   if _f.startswith('fig_') and _f.endswith('.png') and _f[4:-4].isdigit()] or [0])]\n"
             "# Load previous step results if available\n"
             "results = {}\n"
             "_prev_path = _os.path.join(_out_dir, '_prev_data.json')\n"
@@ -181,6 +589,7 @@ class CodeExecutor:
         )
 
     def _build_python_postamble(self, out_dir: str) -> str:
+        s = self._settings
         return (
             "\n# --- auto-save cleanup ---\n"
             "import matplotlib.pyplot as _plt2\n"
@@ -188,38 +597,146 @@ class CodeExecutor:
             "    _fig_count[0] += 1\n"
             f"    _plt2.savefig(f'{out_dir}/fig_{{_fig_count[0]}}.png', dpi=100, bbox_inches='tight')\n"
             "    _plt2.close('all')\n"
+            "# --- DataFrame export (tools/frame_export.py) ---\n"
             "try:\n"
-            "    import pandas as _pd\n"
-            "    _tbl_count = 0\n"
-            "    for _vname, _vval in list(locals().items()):\n"
-            "        if isinstance(_vval, _pd.DataFrame) and not _vname.startswith('_'):\n"
-            "            _tbl_count += 1\n"
-            f"            _vval.to_csv(f'{out_dir}/table_{{_tbl_count}}.csv', index=False)\n"
-            "except ImportError:\n"
-            "    pass\n"
+            "    import sys as _sys\n"
+            "    _fx = _sys.modules.get('_aigen_frame_export')\n"
+            "    if _fx is None:\n"
+            "        import importlib.util as _ilu\n"
+            f"        _spec = _ilu.spec_from_file_location('_aigen_frame_export', {_FRAME_EXPORT!r})\n"
+            "        _fx = _ilu.module_from_spec(_spec)\n"
+            "        _spec.loader.exec_module(_fx)\n"
+            "        _sys.modules['_aigen_frame_export'] = _fx\n"
+            f"    _fx.export_frames(dict(locals()), {out_dir!r}, {s.CODE_TABLE_FORMAT!r},\n"
+            f"                      {s.CODE_TABLE_CSV_MAX_CELLS}, {s.CODE_TABLE_PREVIEW_ROWS})\n"
+            "except Exception as _fx_err:\n"
+            "    print(f'[table export failed] {_fx_err}', file=_sys.stderr)\n"
         )
 
     # ------------------------------------------------------------------
     # Output collection
     # ------------------------------------------------------------------
 
-    def _collect_outputs(
-        self, out_dir: str, conv_id: str, step_id: str
-    ) -> tuple[list[str], list[str]]:
-        """Scan out_dir for .png (figures) and .csv (tables), return URL paths."""
-        figures: list[str] = []
-        tables: list[str] = []
+    def _collect_outputs(self, out_dir: str, conv_id: str, step_id: str) -> list[dict]:
+        """Figures, tables and data exports in out_dir that are new since the last execution.
+
+        Files whose size and mtime match the manifest are skipped without
+        reading; changed ones are hashed, and a file rewritten with identical
+        content (e.g. the same DataFrame auto-saved again) is not reported.
+        """
         if not os.path.isdir(out_dir):
-            return figures, tables
+            return []
+        manifest = _load_manifest(out_dir)
+        entries: dict[str, dict] = {}
+        artifacts: list[dict] = []
 
-        for f in sorted(os.listdir(out_dir)):
-            if f.startswith("_"):
+        with os.scandir(out_dir) as it:
+            files = sorted((e for e in it if e.is_file()), key=lambda e: e.name)
+        for entry in files:
+            name = entry.name
+            if name.startswith("_"):
+                continue
+            if name.endswith(".png"):
+                kind = "figure"
+            elif name.endswith(".csv"):
+                kind = "table"
+            elif name.endswith((".parquet", ".arrow")):
+                kind = "data"  # full export of a large frame; its .preview.csv is the table
+            else:
                 continue
-            url = f"/api/outputs/{conv_id}/step_{step_id}/{f}"
-            if f.endswith(".png"):
-                figures.append(url)
-            elif f.endswith(".csv"):
-                tables.append(url)
-
-        logger.debug(f"[exec] outputs: figures={len(figures)}, tables={len(tables)}")
-        return figures, tables
+            st = entry.stat()
+            known = manifest.get(name)
+            if known and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+                entries[name] = known
+                continue
+            try:
+                digest = _sha256(entry.path)
+            except OSError:
+                continue
+            entries[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+            if known and known["sha256"] == digest:
+                continue
+            artifacts.append({
+                "url": f"/api/outputs/{conv_id}/step_{step_id}/{name}",
+                "name": name,
+                "kind": kind,
+                "size": st.st_size,
+                "sha256": digest,
+            })
+
+        if entries != manifest:
+            _save_manifest(out_dir, entries)
+        logger.debug(
+            f"[exec] outputs: {len(artifacts)} new of {len(entries)} "
+            f"(figures={len(_urls(artifacts, 'figure'))}, tables={len(_urls(artifacts, 'table'))})"
+        )
+        return artifacts
+
+
+def _new_status() -> dict:
+    """Run status filled in by the _run_* / _stream_* helpers."""
+    return {"success": False, "error": "", "cpu_time_s": 0.0, "peak_rss_mb": 0.0, "limit_exceeded": ""}
+
+
+def _apply_run_result(status: dict, res) -> None:
+    status["success"] = res.returncode == 0
+    status["cpu_time_s"] = res.cpu_time_s
+    status["peak_rss_mb"] = res.peak_rss_mb
+    status["limit_exceeded"] = res.limit_exceeded
+    if res.limit_exceeded == "memory" and res.returncode < 0:
+        # Killed by the cgroup OOM killer (a MemoryError already has a traceback)
+        status["error"] = f"\nMemory limit exceeded ({get_settings().CODE_MEMORY_LIMIT_MB} MB)"
+
+
+def _record_exit(proc: subprocess.Popen, wait_status: int, rusage, status: dict, limits: ExecLimits) -> None:
+    """Fill ``status`` from a wait4() result (a timeout / error already in status wins)."""
+    proc.returncode = os.waitstatus_to_exitcode(wait_status)
+    status["cpu_time_s"], status["peak_rss_mb"] = rusage_usage(rusage)
+    if not status["error"]:
+        status["success"] = proc.returncode == 0
+        status["limit_exceeded"], message = describe_exit(proc.returncode, limits)
+        status["error"] = f"\n{message}" if message else ""
+
+
+def _wait4_nohang(pid: int):
+    """os.wait4() result if ``pid`` has exited, else None."""
+    res = os.wait4(pid, os.WNOHANG)
+    return res if res[0] else None
+
+
+def _kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def _urls(artifacts: list[dict], kind: str) -> list[str]:
+    return [a["url"] for a in artifacts if a["kind"] == kind]
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, _MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(out_dir: str, entries: dict) -> None:
+    path = os.path.join(out_dir, _MANIFEST)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"[exec] could not write output manifest in {out_dir}: {e}")
@@ -0,0 +1,118 @@
+"""DataFrame auto-export used by CodeExecutor's postamble.
+
+Runs inside the executed code's process (subprocess, kernel or forked
+child), so like kernel_worker.py it imports nothing from the backend.
+
+For every public DataFrame left in the block's namespace:
+  - small frames (rows x cols <= csv_max_cells) are written as
+    ``table_<name>.csv``, as before;
+  - larger ones are written in full as ``table_<name>.parquet`` (or
+    ``.arrow`` — Arrow IPC) plus a ``table_<name>.preview.csv`` with the
+    first preview_rows rows for the UI;
+  - a frame whose fingerprint (shape, columns, dtypes and a hash of every
+    row) matches the previous export of the same name is not written again.
+
+Fingerprints are kept in ``_frames.json`` in the output directory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger("aigen.frame_export")
+
+_STATE = "_frames.json"
+_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _fingerprint(df) -> str:
+    import pandas as pd
+
+    h = hashlib.sha256()
+    h.update(repr((df.shape, [str(c) for c in df.columns], [str(t) for t in df.dtypes])).encode())
+    # The whole frame: a sampled hash would let an edit between sampled rows
+    # keep serving the stale file. Linear, and cheap next to the write.
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _write_full(df, path: str, fmt: str) -> None:
+    if fmt == "arrow":
+        import pyarrow.feather as feather
+        feather.write_feather(df.reset_index(drop=True), path, compression="lz4")
+    else:
+        df.to_parquet(path, index=False)
+
+
+def _remove(out_dir: str, files) -> None:
+    for name in files:
+        try:
+            os.remove(os.path.join(out_dir, name))
+        except OSError:
+            pass
+
+
+def export_frames(
+    namespace: dict, out_dir: str, fmt: str = "parquet",
+    csv_max_cells: int = 200_000, preview_rows: int = 200,
+) -> list:
+    """Export the DataFrames in ``namespace``; returns the file names written."""
+    try:
+        import pandas as pd
+    except ImportError:
+        return []
+
+    state_path = os.path.join(out_dir, _STATE)
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+
+    written = []
+    for name, value in list(namespace.items()):
+        if name.startswith("_") or not isinstance(value, pd.DataFrame):
+            continue
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+        try:
+            fp = f"{fmt}:{_fingerprint(value)}"
+        except Exception:
+            fp = ""  # unhashable cells (lists, dicts): always export
+        prev = state.get(name)
+        if fp and prev and prev["fp"] == fp and all(
+            os.path.exists(os.path.join(out_dir, f)) for f in prev["files"]
+        ):
+            continue
+
+        files = []
+        if fmt in _EXTENSIONS and value.size > csv_max_cells:
+            full = f"table_{safe}{_EXTENSIONS[fmt]}"
+            try:
+                _write_full(value, os.path.join(out_dir, full), fmt)
+                files.append(full)
+            except Exception as e:
+                # No pyarrow / fastparquet, or columns Arrow can't type; don't
+                # leave a truncated file behind for the UI to serve
+                _remove(out_dir, [full])
+                logger.debug(f"Exporting {name} as {fmt} failed, falling back to CSV: {e}")
+        if files:
+            preview = f"table_{safe}.preview.csv"
+            value.head(preview_rows).to_csv(os.path.join(out_dir, preview), index=False)
+            files.append(preview)
+        else:
+            files.append(f"table_{safe}.csv")
+            value.to_csv(os.path.join(out_dir, files[0]), index=False)
+
+        if prev:
+            _remove(out_dir, set(prev["files"]) - set(files))
+        state[name] = {"fp": fp, "files": files}
+        written.extend(files)
+
+    if written:
+        tmp = f"{state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, state_path)
+    return written
@@ -0,0 +1,455 @@
+"""Warm kernel pool / fork server — pre-imported Python workers for CodeExecutor.
+
+A cold ``python script.py`` per code block pays interpreter startup plus the
+matplotlib / pandas / scientific-stack imports every time (seconds for
+scanpy-heavy steps).  The pool keeps one tools/kernel_worker.py process per
+conversation with CODE_KERNEL_PRELOAD already imported and sends it jobs over
+a socket pair.
+
+  - Each job still runs in a fresh namespace with its own cwd and fd-level
+    stdout/stderr capture, so CodeExecutor's result shape is unchanged.
+  - A job that exceeds the timeout kills its kernel; the next job respawns it.
+  - Kernels idle longer than CODE_KERNEL_IDLE_TIMEOUT are stopped, and the
+    least recently used one is stopped when CODE_KERNEL_MAX is reached.
+
+ForkServer is the isolation-first alternative: a single zygote with the same
+preload that forks a fresh child per block (see kernel_worker.py).
+"""
+
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, Tuple
+
+from config import get_settings
+from tools.resource_limits import ExecLimits, create_exec_cgroup
+
+logger = logging.getLogger("aigen.kernel_pool")
+
+_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel_worker.py")
+
+
+# Seconds a kernel job gets to unwind after SIGINT before its kernel is killed
+INTERRUPT_GRACE_S = 2.0
+
+
+class KernelTimeout(Exception):
+    """The job did not finish within its timeout (the kernel was killed)."""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled through its JobHandle before it started."""
+
+
+class JobHandle:
+    """Stops a running job from another thread (see CodeExecutor._stream_warm).
+
+    A kernel job gets SIGINT first, so the KeyboardInterrupt ends the job and
+    the kernel stays warm; if it is still running INTERRUPT_GRACE_S later
+    (stuck in C code) the kernel is killed.  A forked job is killed outright.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pid = 0
+        self._graceful = False
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+        self._signal()
+
+    def _attach(self, pid: int, graceful: bool) -> None:
+        with self._lock:
+            self._pid, self._graceful = pid, graceful
+            if not self.cancelled:
+                return
+        self._signal()
+
+    def _detach(self) -> None:
+        with self._lock:
+            self._pid = 0
+
+    def _signal(self) -> None:
+        with self._lock:
+            pid, graceful = self._pid, self._graceful
+        if not pid:
+            return
+        if not graceful:
+            _kill_group(pid)
+            return
+        try:
+            os.killpg(pid, signal.SIGINT)
+        except OSError:
+            return
+        timer = threading.Timer(INTERRUPT_GRACE_S, self._kill_if_running, args=(pid,))
+        timer.daemon = True
+        timer.start()
+
+    def _kill_if_running(self, pid: int) -> None:
+        with self._lock:
+            if self._pid != pid:
+                return  # the job finished
+        _kill_group(pid)
+
+
+@dataclass
+class KernelRunResult:
+    returncode: int
+    cpu_time_s: float = 0.0
+    peak_rss_mb: float = 0.0
+    limit_exceeded: str = ""  # "cpu" | "memory" | ""
+
+    @classmethod
+    def from_reply(cls, reply: dict) -> "KernelRunResult":
+        return cls(
+            returncode=int(reply["rc"]),
+            cpu_time_s=float(reply.get("cpu_s", 0.0)),
+            peak_rss_mb=float(reply.get("peak_rss_mb", 0.0)),
+            limit_exceeded=reply.get("limit", ""),
+        )
+
+
+@dataclass
+class _Kernel:
+    proc: subprocess.Popen
+    sock: socket.socket
+    last_used: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    jobs: int = 0
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def stop(self) -> None:
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        if self.alive():
+            self.proc.kill()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+class KernelPool:
+    """Singleton pool of warm Python kernels keyed by conversation id."""
+
+    _instance: Optional["KernelPool"] = None
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self._preload = settings.CODE_KERNEL_PRELOAD
+        self._max_kernels = max(1, settings.CODE_KERNEL_MAX)
+        self._idle_timeout = settings.CODE_KERNEL_IDLE_TIMEOUT
+        self._kernels: "OrderedDict[str, _Kernel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    @classmethod
+    def get_instance(cls) -> "KernelPool":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def run(
+        self, key: str, code: str, cwd: str, timeout: float,
+        capture: Tuple[str, str],
+        limits: Optional[ExecLimits] = None,
+        handle: Optional[JobHandle] = None,
+    ) -> KernelRunResult:
+        """Run ``code`` in the kernel for ``key`` (blocking; call from a worker thread).
+
+        Output goes to the ``capture`` (stdout, stderr) files, which the
+        caller reads — in chunks, since a job may print gigabytes.
+        ``limits`` apply to this job only (soft rlimits inside the kernel).
+        ``handle`` lets another thread interrupt the job.
+        """
+        kernel = self._acquire(key)
+        with kernel.lock:
+            if handle is not None and handle.cancelled:
+                raise JobCancelled()
+            if not kernel.alive():
+                # Died while idle or on a previous job
+                kernel = self._respawn(key, kernel)
+            out, err = capture
+            job = {
+                "code": code, "cwd": cwd, "stdout": out, "stderr": err,
+                "limits": (limits or ExecLimits()).to_dict(),
+            }
+            reply = self._roundtrip(key, kernel, job, timeout, handle)
+            kernel.jobs += 1
+            kernel.last_used = time.monotonic()
+            return KernelRunResult.from_reply(reply)
+
+    def _roundtrip(
+        self, key: str, kernel: _Kernel, job: dict, timeout: float, handle: Optional[JobHandle]
+    ) -> dict:
+        kernel.sock.settimeout(timeout)
+        try:
+            kernel.sock.sendall((json.dumps(job) + "\n").encode("utf-8"))
+            if handle is not None:
+                handle._attach(kernel.proc.pid, graceful=True)
+            buf = b""
+            while not buf.endswith(b"\n"):
+                chunk = kernel.sock.recv(4096)
+                if not chunk:
+                    # Worker exited mid-job (os._exit, segfault, OOM kill)
+                    rc = kernel.proc.wait(timeout=5)
+                    self._discard(key, kernel)
+                    return {"rc": rc if rc else -1}
+                buf += chunk
+        except socket.timeout:
+            self._discard(key, kernel)
+            raise KernelTimeout()
+        finally:
+            if handle is not None:
+                handle._detach()
+        return json.loads(buf)
+
+    # ─── Lifecycle ───
+
+    def _spawn(self) -> _Kernel:
+        parent, child = socket.socketpair()
+        proc = subprocess.Popen(
+            [sys.executable, "-u", _WORKER, str(child.fileno()), self._preload],
+            pass_fds=(child.fileno(),),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        child.close()
+        return _Kernel(proc=proc, sock=parent)
+
+    def _acquire(self, key: str) -> _Kernel:
+        with self._lock:
+            self._evict_idle()
+            kernel = self._kernels.get(key)
+            if kernel is None:
+                while len(self._kernels) >= self._max_kernels:
+                    old_key, old = next(iter(self._kernels.items()))
+                    if old.lock.locked():
+                        break  # busy; allow temporary overshoot rather than block
+                    del self._kernels[old_key]
+                    old.stop()
+                    logger.info(f"Kernel for {old_key} evicted (pool full)")
+                kernel = self._spawn()
+                self._kernels[key] = kernel
+                self._start_reaper()
+                logger.info(f"Kernel started for {key} (pid {kernel.proc.pid})")
+            self._kernels.move_to_end(key)
+            kernel.last_used = time.monotonic()
+            return kernel
+
+    def _respawn(self, key: str, dead: _Kernel) -> _Kernel:
+        dead.stop()
+        kernel = self._spawn()
+        kernel.lock = dead.lock  # caller holds it
+        with self._lock:
+            self._kernels[key] = kernel
+        return kernel
+
+    def _discard(self, key: str, kernel: _Kernel) -> None:
+        kernel.stop()
+        with self._lock:
+            if self._kernels.get(key) is kernel:
+                del self._kernels[key]
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        for key, kernel in list(self._kernels.items()):
+            if kernel.lock.locked():
+                continue
+            if not kernel.alive() or now - kernel.last_used > self._idle_timeout:
+                del self._kernels[key]
+                kernel.stop()
+                logger.info(f"Kernel for {key} stopped (idle)")
+
+    def _start_reaper(self) -> None:
+        if self._reaper is not None:
+            return
+
+        def reap() -> None:
+            while True:
+                time.sleep(max(self._idle_timeout / 4, 1.0))
+                with self._lock:
+                    self._evict_idle()
+
+        self._reaper = threading.Thread(target=reap, name="kernel-reaper", daemon=True)
+        self._reaper.start()
+
+    def release(self, key: str) -> None:
+        """Stop the kernel for ``key`` (e.g. when its conversation is deleted)."""
+        with self._lock:
+            kernel = self._kernels.pop(key, None)
+        if kernel is not None:
+            kernel.stop()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            kernels, self._kernels = list(self._kernels.values()), OrderedDict()
+        for kernel in kernels:
+            kernel.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kernels": len(self._kernels),
+                "max_kernels": self._max_kernels,
+                "jobs": {k: v.jobs for k, v in self._kernels.items()},
+            }
+
+
+# ═══════════════════════════════════════════
+# Fork server (CODE_EXEC_MODE="fork")
+# ═══════════════════════════════════════════
+
+
+class ForkServer:
+    """Singleton zygote: one preloaded process that forks a child per job.
+
+    Unlike the kernel pool nothing survives between blocks — each job is a
+    fresh process — but startup is a fork() of an interpreter that already
+    has the scientific stack imported instead of a cold ``python``.
+    """
+
+    _instance: Optional["ForkServer"] = None
+
+    def __init__(self) -> None:
+        self._preload = get_settings().CODE_KERNEL_PRELOAD
+        self._proc: Optional[subprocess.Popen] = None
+        self._path = ""
+        self._lock = threading.Lock()
+        self.jobs = 0
+
+    @classmethod
+    def get_instance(cls) -> "ForkServer":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def start(self) -> None:
+        """Start the zygote if it isn't running (the first job does this too)."""
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                return
+            self._stop_locked()
+            self._path = os.path.join(tempfile.mkdtemp(prefix="forkserver_"), "zygote.sock")
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(self._path)
+            listener.listen(64)
+            self._proc = subprocess.Popen(
+                [sys.executable, "-u", _WORKER, "--zygote", str(listener.fileno()), self._preload],
+                pass_fds=(listener.fileno(),),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            listener.close()
+            logger.info(f"Fork server started (pid {self._proc.pid})")
+
+    def run(
+        self, code: str, cwd: str, timeout: float,
+        capture: Tuple[str, str],
+        limits: Optional[ExecLimits] = None,
+        handle: Optional[JobHandle] = None,
+    ) -> KernelRunResult:
+        """Run ``code`` in a freshly forked child (blocking; call from a worker thread).
+
+        ``capture``, ``limits`` and ``handle`` work as in KernelPool.run; with
+        CODE_CGROUP_PATH the child also runs in its own cgroup.
+        """
+        if handle is not None and handle.cancelled:
+            raise JobCancelled()
+        self.start()
+        limits = limits or ExecLimits()
+        cgroup = create_exec_cgroup(get_settings(), limits)
+        out, err = capture
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        pid = 0
+        reply = {"rc": -1}
+        try:
+            sock.connect(self._path)
+            reader = sock.makefile("r", encoding="utf-8")
+            pid = int(json.loads(reader.readline())["pid"])
+            if handle is not None:
+                handle._attach(pid, graceful=False)
+            job = {
+                "code": code, "cwd": cwd, "stdout": out, "stderr": err,
+                "limits": limits.to_dict(), "cgroup": cgroup.path if cgroup else "",
+            }
+            sock.sendall((json.dumps(job) + "\n").encode("utf-8"))
+            line = reader.readline()
+            # Empty line: the child died without reporting (os._exit, signal)
+            if line:
+                reply = json.loads(line)
+        except socket.timeout:
+            if pid:
+                _kill_group(pid)
+            raise KernelTimeout()
+        finally:
+            if handle is not None:
+                handle._detach()
+            sock.close()
+            if cgroup is not None:
+                reply.update(cgroup.finish())
+        self.jobs += 1
+        return KernelRunResult.from_reply(reply)
+
+    def _stop_locked(self) -> None:
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+        if self._path:
+            shutil.rmtree(os.path.dirname(self._path), ignore_errors=True)
+            self._path = ""
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._stop_locked()
+
+
+def _kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+@contextmanager
+def capture_files() -> Iterator[Tuple[str, str]]:
+    """Temp files for a job's stdout / stderr, removed afterwards."""
+    paths = []
+    try:
+        for suffix in (".out", ".err"):
+            fd, path = tempfile.mkstemp(prefix="kernel_", suffix=suffix)
+            os.close(fd)
+            paths.append(path)
+        yield paths[0], paths[1]
+    finally:
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
@@ -0,0 +1,267 @@
+"""Warm Python kernel — long-lived worker process driven by tools.kernel_pool.
+
+Kernel mode — ``python -u kernel_worker.py <socket_fd> <preload>``: imports
+the preload modules once, then serves jobs over the inherited socket, one
+JSON line per request / response:
+
+    → {"code": str, "cwd": str, "stdout": path, "stderr": path,
+       "limits": {"memory_mb": int, "cpu_seconds": int}, "cgroup": path}
+    ← {"rc": int, "cpu_s": float, "peak_rss_mb": float, "limit": str}
+
+Each job runs in a fresh ``__main__`` namespace with fd 1/2 redirected to the
+given files, so output from C extensions and child processes is captured the
+same way as with a subprocess.  pyplot patches made by the preamble are undone
+after every job.
+
+Limits are soft rlimits lowered for the job and restored afterwards (a kernel
+can't raise a hard limit back).  Hitting the CPU limit raises
+CpuLimitExceeded in the job via SIGXCPU; RLIMIT_DATA makes allocations fail
+with MemoryError.  CPU time and peak RSS are measured per job — VmHWM is reset
+through /proc/self/clear_refs where the kernel allows it.
+
+Zygote mode — ``python -u kernel_worker.py --zygote <listen_fd> <preload>``:
+imports the preload modules once, then forks a child per accepted connection.
+The child announces ``{"pid": int}``, joins the job's cgroup if one is given,
+runs one job as above and exits, so every block gets a fresh process (nothing
+leaks between blocks) without paying interpreter startup or imports.
+
+Deliberately imports nothing from the backend: it runs outside the app.
+"""
+
+import gc
+import json
+import os
+import resource
+import signal
+import socket
+import sys
+import traceback
+
+
+_MIB = 1024 * 1024
+_DEFAULT_LIMITS = {
+    res: resource.getrlimit(res) for res in (resource.RLIMIT_DATA, resource.RLIMIT_CPU)
+}
+_limit_hit = ""  # set by the SIGXCPU handler for the current job
+
+
+class CpuLimitExceeded(BaseException):
+    """Raised in the job by SIGXCPU when its CPU-time limit is reached."""
+
+
+def _on_sigxcpu(signum, frame) -> None:
+    global _limit_hit
+    _limit_hit = "cpu"
+    raise CpuLimitExceeded("CPU time limit exceeded")
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _soft_limit(res: int, value: int) -> None:
+    hard = _DEFAULT_LIMITS[res][1]
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(res, (value, hard))
+
+
+def _apply_limits(limits: dict) -> None:
+    if limits.get("memory_mb"):
+        _soft_limit(resource.RLIMIT_DATA, int(limits["memory_mb"]) * _MIB)
+    if limits.get("cpu_seconds"):
+        # RLIMIT_CPU counts the process lifetime, so offset by what's been used
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        _soft_limit(resource.RLIMIT_CPU, int(own.ru_utime + own.ru_stime) + int(limits["cpu_seconds"]))
+
+
+def _restore_limits() -> None:
+    for res, limit in _DEFAULT_LIMITS.items():
+        resource.setrlimit(res, limit)
+
+
+def _reset_peak_rss() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # reset VmHWM to the current RSS
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _join_cgroup(path: str) -> None:
+    try:
+        with open(os.path.join(path, "cgroup.procs"), "w") as f:
+            f.write(str(os.getpid()))
+    except OSError:
+        pass
+
+
+def _run_job(job: dict) -> dict:
+    """Run ``job`` under its limits; returns the response message."""
+    global _limit_hit
+    _limit_hit = ""
+    limits = job.get("limits") or {}
+    _reset_peak_rss()
+    cpu0 = _cpu_seconds()
+    try:
+        _apply_limits(limits)
+        rc = _run(job["code"])
+    finally:
+        _restore_limits()
+    if rc and not _limit_hit and limits.get("memory_mb"):
+        if any("MemoryError" in line for line in _tail(job["stderr"])):
+            _limit_hit = "memory"
+    return {
+        "rc": rc,
+        "cpu_s": round(_cpu_seconds() - cpu0, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "limit": _limit_hit,
+    }
+
+
+def _tail(path: str, size: int = 4096) -> list:
+    sys.stderr.flush()
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) - size))
+            return f.read().decode("utf-8", errors="replace").splitlines()[-3:]
+    except OSError:
+        return []
+
+
+def _preload(modules: str) -> None:
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    for name in filter(None, (m.strip() for m in modules.split(","))):
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+
+def _pyplot_originals():
+    # The preamble imports pyplot anyway; load it up front so the pristine
+    # show/savefig can be restored after each job's patches
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except Exception:
+        return None, None, None
+    return plt, plt.show, plt.savefig
+
+
+def _run(code: str) -> int:
+    namespace = {"__name__": "__main__"}
+    try:
+        exec(compile(code, "<execute>", "exec"), namespace)
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except CpuLimitExceeded:
+        print("CpuLimitExceeded: CPU time limit exceeded", file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Drop this frame so the traceback starts at the user's code
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+
+
+def _redirect(job: dict) -> None:
+    out = os.open(job["stdout"], os.O_WRONLY | os.O_TRUNC)
+    err = os.open(job["stderr"], os.O_WRONLY | os.O_TRUNC)
+    os.dup2(out, 1)
+    os.dup2(err, 2)
+    os.close(out)
+    os.close(err)
+
+
+def _send(sock: socket.socket, msg: dict) -> None:
+    sock.sendall((json.dumps(msg) + "\n").encode("utf-8"))
+
+
+def serve_kernel(fd: int, preload: str) -> None:
+    sock = socket.socket(fileno=fd)
+    _preload(preload)
+    plt, orig_show, orig_savefig = _pyplot_originals()
+    home = os.getcwd()
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    reader = sock.makefile("r", encoding="utf-8")
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+
+    for line in reader:
+        job = json.loads(line)
+        _redirect(job)
+        try:
+            os.chdir(job["cwd"])
+            result = _run_job(job)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+            os.chdir(home)
+            if plt is not None:
+                plt.close("all")
+                plt.show, plt.savefig = orig_show, orig_savefig
+            gc.collect()
+        _send(sock, result)
+
+
+def _fork_job(conn: socket.socket) -> None:
+    """Forked child: run one job from ``conn`` and exit."""
+    rc = 1
+    try:
+        os.setpgid(0, 0)  # own process group, so a timeout kills its children too
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+        _send(conn, {"pid": os.getpid()})
+        job = json.loads(conn.makefile("r", encoding="utf-8").readline())
+        if job.get("cgroup"):
+            _join_cgroup(job["cgroup"])
+        _redirect(job)
+        os.chdir(job["cwd"])
+        result = _run_job(job)
+        rc = result["rc"]
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _send(conn, result)
+    finally:
+        os._exit(rc)
+
+
+def serve_zygote(fd: int, preload: str) -> None:
+    listener = socket.socket(fileno=fd)
+    _preload(preload)
+    _pyplot_originals()
+    gc.collect()
+    gc.freeze()  # keep preloaded objects out of GC scans so their pages stay shared
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # children are reaped automatically
+    while True:
+        conn, _ = listener.accept()
+        if os.fork() == 0:
+            listener.close()
+            _fork_job(conn)
+        conn.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "--zygote":
+        serve_zygote(int(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else "")
+    else:
+        serve_kernel(int(sys.argv[1]), sys.argv[2] if len(sys.argv) > 2 else "")
@@ -0,0 +1,224 @@
+"""Per-execution resource limits and accounting for executed code.
+
+Limits (CODE_MEMORY_LIMIT_MB / CODE_CPU_TIME_LIMIT, 0 = unlimited):
+  - rlimits: RLIMIT_DATA (heap + anonymous mmaps — file mappings such as
+    backed AnnData don't count, unlike RLIMIT_AS) and RLIMIT_CPU, set in the
+    child right after spawn (subprocess mode) or per job by
+    tools/kernel_worker.py.  RLIMIT_CPU is the CPU time of all threads of a
+    process, so multithreaded code hits it well before that much wall time.
+  - cgroups v2 (CODE_CGROUP_PATH): each subprocess / forked job runs in a
+    child of a cgroup the deployment created for it, with memory.max, which
+    also covers processes the code spawns, and memory.peak / cpu.stat give
+    usage for the whole tree.  The backend's own cgroup is never touched.
+
+Accounting: peak RSS and CPU time come from the cgroup when there is one,
+else from wait4() rusage (subprocess) or the worker's own measurement.
+"""
+
+import logging
+import os
+import resource
+import signal
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+logger = logging.getLogger("aigen.resource_limits")
+
+_CGROUP_ROOT = "/sys/fs/cgroup"
+# Seconds of CPU between SIGXCPU (soft limit) and SIGKILL (hard limit)
+CPU_GRACE_S = 5
+
+
+@dataclass
+class ExecLimits:
+    memory_mb: int = 0
+    cpu_seconds: int = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "ExecLimits":
+        return cls(
+            memory_mb=max(0, settings.CODE_MEMORY_LIMIT_MB),
+            cpu_seconds=max(0, settings.CODE_CPU_TIME_LIMIT),
+        )
+
+    def to_dict(self) -> dict:
+        return {"memory_mb": self.memory_mb, "cpu_seconds": self.cpu_seconds}
+
+
+def limit_process(pid: int, limits: ExecLimits, cgroup: Optional["ExecCgroup"]) -> None:
+    """Move a just-spawned child into ``cgroup`` and set its rlimits.
+
+    Done from the parent with prlimit() rather than in a preexec_fn, which is
+    unsafe in a threaded server.  The child is still starting its interpreter
+    at this point, so the limits are in place before user code runs, and
+    anything it spawns inherits them.
+    """
+    if cgroup is not None:
+        cgroup.add(pid)
+    data_bytes = limits.memory_mb * 1024 * 1024
+    try:
+        if data_bytes:
+            resource.prlimit(pid, resource.RLIMIT_DATA, (data_bytes, data_bytes))
+        if limits.cpu_seconds:
+            resource.prlimit(
+                pid, resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + CPU_GRACE_S)
+            )
+    except ProcessLookupError:
+        pass  # already exited
+
+
+def rusage_usage(ru) -> Tuple[float, float]:
+    """(cpu seconds, peak RSS MB) from a struct rusage (ru_maxrss is KiB on Linux)."""
+    return ru.ru_utime + ru.ru_stime, ru.ru_maxrss / 1024
+
+
+def describe_exit(returncode: Optional[int], limits: ExecLimits) -> Tuple[str, str]:
+    """(limit_exceeded, message) for a process killed by the CPU-limit signal."""
+    if limits.cpu_seconds and returncode == -signal.SIGXCPU:
+        return "cpu", f"CPU time limit exceeded ({limits.cpu_seconds}s)"
+    return "", ""
+
+
+# ─── cgroups v2 ───
+
+class ExecCgroup:
+    """A child cgroup for one execution; close() kills leftovers and removes it."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def add(self, pid: int) -> None:
+        try:
+            with open(os.path.join(self.path, "cgroup.procs"), "w") as f:
+                f.write(str(pid))
+        except OSError as e:
+            logger.debug(f"Could not move {pid} into {self.path}: {e}")
+
+    def _read(self, name: str) -> str:
+        try:
+            with open(os.path.join(self.path, name), "r") as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def usage(self) -> Tuple[Optional[float], Optional[float]]:
+        """(cpu seconds, peak memory MB); None where the kernel doesn't report it."""
+        cpu = peak = None
+        for line in self._read("cpu.stat").splitlines():
+            if line.startswith("usage_usec "):
+                cpu = int(line.split()[1]) / 1e6
+        raw = self._read("memory.peak").strip()
+        if raw.isdigit():
+            peak = int(raw) / (1024 * 1024)
+        return cpu, peak
+
+    def oom_killed(self) -> bool:
+        for line in self._read("memory.events").splitlines():
+            key, _, value = line.partition(" ")
+            if key == "oom_kill" and value.strip() not in ("", "0"):
+                return True
+        return False
+
+    def finish(self) -> dict:
+        """Usage in worker-reply form ({"cpu_s", "peak_rss_mb", "limit"}), then close()."""
+        cpu, peak = self.usage()
+        reply = {}
+        if cpu is not None:
+            reply["cpu_s"] = round(cpu, 3)
+        if peak is not None:
+            reply["peak_rss_mb"] = round(peak, 1)
+        if self.oom_killed():
+            reply["limit"] = "memory"
+        self.close()
+        return reply
+
+    def close(self) -> None:
+        try:
+            with open(os.path.join(self.path, "cgroup.kill"), "w") as f:
+                f.write("1")
+        except OSError:
+            pass
+        try:
+            os.rmdir(self.path)
+        except OSError as e:
+            logger.debug(f"Could not remove cgroup {self.path}: {e}")
+
+
+class _CgroupManager:
+    """Creates per-execution cgroups under the delegated CODE_CGROUP_PATH.
+
+    The deployment owns that cgroup: it must hold no processes (cgroup v2
+    forbids processes in a cgroup whose children have controllers enabled)
+    and offer the memory controller.  The only change made to it is enabling
+    memory/cpu for its children.  Any failure (cgroup v1, missing or
+    read-only cgroup, no memory controller) disables cgroups; rlimits still
+    apply.
+    """
+
+    def __init__(self) -> None:
+        self._base: Optional[str] = None
+        self._checked_path: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _setup(base: str) -> Optional[str]:
+        if not os.path.exists(os.path.join(_CGROUP_ROOT, "cgroup.controllers")):
+            return None  # not cgroup v2
+        base = os.path.realpath(base)
+        if os.path.commonpath([base, _CGROUP_ROOT]) != _CGROUP_ROOT:
+            return None
+        with open(os.path.join(base, "cgroup.controllers"), "r") as f:
+            available = f.read().split()
+        wanted = [c for c in ("memory", "cpu") if c in available]
+        if "memory" not in wanted:
+            return None
+        with open(os.path.join(base, "cgroup.subtree_control"), "r") as f:
+            enabled = f.read().split()
+        missing = [c for c in wanted if c not in enabled]
+        if missing:
+            with open(os.path.join(base, "cgroup.subtree_control"), "w") as f:
+                f.write(" ".join(f"+{c}" for c in missing))
+        return base
+
+    def create(self, path: str, limits: ExecLimits) -> Optional[ExecCgroup]:
+        with self._lock:
+            if self._checked_path != path:
+                self._checked_path = path
+                self._base = None
+                reason = "not cgroup v2 or no memory controller"
+                try:
+                    self._base = self._setup(path)
+                except OSError as e:
+                    reason = str(e)
+                if self._base:
+                    logger.info(f"Code execution cgroups under {self._base}")
+                else:
+                    logger.info(f"cgroup {path} unusable for code execution ({reason}); using rlimits only")
+        if not self._base:
+            return None
+        path = os.path.join(self._base, f"exec-{uuid.uuid4().hex[:12]}")
+        try:
+            os.mkdir(path)
+            if limits.memory_mb:
+                with open(os.path.join(path, "memory.max"), "w") as f:
+                    f.write(str(limits.memory_mb * 1024 * 1024))
+        except OSError as e:
+            logger.debug(f"Could not create execution cgroup: {e}")
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+            return None
+        return ExecCgroup(path)
+
+
+_cgroups = _CgroupManager()
+
+
+def create_exec_cgroup(settings, limits: ExecLimits) -> Optional[ExecCgroup]:
+    """Per-execution cgroup under CODE_CGROUP_PATH if set and usable, else None."""
+    if not settings.CODE_CGROUP_PATH:
+        return None
+    return _cgroups.create(settings.CODE_CGROUP_PATH, limits)
@@ -0,0 +1,554 @@
+"""Streaming segment tokenizer — single-pass parsing of step LLM output.
+
+Replaces the regex cascade that re-scanned the accumulated step response after
+every plan step (think / execute / observation / solution in three tag
+dialects each, plus unclosed-tail variants).  The tokenizer consumes text
+chunks as they arrive from ``astream_events`` and tracks block boundaries with
+a small state machine, so the whole response is scanned exactly once.
+
+Recognized blocks (per type: behavior format + XML + bracket dialect):
+  thinking — <think>...</think>         / [THINK]...[/THINK]
+  code     — <execute>...</execute>     / [EXECUTE]...[/EXECUTE]
+  output   — <observation>...</observation> / [OBSERVATION]...[/OBSERVATION]
+  solution — <solution>...</solution>   / [SOLUTION]...[/SOLUTION]
+  code     — markdown fences ```lang\\n...```
+
+XML tags match case-insensitively, bracket tags case-sensitively.  Each block
+closes with the closing tag of the dialect that opened it.  Blocks nested in a
+thinking block stay part of the think content (rendered by the frontend's
+SpecialTokenBlock), but execute blocks inside thinking are still reported as
+code blocks because A1 executes them.
+
+Prose often mentions tags without closing them ("respond with <execute> or
+<solution>").  Such an opener is plain text: an execute / observation /
+solution block that meets another kind of block opener (or, for execute, a
+second execute opener) before its own close is demoted at that point and the
+new block starts there, and a block still open at the end is demoted and
+everything after its opener is tokenized again.  Only the behavior's own
+solution format sets the step's solution.
+"""
+
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools.tool_parser import _closing_tag
+
+# Segment types (shared with the frontend's interleaved renderer)
+THINKING = "thinking"
+TEXT = "text"
+CODE = "code"
+OUTPUT = "output"
+SOLUTION = "solution"
+
+_FENCE = "fence"  # markdown ``` block — rendered as CODE
+
+# Max length of the language word after ``` that we hold back while waiting for "\n"
+_MAX_FENCE_LANG = 32
+_FENCE_OPEN_RE = re.compile(r"```\w*\n")
+_FENCE_PARTIAL_RE = re.compile(r"`{1,3}\w{0,%d}\Z" % _MAX_FENCE_LANG)
+_FENCE_CLOSE = "```"
+# Longest tag we ever hold back a partial match for
+_MAX_TAG_LEN = 32
+
+
+@dataclass
+class SegmentEvent:
+    """Incremental tokenizer event.
+
+    kind: "open" | "delta" | "close" | "reset"
+    type: segment type ("thinking", "text", "code", "output", "solution")
+    index: position of the segment in ``SegmentParseResult.segments``
+
+    Streamed segments add up to the final ones: a segment opens with its first
+    non-blank text, and leading / trailing whitespace is never sent.  "reset"
+    replaces segment ``index`` with ``content`` and drops any segment after it;
+    it is sent when an unclosed block turns out to be plain text.
+    """
+
+    kind: str
+    type: str
+    content: str = ""
+    index: int = 0
+
+
+@dataclass
+class SegmentParseResult:
+    """Everything the step loop derives from a step response."""
+
+    segments: List[Dict[str, str]] = field(default_factory=list)
+    thinking: str = ""
+    reasoning: str = ""
+    code_blocks: List[str] = field(default_factory=list)
+    solution: Optional[str] = None
+
+
+# ═══════════════════════════════════════════
+# Tag tables
+# ═══════════════════════════════════════════
+
+
+@dataclass(frozen=True)
+class _TagSet:
+    """Compiled open-tag patterns for one token format."""
+
+    open_re: "re.Pattern[str]"          # top level: any block opener or fence
+    tag_open_re: "re.Pattern[str]"      # any block opener (no fence)
+    exec_open_re: "re.Pattern[str]"     # execute openers only
+    open_types: Dict[str, str]          # normalized open tag → segment type
+    prefixes: Tuple[str, ...]           # normalized open tags (holdback check)
+    exec_prefixes: Tuple[str, ...]
+    solution_tag: str                   # normalized opener of the step's solution
+
+
+def _norm(tag: str) -> str:
+    """XML tags are case-insensitive — normalize to lowercase."""
+    return tag.lower() if tag.startswith("<") else tag
+
+
+def _tag_pattern(tag: str) -> str:
+    escaped = re.escape(tag)
+    return f"(?i:{escaped})" if tag.startswith("<") else escaped
+
+
+def _close_pattern(open_tag: str) -> "re.Pattern[str]":
+    return _compile_close(_closing_tag(open_tag))
+
+
+@lru_cache(maxsize=64)
+def _compile_close(close_tag: str) -> "re.Pattern[str]":
+    return re.compile(_tag_pattern(close_tag))
+
+
+@lru_cache(maxsize=32)
+def _build_tagset(
+    think_fmt: Optional[str], exec_fmt: Optional[str],
+    obs_fmt: Optional[str], sol_fmt: Optional[str],
+) -> _TagSet:
+    candidates = {
+        THINKING: [think_fmt or "<think>", "<think>", "[THINK]"],
+        CODE: [exec_fmt or "<execute>", "<execute>", "[EXECUTE]"],
+        OUTPUT: [obs_fmt or "<observation>", "<observation>", "[OBSERVATION]"],
+        SOLUTION: [sol_fmt or "<solution>", "<solution>", "[SOLUTION]"],
+    }
+    open_types: Dict[str, str] = {}
+    for seg_type, tags in candidates.items():
+        for tag in tags:
+            # Only tag-shaped formats can be closed; first type claiming a tag wins
+            if tag[:1] in "<[" and _norm(tag) not in open_types:
+                open_types[_norm(tag)] = seg_type
+
+    # Longest first so e.g. "[THINK]" never shadows a longer tag sharing its prefix
+    ordered = sorted(open_types, key=len, reverse=True)
+    exec_tags = [t for t in ordered if open_types[t] == CODE]
+    open_re = re.compile(
+        "|".join([_tag_pattern(t) for t in ordered] + [_FENCE_OPEN_RE.pattern])
+    )
+    return _TagSet(
+        open_re=open_re,
+        tag_open_re=re.compile("|".join(_tag_pattern(t) for t in ordered)),
+        exec_open_re=re.compile("|".join(_tag_pattern(t) for t in exec_tags)),
+        open_types=open_types,
+        prefixes=tuple(ordered),
+        exec_prefixes=tuple(exec_tags),
+        solution_tag=_norm(sol_fmt or "<solution>"),
+    )
+
+
+def _tagset_for(behavior: Optional[Dict[str, Any]]) -> _TagSet:
+    b = behavior or {}
+    return _build_tagset(
+        b.get("think_format"), b.get("code_execute_format"),
+        b.get("code_result_format"), b.get("solution_format"),
+    )
+
+
+def _partial_suffix_len(buf: str, tags: Tuple[str, ...], fence: bool = False) -> int:
+    """Length of the longest suffix of buf that may be the start of a tag.
+
+    That suffix is held back until the next chunk decides whether it is a tag.
+    A partial tag starts at the last run of the tag's first character ("<",
+    "[" or "`") near the end of buf, so only that run needs checking.
+    """
+    best = 0
+    lo = max(0, len(buf) - _MAX_TAG_LEN)
+    for tag in tags:
+        first = tag[0]
+        start = buf.rfind(first, lo)
+        if start < 0:
+            continue
+        while start > lo and buf[start - 1] == first:
+            start -= 1
+        while start < len(buf) and buf[start] == first:
+            tail = buf[start:]
+            if best < len(tail) < len(tag) and tag.startswith(
+                tail.lower() if first == "<" else tail
+            ):
+                best = len(tail)
+                break
+            start += 1
+    if fence:
+        m = _FENCE_PARTIAL_RE.search(buf, max(0, len(buf) - _MAX_FENCE_LANG - 3))
+        if m:
+            best = max(best, len(buf) - m.start())
+    return best
+
+
+# ═══════════════════════════════════════════
+# Tokenizer
+# ═══════════════════════════════════════════
+
+
+class SegmentTokenizer:
+    """Incremental, single-pass tokenizer for step responses.
+
+    Usage::
+
+        tok = SegmentTokenizer(behavior)
+        for chunk in stream:
+            tok.feed(chunk)
+        result = tok.finish()
+
+    ``feed`` returns the list of SegmentEvents produced by that chunk so
+    callers can forward them to the client while the step is still running.
+    """
+
+    def __init__(self, behavior: Optional[Dict[str, Any]] = None) -> None:
+        self._tags = _tagset_for(behavior)
+        self._buf = ""
+        self._finished = False
+
+        # Current block: None (top-level text) or (type, open_tag, close_re)
+        self._block: Optional[Tuple[str, str, "re.Pattern[str]"]] = None
+        self._block_parts: List[str] = []
+        # Nested execute inside a thinking block: (open_tag, close_re, parts)
+        self._nested: Optional[Tuple[str, "re.Pattern[str]", List[str]]] = None
+
+        self._text_parts: List[str] = []
+        self._block_index = 0
+        # Segment open in the event stream: (type, index), and its held-back
+        # trailing whitespace (sent only once more text follows)
+        self._live: Optional[Tuple[str, int]] = None
+        self._live_ws = ""
+        self._reasoning_parts: List[str] = []
+        # Set while re-tokenizing the tail of an unclosed block: that tail is
+        # not reasoning (except after an observation opener)
+        self._quiet = False
+        self._think_code_start = 0
+        self._thinking: List[str] = []
+        self._code_blocks: List[str] = []
+        self._solution: Optional[str] = None
+        self._segments: List[Dict[str, str]] = []
+
+    # ─── Public API ───
+
+    @property
+    def code_blocks(self) -> List[str]:
+        """Closed execute blocks seen so far (raw inner text)."""
+        return self._code_blocks
+
+    def feed(self, chunk: str) -> List[SegmentEvent]:
+        """Consume a chunk of streamed text. Returns events it produced."""
+        if not chunk or self._finished:
+            return []
+        self._buf += chunk
+        events: List[SegmentEvent] = []
+        self._drain(events, final=False)
+        return events
+
+    def finish(self, events: Optional[List[SegmentEvent]] = None) -> SegmentParseResult:
+        """Flush held-back text, close unclosed blocks, return the result.
+
+        If ``events`` is given, the trailing events (held-back text and the
+        close of any segment still open in the event stream) are appended to it.
+        """
+        if not self._finished:
+            sink: List[SegmentEvent] = [] if events is None else events
+            self._drain(sink, final=True)
+            while self._block is not None:
+                self._finish_open_block(sink)
+            self._end_live(sink)
+            self._flush_text()
+            self._finished = True
+        return SegmentParseResult(
+            segments=self._segments,
+            thinking="\n".join(self._thinking),
+            reasoning="".join(self._reasoning_parts).strip(),
+            code_blocks=self._code_blocks,
+            solution=self._solution,
+        )
+
+    # ─── State machine ───
+
+    def _drain(self, events: List[SegmentEvent], final: bool) -> None:
+        while self._buf:
+            if self._block is None:
+                consumed = self._step_text(events, final)
+            elif self._block[0] == THINKING:
+                consumed = self._step_thinking(events, final)
+            else:
+                consumed = self._step_block(events, final)
+            if not consumed:
+                break
+
+    def _take(self, end: int) -> str:
+        piece, self._buf = self._buf[:end], self._buf[end:]
+        return piece
+
+    def _safe_end(self, tags: Tuple[str, ...], final: bool, fence: bool = False) -> int:
+        if final:
+            return len(self._buf)
+        return len(self._buf) - _partial_suffix_len(self._buf, tags, fence)
+
+    def _step_text(self, events: List[SegmentEvent], final: bool) -> bool:
+        m = self._tags.open_re.search(self._buf)
+        if m is None:
+            end = self._safe_end(self._tags.prefixes, final, fence=True)
+            if end <= 0:
+                return False
+            self._emit_text(self._take(end), events)
+            return True
+        if m.start():
+            self._emit_text(self._take(m.start()), events)
+        tag = self._take(m.end() - m.start())
+        if tag.startswith("`"):
+            self._open(_FENCE, tag, _compile_close(_FENCE_CLOSE), events)
+        else:
+            self._open(self._tags.open_types[_norm(tag)], tag, _close_pattern(tag), events)
+        return True
+
+    def _step_block(self, events: List[SegmentEvent], final: bool) -> bool:
+        seg_type, open_tag, close_re = self._block
+        m = close_re.search(self._buf)
+        hold: Tuple[str, ...] = ()
+        if seg_type not in (THINKING, _FENCE):
+            limit = m.start() if m else len(self._buf)
+            for reopen in self._tags.tag_open_re.finditer(self._buf, 0, limit):
+                # A repeated opener of the same type is content, as the legacy
+                # non-greedy regexes had it — except for execute, whose repeat
+                # means the first one was never closed
+                if seg_type == CODE or self._tags.open_types[_norm(reopen.group())] != seg_type:
+                    self._reopen(reopen, events)
+                    return True
+            hold = self._tags.prefixes
+        if m is None:
+            close_tag = _FENCE_CLOSE if seg_type == _FENCE else _norm(_closing_tag(open_tag))
+            end = self._safe_end((close_tag,) + hold, final)
+            if end <= 0:
+                return False
+            self._block_content(self._take(end), events)
+            return True
+        self._block_content(self._take(m.start()), events)
+        close_tag = self._take(m.end() - m.start())
+        self._close(close_tag, events)
+        return True
+
+    def _reopen(self, m: "re.Match[str]", events: List[SegmentEvent]) -> None:
+        """A block opener before the current block's close: the earlier opener
+        was never closed.  Demote it to plain text and start the new block."""
+        self._block_content(self._take(m.start()), events)
+        _, open_tag, _ = self._block
+        abandoned = open_tag + "".join(self._block_parts)
+        self._block = None
+        self._block_parts = []
+        self._reason(abandoned)
+        self._demote(abandoned, events)
+        tag = self._take(m.end() - m.start())
+        self._open(self._tags.open_types[_norm(tag)], tag, _close_pattern(tag), events)
+
+    def _step_thinking(self, events: List[SegmentEvent], final: bool) -> bool:
+        _, open_tag, close_re = self._block
+        if self._nested is not None:
+            n_open, n_close_re, n_parts = self._nested
+            n_m = n_close_re.search(self._buf)
+            t_m = close_re.search(self._buf)
+            if n_m is not None and (t_m is None or n_m.start() < t_m.start()):
+                piece = self._take(n_m.end())
+                n_parts.append(piece[:n_m.start()])
+                self._code_blocks.append("".join(n_parts))
+                self._nested = None
+                self._block_content(piece, events)
+                return True
+            if t_m is None:
+                tags = (_norm(_closing_tag(open_tag)), _norm(_closing_tag(n_open)))
+                end = self._safe_end(tags, final)
+                if end <= 0:
+                    return False
+                piece = self._take(end)
+                n_parts.append(piece)
+                self._block_content(piece, events)
+                return True
+            # Think closes while the nested execute is still open — drop it
+            self._nested = None
+            return self._step_block(events, final)
+
+        t_m = close_re.search(self._buf)
+        limit = t_m.start() if t_m else len(self._buf)
+        e_m = self._tags.exec_open_re.search(self._buf, 0, limit)
+        if e_m is None:
+            if t_m is None:
+                tags = (_norm(_closing_tag(open_tag)),) + self._tags.exec_prefixes
+                end = self._safe_end(tags, final)
+                if end <= 0:
+                    return False
+                self._block_content(self._take(end), events)
+                return True
+            return self._step_block(events, final)
+        piece = self._take(e_m.end())
+        exec_tag = piece[e_m.start():]
+        self._nested = (exec_tag, _close_pattern(exec_tag), [])
+        self._block_content(piece, events)
+        return True
+
+    # ─── Event stream ───
+
+    def _stream(self, seg_type: str, index: int, text: str, events: List[SegmentEvent]) -> None:
+        """Send ``text`` as part of segment ``index``, trimmed like the final segment."""
+        if self._live is None:
+            text = text.lstrip()
+            if not text:
+                return
+            self._live = (seg_type, index)
+            self._live_ws = ""
+            events.append(SegmentEvent("open", seg_type, index=index))
+        body = text.rstrip()
+        if not body:
+            self._live_ws += text
+            return
+        events.append(SegmentEvent("delta", seg_type, self._live_ws + body, index))
+        self._live_ws = text[len(body):]
+
+    def _end_live(self, events: List[SegmentEvent]) -> None:
+        if self._live is not None:
+            seg_type, index = self._live
+            events.append(SegmentEvent("close", seg_type, index=index))
+        self._live = None
+        self._live_ws = ""
+
+    def _demote(self, raw: str, events: List[SegmentEvent]) -> None:
+        """Merge an unclosed block (tag included) into the pending text segment.
+
+        The text segment stays open in the event stream: text that follows
+        is appended to it.
+        """
+        self._text_parts.append(raw)
+        joined = "".join(self._text_parts)
+        merged = joined.strip()
+        index = len(self._segments)
+        events.append(SegmentEvent("reset", TEXT, merged, index))
+        self._live = (TEXT, index)
+        self._live_ws = joined[len(joined.rstrip()):]
+
+    # ─── Emitters ───
+
+    def _reason(self, text: str) -> None:
+        if not self._quiet:
+            self._reasoning_parts.append(text)
+
+    def _emit_text(self, text: str, events: List[SegmentEvent]) -> None:
+        if not text:
+            return
+        self._text_parts.append(text)
+        self._reason(text)
+        self._stream(TEXT, len(self._segments), text, events)
+
+    def _flush_text(self) -> None:
+        if not self._text_parts:
+            return
+        gap = "".join(self._text_parts).strip()
+        self._text_parts = []
+        if gap:
+            self._segments.append({"type": TEXT, "content": gap})
+
+    def _open(self, seg_type: str, tag: str, close_re, events: List[SegmentEvent]) -> None:
+        # Pending text is committed only once the block closes: an unclosed
+        # block is merged back into the surrounding text (see _finish_open_block).
+        self._end_live(events)
+        self._block = (seg_type, tag, close_re)
+        self._block_parts = []
+        # Where the block lands in the final segments: after the pending text
+        # unless that is blank
+        self._block_index = len(self._segments) + bool("".join(self._text_parts).strip())
+        if seg_type == THINKING:
+            self._think_code_start = len(self._code_blocks)
+        if seg_type == _FENCE:
+            self._reason(tag)
+
+    def _block_content(self, text: str, events: List[SegmentEvent]) -> None:
+        if not text:
+            return
+        seg_type = self._block[0]
+        self._block_parts.append(text)
+        if seg_type == _FENCE:
+            self._reason(text)
+        self._stream(CODE if seg_type == _FENCE else seg_type, self._block_index, text, events)
+
+    def _close(self, close_tag: str, events: List[SegmentEvent]) -> None:
+        seg_type, open_tag, _ = self._block
+        raw = "".join(self._block_parts)
+        if seg_type == _FENCE:
+            self._reason(close_tag)
+        self._flush_text()
+        self._record_block(seg_type, open_tag, raw)
+        self._block = None
+        self._block_parts = []
+        self._nested = None
+        self._end_live(events)
+
+    def _finish_open_block(self, events: List[SegmentEvent]) -> None:
+        """Block still open at the end (a prose mention, or output truncated by
+        max_tokens or a stop string).
+
+        The opening tag becomes plain text and the rest is tokenized again, so
+        blocks after a mentioned tag are still found.  An unclosed solution
+        still counts as the step's solution.
+        """
+        seg_type, open_tag, _ = self._block
+        raw = "".join(self._block_parts)
+        if self._is_solution(seg_type, open_tag) and raw.strip():
+            self._solution = raw.strip()
+        if seg_type == THINKING:
+            # Execute blocks nested in it are found again by the re-scan
+            del self._code_blocks[self._think_code_start:]
+        self._block = None
+        self._block_parts = []
+        self._nested = None
+        # Fence text is already part of reasoning; other tails are stripped
+        if seg_type == OUTPUT:
+            self._reason(open_tag)
+        else:
+            self._quiet = True
+        self._demote(open_tag, events)
+        self._buf = raw + self._buf
+        self._drain(events, final=True)
+
+    def _is_solution(self, seg_type: str, open_tag: str) -> bool:
+        """The first block in the behavior's own solution format is the step's
+        solution; other solution dialects are only segments."""
+        return (
+            seg_type == SOLUTION and self._solution is None
+            and _norm(open_tag) == self._tags.solution_tag
+        )
+
+    def _record_block(self, seg_type: str, open_tag: str, raw: str) -> None:
+        inner = raw.strip()
+        if seg_type == THINKING:
+            if inner:
+                self._thinking.append(inner)
+        elif seg_type == CODE:
+            self._code_blocks.append(raw)
+        elif inner and self._is_solution(seg_type, open_tag):
+            self._solution = inner
+        if inner:
+            self._segments.append({
+                "type": CODE if seg_type == _FENCE else seg_type,
+                "content": inner,
+            })
+
+
+def tokenize_response(text: str, behavior: Optional[Dict[str, Any]] = None) -> SegmentParseResult:
+    """One-shot helper: tokenize a complete response."""
+    tok = SegmentTokenizer(behavior)
+    tok.feed(text)
+    return tok.finish()
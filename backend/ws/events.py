@@ -1,6 +1,6 @@
 """WebSocket event types and message schema."""
 
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass
 from enum import Enum
 from typing import Any, Optional
 
@@ -10,16 +10,27 @@ class EventType(str, Enum):
     TOOL_CALL = "tool_call"
     TOOL_RESULT = "tool_result"
     STEP_START = "step_start"
+    STEP_SEGMENT = "step_segment"
+    STEP_EXECUTE = "step_execute"
+    QUEUE_POSITION = "queue_position"
     PLAN_COMPLETE = "plan_complete"
     DONE = "done"
     ERROR = "error"
     REFUSAL_EVENT = "refusal_event"
+    PING = "ping"  # heartbeat (ws/manager.py); clients ignore it
 
 
 @dataclass
 class WSMessage:
     type: str
     data: Any = None
+    id: Optional[int] = None  # event id within the run (for attach / replay)
+    run_id: Optional[str] = None
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        # Shallow on purpose: asdict() deep-copies ``data`` for every message
+        msg = {"type": self.type, "data": self.data}
+        if self.id is not None:
+            msg["id"] = self.id
+            msg["run_id"] = self.run_id
+        return msg
@@ -1,39 +1,266 @@
-"""WebSocket connection manager."""
+"""WebSocket connection manager: per-conversation subscribers with fan-out.
 
-import json
+Every WebSocket is a Connection subscribed to its conversation, and a
+conversation can have any number of them (tabs, viewers).  Each connection
+has a bounded send queue drained by its own sender task, so sockets are
+written concurrently and a slow client never delays another:
+
+  - ``Connection.send`` waits for queue space.  It is used by the tasks
+    following runs, each of which reads the run's event log at its own
+    pace, so only that connection's followers wait.
+  - ``publish`` / ``broadcast`` serialize a message once and offer it to
+    every queue without waiting; a full queue drops it.  Use them only for
+    messages that a later one supersedes (status, pings).
+  - A socket write that doesn't complete within WS_SEND_TIMEOUT marks a
+    slow (or dead) consumer: the connection is closed (1013, if the close
+    frame still gets through) and the client reconnects and attaches from
+    its last event id, losing nothing.
+  - A ``ping`` message is queued after WS_PING_INTERVAL seconds without
+    traffic, so idle connections survive proxies and dead ones are found.
+
+``follow_run`` makes every subscriber of a conversation follow a new run of
+it, so all viewers see the runs any of them starts — also viewers connected
+to another worker, which follow it on the run's ``started`` message
+(services/state_backend.py).
+"""
+
+import asyncio
 import logging
-from typing import Dict
+from typing import Any, Dict, List, Optional, Set
 
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
 
-from ws.events import WSMessage
+from config import get_settings
+from services.event_frames import dumps
+from services.runs import Run, RunRegistry
+from services.state_backend import get_state_backend
+from ws.events import EventType, WSMessage
 
 logger = logging.getLogger("aigen.ws")
 
+# Close code for slow consumers ("try again later"); the client reconnects
+_CLOSE_SLOW = 1013
+
+
+class Connection:
+    """One WebSocket: its send queue, sender and watchdog tasks, and run followers."""
+
+    def __init__(
+        self, websocket: WebSocket, conv_id: str,
+        queue_size: int, send_timeout: float, ping_interval: float,
+    ) -> None:
+        self.websocket = websocket
+        self.conv_id = conv_id
+        self._queue: asyncio.Queue = asyncio.Queue(max(1, queue_size))
+        self._send_timeout = send_timeout
+        self._ping_interval = ping_interval
+        # Tasks forwarding the runs this connection follows, by run_id
+        self._followers: Dict[str, asyncio.Task] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._last_send = 0.0
+        self._sending_since: Optional[float] = None
+        self.dropped = 0
+        self.closed = False
+        self._closed_event = asyncio.Event()
+
+    def start(self) -> None:
+        self._last_send = asyncio.get_running_loop().time()
+        self._tasks = [asyncio.create_task(self._pump()), asyncio.create_task(self._watch())]
+
+    async def receive_json(self) -> Any:
+        """Next message from the client; WebSocketDisconnect once the connection is closed.
+
+        The closing side of a slow consumer can't rely on the close frame
+        reaching the client, so the endpoint's receive loop ends here.
+        """
+        receive = asyncio.ensure_future(self.websocket.receive_json())
+        closed = asyncio.ensure_future(self._closed_event.wait())
+        try:
+            await asyncio.wait([receive, closed], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            if not receive.done():
+                receive.cancel()
+        if not receive.done():
+            raise WebSocketDisconnect(code=_CLOSE_SLOW)
+        return receive.result()
+
+    # ─── Sending ───
+
+    async def send(self, event: WSMessage) -> None:
+        """Queue ``event``, waiting while the queue is full."""
+        if self.closed:
+            return
+        text = dumps(event.to_dict())
+        try:
+            self._queue.put_nowait(text)
+        except asyncio.QueueFull:
+            await self._queue.put(text)
+
+    def offer(self, text: str) -> bool:
+        """Queue serialized ``text`` unless the queue is full (then it is dropped)."""
+        if self.closed:
+            return False
+        try:
+            self._queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def _pump(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                text = await self._queue.get()
+                self._sending_since = loop.time()
+                await self.websocket.send_text(text)
+                self._sending_since = None
+                self._last_send = loop.time()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The socket is gone; the receive loop sees the disconnect
+            logger.debug(f"WebSocket send failed: conv_id={self.conv_id}: {e}")
+            self._set_closed()
+
+    async def _watch(self) -> None:
+        """Heartbeat pings and the slow-consumer check."""
+        loop = asyncio.get_running_loop()
+        tick = max(0.1, min(self._ping_interval, self._send_timeout) / 4)
+        ping = dumps(WSMessage(type=EventType.PING).to_dict())
+        while not self.closed:
+            await asyncio.sleep(tick)
+            now = loop.time()
+            if self._sending_since is not None and now - self._sending_since > self._send_timeout:
+                logger.warning(
+                    f"Slow WebSocket consumer closed: conv_id={self.conv_id}, "
+                    f"{self._queue.qsize()} message(s) queued"
+                )
+                await self._close(_CLOSE_SLOW, "Slow consumer; reconnect and attach")
+                return
+            if self._queue.empty() and now - self._last_send >= self._ping_interval:
+                self.offer(ping)
+
+    async def _close(self, code: int, reason: str) -> None:
+        self._set_closed()
+        self._cancel_tasks()
+        try:
+            # The socket may be wedged; don't wait for it long
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), timeout=1.0)
+        except Exception:
+            pass
+
+    # ─── Following runs ───
+
+    def following(self, run_id: str) -> bool:
+        return run_id in self._followers
+
+    def attach(self, run: Run, after: int = 0) -> None:
+        """Forward ``run``'s events with id > ``after`` (replaces an existing follower)."""
+        if self.closed:
+            return
+        previous = self._followers.pop(run.run_id, None)
+        if previous is not None:
+            previous.cancel()
+        self._followers[run.run_id] = asyncio.create_task(self._follow(run, after))
+
+    async def _follow(self, run: Run, after: int) -> None:
+        try:
+            async for event_id, event in run.log.subscribe(after):
+                await self.send(
+                    WSMessage(type=event.type, data=event.data, id=event_id, run_id=run.run_id)
+                )
+        except Exception as e:
+            logger.error(f"Streaming error: {e}")
+        finally:
+            if self._followers.get(run.run_id) is asyncio.current_task():
+                del self._followers[run.run_id]
+
+    def close(self) -> None:
+        """Stop sending and following (the socket itself is closed by its endpoint)."""
+        self._set_closed()
+        self._cancel_tasks()
+
+    def _set_closed(self) -> None:
+        self.closed = True
+        self._closed_event.set()
+
+    def _cancel_tasks(self) -> None:
+        current = asyncio.current_task()
+        for task in [*self._tasks, *self._followers.values()]:
+            if task is not current:
+                task.cancel()
+        self._followers.clear()
+
 
 class ConnectionManager:
     """Tracks active WebSocket connections per conversation."""
 
     def __init__(self):
-        self._connections: Dict[str, WebSocket] = {}
+        self._subscribers: Dict[str, Set[Connection]] = {}
+        get_state_backend().on("started", self._on_run_started)
 
-    async def connect(self, websocket: WebSocket, conv_id: str):
+    async def connect(self, websocket: WebSocket, conv_id: str) -> Connection:
         await websocket.accept()
-        self._connections[conv_id] = websocket
-        logger.info(f"WebSocket connected: conv_id={conv_id}")
+        settings = get_settings()
+        conn = Connection(
+            websocket, conv_id,
+            settings.WS_SEND_QUEUE, settings.WS_SEND_TIMEOUT, settings.WS_PING_INTERVAL,
+        )
+        conn.start()
+        subscribers = self._subscribers.setdefault(conv_id, set())
+        subscribers.add(conn)
+        logger.info(f"WebSocket connected: conv_id={conv_id} ({len(subscribers)} subscriber(s))")
+        return conn
+
+    def disconnect(self, conn: Connection):
+        conn.close()
+        subscribers = self._subscribers.get(conn.conv_id)
+        if subscribers is not None:
+            subscribers.discard(conn)
+            if not subscribers:
+                del self._subscribers[conn.conv_id]
+        logger.info(f"WebSocket disconnected: conv_id={conn.conv_id}")
+
+    def subscribers(self, conv_id: str) -> List[Connection]:
+        return list(self._subscribers.get(conv_id, ()))
+
+    def follow_run(self, run: Run, starter: Optional[Connection] = None) -> None:
+        """Have ``starter`` and every subscriber of the run's conversation follow ``run``."""
+        if starter is not None:
+            starter.attach(run)
+        for conn in self.subscribers(run.conv_id):
+            if not conn.following(run.run_id):
+                conn.attach(run)
+
+    def _on_run_started(self, message: dict) -> None:
+        """A run started in another worker: follow it if its conversation has subscribers here."""
+        if message.get("conv_id") in self._subscribers:
+            asyncio.get_running_loop().create_task(self._follow_remote(message["run_id"]))
+
+    async def _follow_remote(self, run_id: str) -> None:
+        try:
+            run = await RunRegistry.get_instance().find(run_id)
+        except Exception as e:
+            logger.warning(f"Run {run_id[:8]} of another worker not followed: {e}")
+            return
+        if run is not None:
+            self.follow_run(run)
 
-    def disconnect(self, conv_id: str):
-        self._connections.pop(conv_id, None)
-        logger.info(f"WebSocket disconnected: conv_id={conv_id}")
+    def publish(self, conv_id: str, event: WSMessage) -> int:
+        """Offer ``event`` to the subscribers of ``conv_id``; returns how many queued it."""
+        text = dumps(event.to_dict())
+        return sum(conn.offer(text) for conn in self.subscribers(conv_id))
 
     async def send_event(self, conv_id: str, event: WSMessage):
-        ws = self._connections.get(conv_id)
-        if ws:
-            await ws.send_text(json.dumps(event.to_dict()))
+        self.publish(conv_id, event)
 
     async def broadcast(self, event: WSMessage):
-        for ws in self._connections.values():
-            await ws.send_text(json.dumps(event.to_dict()))
+        text = dumps(event.to_dict())
+        for subscribers in list(self._subscribers.values()):
+            for conn in list(subscribers):
+                conn.offer(text)
 
 
 manager = ConnectionManager()
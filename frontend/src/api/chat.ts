@@ -1,5 +1,5 @@
 import { fetchJSON } from './client';
-import type { StopRequest, StatusResponse } from '@/types';
+import type { RunInfo, StopRequest, StatusResponse } from '@/types';
 
 /**
  * HTTP fallback for stopping generation.
@@ -12,3 +12,26 @@ export async function stopGeneration(convId: string): Promise<StatusResponse> {
     body: JSON.stringify(body),
   });
 }
+
+/**
+ * Server-side runs (they continue without a connected client).
+ * Attach to one over WebSocket with `attach` and its last_event_id.
+ */
+export async function listRuns(
+  options: { conv_id?: string; active?: boolean } = {},
+): Promise<RunInfo[]> {
+  const params = new URLSearchParams();
+  for (const [key, value] of Object.entries(options)) {
+    if (value !== undefined) params.set(key, String(value));
+  }
+  const query = params.toString();
+  return fetchJSON(`/api/runs${query ? `?${query}` : ''}`);
+}
+
+export async function getRun(runId: string): Promise<RunInfo> {
+  return fetchJSON(`/api/runs/${runId}`);
+}
+
+export async function cancelRun(runId: string): Promise<RunInfo> {
+  return fetchJSON(`/api/runs/${runId}/cancel`, { method: 'POST' });
+}
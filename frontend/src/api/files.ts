@@ -1,12 +1,39 @@
 import { API_BASE } from './config';
 import { ApiError, fetchJSON } from './client';
-import type { FileInfo, FileUploadResponse, StatusResponse } from '@/types';
+import type {
+  FileInfo,
+  FileUploadResponse,
+  StatusResponse,
+  TablePreview,
+  UploadSessionInfo,
+} from '@/types';
 
-export async function listFiles(): Promise<FileInfo[]> {
-  return fetchJSON('/api/data/list');
+// Files above this size use the resumable chunked upload endpoints
+const CHUNKED_UPLOAD_THRESHOLD = 32 * 1024 * 1024;
+const CHUNK_RETRIES = 5;
+// Chunked uploads up to this size are hashed first (crypto.subtle needs the
+// whole file in memory); content the server already has isn't sent again
+const HASH_FIRST_LIMIT = 1024 * 1024 * 1024;
+
+export async function listFiles(
+  options: {
+    offset?: number;
+    limit?: number;
+    sort?: 'uploaded_at' | 'filename' | 'size';
+    order?: 'asc' | 'desc';
+  } = {},
+): Promise<FileInfo[]> {
+  const params = new URLSearchParams();
+  for (const [key, value] of Object.entries(options)) {
+    if (value !== undefined) params.set(key, String(value));
+  }
+  const query = params.toString();
+  return fetchJSON(`/api/data/list${query ? `?${query}` : ''}`);
 }
 
 export async function uploadFile(file: File): Promise<FileUploadResponse> {
+  if (file.size > CHUNKED_UPLOAD_THRESHOLD) return uploadFileChunked(file);
+
   const formData = new FormData();
   formData.append('file', file);
 
@@ -23,6 +50,77 @@ export async function uploadFile(file: File): Promise<FileUploadResponse> {
   return res.json();
 }
 
+/**
+ * Upload in chunks through an upload session.  A failed chunk is retried
+ * from the offset the server reports, so only the missing bytes are resent.
+ */
+export async function uploadFileChunked(
+  file: File,
+  onProgress?: (sent: number, total: number) => void,
+): Promise<FileUploadResponse> {
+  if (file.size <= HASH_FIRST_LIMIT && globalThis.crypto?.subtle) {
+    const stored = await uploadFileByHash(file.name, await sha256Hex(file));
+    if (stored) return stored;
+  }
+
+  const session: UploadSessionInfo = await fetchJSON('/api/data/uploads', {
+    method: 'POST',
+    body: JSON.stringify({ filename: file.name, size: file.size }),
+  });
+  const base = `/api/data/uploads/${session.upload_id}`;
+  let offset = session.offset;
+  let failures = 0;
+
+  while (offset < file.size) {
+    const end = Math.min(offset + session.chunk_size, file.size);
+    try {
+      const res = await fetch(`${API_BASE}${base}?offset=${offset}`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/octet-stream' },
+        body: file.slice(offset, end),
+      });
+      if (res.ok) {
+        offset = ((await res.json()) as UploadSessionInfo).offset;
+        failures = 0;
+        onProgress?.(offset, file.size);
+        continue;
+      }
+      if (res.status !== 409) {
+        const err = await res.json().catch(() => ({ detail: res.statusText }));
+        throw new ApiError(res.status, err.detail || 'Upload failed');
+      }
+    } catch (e) {
+      if (e instanceof ApiError || ++failures > CHUNK_RETRIES) throw e;
+      await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** failures));
+    }
+    // Resume from what the server actually has
+    offset = ((await fetchJSON(base)) as UploadSessionInfo).offset;
+  }
+
+  return fetchJSON(`${base}/complete`, { method: 'POST' });
+}
+
+async function sha256Hex(file: Blob): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+/** Add a file by content hash alone; null if the server doesn't have the content. */
+export async function uploadFileByHash(
+  filename: string,
+  sha256: string,
+): Promise<FileUploadResponse | null> {
+  try {
+    return await fetchJSON('/api/data/upload/by-hash', {
+      method: 'POST',
+      body: JSON.stringify({ filename, sha256 }),
+    });
+  } catch (e) {
+    if (e instanceof ApiError && e.status === 404) return null;
+    throw e;
+  }
+}
+
 export async function deleteFile(filename: string): Promise<StatusResponse> {
   return fetchJSON(`/api/data/${encodeURIComponent(filename)}`, {
     method: 'DELETE',
@@ -43,3 +141,22 @@ export function getStepOutputUrl(
 ): string {
   return `${API_BASE}/api/outputs/${convId}/step_${stepId}/${encodeURIComponent(filename)}`;
 }
+
+export async function getTablePreview(
+  convId: string,
+  stepId: number,
+  filename: string,
+  offset = 0,
+  limit = 100,
+  options: { columns?: string[]; stats?: boolean } = {},
+): Promise<TablePreview> {
+  const params = new URLSearchParams({
+    offset: String(offset),
+    limit: String(limit),
+  });
+  if (options.columns?.length) params.set('columns', options.columns.join(','));
+  if (options.stats) params.set('stats', 'true');
+  return fetchJSON(
+    `/api/outputs/${convId}/step_${stepId}/${encodeURIComponent(filename)}/preview?${params}`,
+  );
+}
@@ -1,6 +1,11 @@
 /**
  * WebSocket client for real-time chat communication.
  * Replaces POST-based SSE with a single persistent connection per conversation.
+ *
+ * Server runs continue when the connection drops: the client remembers the
+ * last event id of every unfinished run and, after reconnecting, sends
+ * `attach` so the server replays only the missed events.  The server closes
+ * connections that stop reading (slow consumers); the same reattach covers it.
  */
 
 export type WSEventHandler = (event: unknown) => void;
@@ -23,6 +28,8 @@ export class WSClient {
   private maxReconnectDelay: number;
   private shouldReconnect = true;
   private _isConnected = false;
+  // Unfinished runs → last event id received
+  private openRuns = new Map<string, number>();
 
   constructor(convId: string, options: WSClientOptions) {
     this.convId = convId;
@@ -47,12 +54,17 @@ export class WSClient {
       this._isConnected = true;
       this.reconnectDelay = 1000; // Reset backoff on successful connect
       this.options.onOpen?.();
+      for (const [runId, after] of this.openRuns) {
+        this.send('attach', { run_id: runId, after });
+      }
     };
 
     this.ws.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
+        if (data.type === 'ping') return; // server heartbeat
         console.log('[WS raw]', data.type, data);
+        this.trackRun(data);
         if (isValidWSEvent(data)) {
           this.options.onMessage(data);
         }
@@ -83,6 +95,15 @@ export class WSClient {
     this.ws.send(JSON.stringify({ action, ...(payload ?? {}) }));
   }
 
+  private trackRun(data: { type?: string; id?: number; run_id?: string }): void {
+    if (!data.run_id || typeof data.id !== 'number') return;
+    if (data.type === 'done' || data.type === 'error') {
+      this.openRuns.delete(data.run_id);
+    } else {
+      this.openRuns.set(data.run_id, data.id);
+    }
+  }
+
   close(): void {
     this.shouldReconnect = false;
     this._isConnected = false;
@@ -96,6 +117,7 @@ export class WSClient {
   switchConversation(newConvId: string): void {
     this.convId = newConvId;
     this.shouldReconnect = true;
+    this.openRuns.clear();
     if (this.ws) {
       this.ws.close(1000, 'Switching conversation');
       this.ws = null;
@@ -141,7 +163,9 @@ function isValidWSEvent(data: unknown): boolean {
     case 'tool_retrieval_start':
     case 'tool_retrieval_done':
     case 'step_execute':
+    case 'step_segment':
     case 'plan_retry':
+    case 'queue_position':
       return true;
     default:
       return false;
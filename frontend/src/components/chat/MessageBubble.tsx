@@ -132,6 +132,14 @@ export function MessageBubble({ message, isLast, isStreaming, messageIndex, onSa
           </div>
         )}
 
+        {/* Waiting for a server slot (code execution / LLM / retrieval) */}
+        {isStreaming && isLast && chatState.queuePosition ? (
+          <div className="plan-creating-indicator">
+            <StreamingDots />
+            <span>{t('status.queued', { position: chatState.queuePosition })}</span>
+          </div>
+        ) : null}
+
         {/* Plan steps box (for create_plan tool calls) */}
         {hasPlanCall && (
           <PlanStepsBox
@@ -6,7 +6,7 @@ import { executeCode, toolCall } from "@/api/tools";
 import { listStepOutputs, getStepOutputUrl } from "@/api/files";
 import { highlightCodeSyntax } from "@/utils/codeHighlight";
 import { recoverBrokenChars } from "@/utils/textClean";
-import type { CodeData, CodeSegment } from "@/types";
+import type { CodeData, CodeSegment, ExecutionUsage } from "@/types";
 
 /** Strip raw special-token tags that may leak through from model output */
 function stripRawTags(s: string): string {
@@ -164,14 +164,33 @@ interface CodeBlockProps {
 interface CodeGroup {
   code: string;
   output: string;
+  usage?: ExecutionUsage;
 }
 
 function groupStepExecs(
-  execs: Array<{ code?: string; observation?: string; success?: boolean }>,
+  execs: Array<{
+    code?: string;
+    observation?: string;
+    success?: boolean;
+    usage?: ExecutionUsage;
+  }>,
 ): CodeGroup[] {
   return execs
     .filter((e) => e.code)
-    .map((e) => ({ code: e.code!, output: e.observation || "" }));
+    .map((e) => ({
+      code: e.code!,
+      output: e.observation || "",
+      usage: e.usage,
+    }));
+}
+
+function formatUsage(usage: ExecutionUsage): string {
+  const parts = [
+    `CPU ${usage.cpu_time_s.toFixed(2)}s`,
+    `peak ${Math.round(usage.peak_rss_mb)} MB`,
+  ];
+  if (usage.limit_exceeded) parts.push(`${usage.limit_exceeded} limit exceeded`);
+  return parts.join(" · ");
 }
 
 function groupSegments(segs: CodeSegment[]): CodeGroup[] {
@@ -383,6 +402,13 @@ function CodeBlock({ stepIndex, data, convId }: CodeBlockProps) {
                     <pre className="code-stdout">
                       {stripRawTags(group.output)}
                     </pre>
+                    {group.usage && (
+                      <div
+                        className={`code-usage${group.usage.limit_exceeded ? " exceeded" : ""}`}
+                      >
+                        {formatUsage(group.usage)}
+                      </div>
+                    )}
                   </div>
                 )}
                 {segRes && (
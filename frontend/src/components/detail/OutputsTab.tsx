@@ -1,13 +1,13 @@
 import { useState, useEffect, useMemo } from "react";
 import { useAppContext } from "@/context/AppContext";
 import { useChatContext } from "@/context/ChatContext";
-import { listStepOutputs, getStepOutputUrl } from "@/api/files";
+import { listStepOutputs, getStepOutputUrl, getTablePreview } from "@/api/files";
 import { useTranslation } from "@/i18n";
 import { MarkdownContent } from "@/utils/MarkdownContent";
 import { highlightCodeSyntax } from "@/utils/codeHighlight";
 import { SpecialTokenBlock } from "@/components/chat/SpecialTokenBlock";
 import { recoverBrokenChars } from "@/utils/textClean";
-import type { PlanStepResult } from "@/types";
+import type { PlanStepResult, TablePreview } from "@/types";
 
 /** Strip special tokens from result text fields. */
 function stripSpecialTokens(s: string): string {
@@ -66,6 +66,19 @@ export function OutputsTab() {
     if (!grouped.has(stepNum)) grouped.set(stepNum, []);
     grouped.get(stepNum)!.push(result);
   });
+  // Steps still running: their transcript so far, from step_segment events
+  Object.entries(data.stepSegments || {}).forEach(([idx, streamed]) => {
+    const stepNum = Number(idx) + 1;
+    if (grouped.has(stepNum) || streamed.segments.length === 0) return;
+    grouped.set(stepNum, [
+      {
+        step: stepNum,
+        tool: "",
+        success: true,
+        result: { segments: streamed.segments },
+      },
+    ]);
+  });
 
   return (
     <div className="detail-outputs-content">
@@ -208,16 +221,21 @@ function GroupedStepOutputSection({
   convId,
 }: GroupedStepOutputSectionProps) {
   const [figures, setFigures] = useState<string[]>([]);
+  const [tables, setTables] = useState<string[]>([]);
 
   useEffect(() => {
     if (!convId) return;
     let cancelled = false;
     listStepOutputs(convId, index - 1)
       .then((res) => {
-        if (!cancelled) setFigures(res.figures || []);
+        if (cancelled) return;
+        setFigures(res.figures || []);
+        setTables(res.tables || []);
       })
       .catch(() => {
-        if (!cancelled) setFigures([]);
+        if (cancelled) return;
+        setFigures([]);
+        setTables([]);
       });
     return () => {
       cancelled = true;
@@ -251,6 +269,82 @@ function GroupedStepOutputSection({
           <div className="output-figure-label">{fn}</div>
         </div>
       ))}
+      {/* File-based tables, a page at a time */}
+      {convId &&
+        tables.map((url) => (
+          <StepTableOutput
+            key={url}
+            convId={convId}
+            stepId={index - 1}
+            filename={url.split("/").pop() || url}
+          />
+        ))}
+    </div>
+  );
+}
+
+const TABLE_PAGE_ROWS = 20;
+
+/** One table output, paged through GET /api/outputs/.../preview. */
+function StepTableOutput({
+  convId,
+  stepId,
+  filename,
+}: {
+  convId: string;
+  stepId: number;
+  filename: string;
+}) {
+  const [offset, setOffset] = useState(0);
+  const [page, setPage] = useState<TablePreview | null>(null);
+
+  useEffect(() => {
+    let cancelled = false;
+    getTablePreview(convId, stepId, filename, offset, TABLE_PAGE_ROWS)
+      .then((res) => {
+        if (!cancelled) setPage(res);
+      })
+      .catch(() => {
+        if (!cancelled) setPage(null);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [convId, stepId, filename, offset]);
+
+  if (!page) return null;
+
+  return (
+    <div className="output-table-wrapper">
+      <div className="output-table-label">{filename}</div>
+      <table className="output-table">
+        <thead>
+          <tr>
+            {page.columns.map((c) => (
+              <th key={c}>{c}</th>
+            ))}
+          </tr>
+        </thead>
+        <tbody>
+          {page.rows.map((row, ri) => (
+            <tr key={ri}>
+              {row.map((cell, ci) => (
+                <td key={ci}>{String(cell ?? "")}</td>
+              ))}
+            </tr>
+          ))}
+        </tbody>
+      </table>
+      <div className="output-table-more">
+        {offset > 0 && (
+          <button onClick={() => setOffset(Math.max(0, offset - TABLE_PAGE_ROWS))}>‹</button>
+        )}{" "}
+        rows {page.rows.length ? offset + 1 : 0}–{offset + page.rows.length}
+        {page.total_rows != null && ` of ${page.total_rows}`}{" "}
+        {page.has_more && (
+          <button onClick={() => setOffset(offset + TABLE_PAGE_ROWS)}>›</button>
+        )}
+      </div>
     </div>
   );
 }
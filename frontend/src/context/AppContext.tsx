@@ -11,6 +11,7 @@ import type {
   PlanStep,
   PlanStepResult,
   CodeData,
+  StepSegments,
 } from "@/types";
 
 // ─── Modal Types ───
@@ -99,8 +100,17 @@ export type AppAction =
         observation: string;
         success: boolean;
         iteration: number;
+        usage?: import("../types").ExecutionUsage;
       };
     }
+  | {
+      type: "APPEND_STEP_OUTPUT";
+      payload: { stepIndex: number; iteration: number; output: string };
+    }
+  | {
+      type: "SET_STEP_SEGMENTS";
+      payload: { stepIndex: number; segments: StepSegments };
+    }
   | { type: "OPEN_MODAL"; payload: ModalType }
   | { type: "CLOSE_MODAL" }
   | { type: "BUMP_CONVERSATIONS" };
@@ -246,6 +256,7 @@ function appReducer(state: AppState, action: AppAction): AppState {
           })),
           results: [],
           codes: {},
+          stepSegments: {},
           analysis: "",
           currentStep: 0,
         },
@@ -345,12 +356,16 @@ function appReducer(state: AppState, action: AppAction): AppState {
 
     case "ADD_STEP_EXECUTION": {
       if (!state.detailPanelData) return state;
-      const { stepIndex, code, observation, success, iteration } =
+      const { stepIndex, code, observation, success, iteration, usage } =
         action.payload;
       const prev = state.detailPanelData.stepExecutions || {};
+      // Replace the streaming placeholder for this iteration, if any
+      const existing = (prev[stepIndex] || []).filter(
+        (e) => !(e.running && e.iteration === iteration),
+      );
       const stepExecs = [
-        ...(prev[stepIndex] || []),
-        { code, observation, success, iteration },
+        ...existing,
+        { code, observation, success, iteration, usage },
       ];
       return {
         ...state,
@@ -361,6 +376,51 @@ function appReducer(state: AppState, action: AppAction): AppState {
       };
     }
 
+    case "APPEND_STEP_OUTPUT": {
+      if (!state.detailPanelData) return state;
+      const { stepIndex, iteration, output } = action.payload;
+      const prev = state.detailPanelData.stepExecutions || {};
+      const execs = prev[stepIndex] || [];
+      const last = execs[execs.length - 1];
+      const stepExecs =
+        last?.running && last.iteration === iteration
+          ? [
+              ...execs.slice(0, -1),
+              { ...last, observation: last.observation + output },
+            ]
+          : [
+              ...execs,
+              {
+                code: "",
+                observation: output,
+                success: true,
+                iteration,
+                running: true,
+              },
+            ];
+      return {
+        ...state,
+        detailPanelData: {
+          ...state.detailPanelData,
+          stepExecutions: { ...prev, [stepIndex]: stepExecs },
+        },
+      };
+    }
+
+    case "SET_STEP_SEGMENTS": {
+      if (!state.detailPanelData) return state;
+      return {
+        ...state,
+        detailPanelData: {
+          ...state.detailPanelData,
+          stepSegments: {
+            ...state.detailPanelData.stepSegments,
+            [action.payload.stepIndex]: action.payload.segments,
+          },
+        },
+      };
+    }
+
     case "OPEN_MODAL":
       return { ...state, activeModal: action.payload };
 
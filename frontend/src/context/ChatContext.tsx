@@ -23,6 +23,8 @@ export interface ChatState {
   error: string | null;
   stepQuestions: StepQuestion[];
   planRetrying: boolean;
+  /** Position in the server's work queue (queue_position events); null when not queued. */
+  queuePosition: number | null;
 }
 
 const initialState: ChatState = {
@@ -33,6 +35,7 @@ const initialState: ChatState = {
   error: null,
   stepQuestions: [],
   planRetrying: false,
+  queuePosition: null,
 };
 
 // ─── Actions ───
@@ -57,7 +60,8 @@ export type ChatAction =
   | { type: 'ADD_STEP_QUESTION'; payload: StepQuestion }
   | { type: 'REMOVE_STEP_QUESTION'; payload: number }
   | { type: 'CLEAR_STEP_QUESTIONS' }
-  | { type: 'PLAN_RETRY' };
+  | { type: 'PLAN_RETRY' }
+  | { type: 'SET_QUEUE_POSITION'; payload: number | null };
 
 function chatReducer(state: ChatState, action: ChatAction): ChatState {
   switch (action.type) {
@@ -126,9 +130,13 @@ function chatReducer(state: ChatState, action: ChatAction): ChatState {
       return {
         ...state,
         isStreaming: action.payload,
+        queuePosition: null,
         ...(action.payload ? { planRetrying: false } : {}),
       };
 
+    case 'SET_QUEUE_POSITION':
+      return { ...state, queuePosition: action.payload || null };
+
     case 'SET_MODE':
       localStorage.setItem('inferenceMode', action.payload);
       return { ...state, mode: action.payload };
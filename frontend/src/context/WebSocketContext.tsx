@@ -16,6 +16,7 @@ import { useChatContext } from "@/context/ChatContext";
 import { useAppContext } from "@/context/AppContext";
 import { createConversation, renameConversation } from "@/api/conversations";
 import { WSClient } from "@/api/websocket";
+import { applyStepSegment, streamedResultFields } from "@/utils/stepSegments";
 import type {
   PlanStep,
   PlanStepResult,
@@ -23,6 +24,9 @@ import type {
   ToolCallEvent,
   ToolResultEvent,
   PlanComplete,
+  ExecutionUsage,
+  StepSegmentEvent,
+  StepSegments,
 } from "@/types";
 
 interface WebSocketContextValue {
@@ -49,6 +53,8 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
   // Track streaming state via ref to avoid closure capture issues in handleEvent
   const isStreamingRef = useRef(chatState.isStreaming);
   isStreamingRef.current = chatState.isStreaming;
+  // Running steps' transcripts from step_segment events, by step number
+  const stepSegmentsRef = useRef(new Map<number, StepSegments>());
 
   // Handle incoming WS events — same dispatch logic as old SSE handler
   const handleEvent = useCallback(
@@ -116,10 +122,25 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
         }
 
         case "tool_result": {
-          const toolResult =
+          let toolResult =
             (eventData.tool_result as Record<string, unknown>) ??
             (event.tool_result as Record<string, unknown>) ??
             eventData;
+          const streamedRes = toolResult.result as
+            | Record<string, unknown>
+            | undefined;
+          if (streamedRes?.segments_streamed) {
+            // Transcript fields were sent as step_segment events
+            toolResult = {
+              ...toolResult,
+              result: {
+                ...streamedRes,
+                ...streamedResultFields(
+                  stepSegmentsRef.current.get(toolResult.step as number),
+                ),
+              },
+            };
+          }
           console.log("[WS] tool_result:", {
             step: toolResult.step,
             tool: toolResult.tool,
@@ -225,9 +246,30 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
           break;
         }
 
+        case "queue_position": {
+          const queued =
+            (eventData.queue_position as Record<string, unknown>) ?? eventData;
+          chatDispatch({
+            type: "SET_QUEUE_POSITION",
+            payload: (queued.position as number) || null,
+          });
+          break;
+        }
+
         case "step_execute": {
           const stepExec =
             (eventData.step_execute as Record<string, unknown>) ?? eventData;
+          if (stepExec.progress) {
+            appDispatch({
+              type: "APPEND_STEP_OUTPUT",
+              payload: {
+                stepIndex: (stepExec.step as number) - 1,
+                iteration: (stepExec.iteration as number) ?? 0,
+                output: (stepExec.output as string) || "",
+              },
+            });
+            break;
+          }
           appDispatch({
             type: "ADD_STEP_EXECUTION",
             payload: {
@@ -236,11 +278,27 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
               observation: (stepExec.observation as string) || "",
               success: (stepExec.success as boolean) ?? true,
               iteration: (stepExec.iteration as number) ?? 0,
+              usage: stepExec.usage as ExecutionUsage | undefined,
             },
           });
           break;
         }
 
+        case "step_segment": {
+          const seg = ((eventData.step_segment as Record<string, unknown>) ??
+            eventData) as unknown as StepSegmentEvent;
+          const segments = applyStepSegment(
+            stepSegmentsRef.current.get(seg.step),
+            seg,
+          );
+          stepSegmentsRef.current.set(seg.step, segments);
+          appDispatch({
+            type: "SET_STEP_SEGMENTS",
+            payload: { stepIndex: seg.step - 1, segments },
+          });
+          break;
+        }
+
         case "step_start": {
           console.log("[WS] step_start:", eventData);
           const stepStart =
@@ -248,6 +306,7 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
             (event.step_start as Record<string, unknown>) ??
             eventData;
           const stepNum = stepStart.step as number;
+          stepSegmentsRef.current.delete(stepNum);
 
           // Auto-complete all previous running steps (mirrors original inference_ui behavior)
           appDispatch({
@@ -482,6 +541,7 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
         message: content,
         mode: chatState.mode,
         files: fileData,
+        stream_segments: true,
       });
 
       // Refresh sidebar immediately (title already set via first_message on creation)
@@ -493,7 +553,11 @@ export function WebSocketProvider({ children }: { children: ReactNode }) {
   const sendRaw = useCallback(
     (action: string, payload: Record<string, unknown>) => {
       chatDispatch({ type: "SET_STREAMING", payload: true });
-      wsRef.current?.send(action, payload);
+      // Plan steps stream their transcript as step_segment events
+      wsRef.current?.send(
+        action,
+        action === "chat" ? { stream_segments: true, ...payload } : payload,
+      );
     },
     [chatDispatch],
   );
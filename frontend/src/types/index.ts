@@ -34,6 +34,16 @@ export interface StopRequest {
   conv_id: string;
 }
 
+export interface RunInfo {
+  run_id: string;
+  conv_id: string;
+  kind: "chat" | "step_question" | "retry_step" | "execute_code";
+  status: "running" | "done" | "error" | "stopped";
+  started_at: string;
+  finished_at?: string | null;
+  last_event_id: number;
+}
+
 // ─── SSE Events ───
 
 export interface TokenEvent {
@@ -230,6 +240,40 @@ export interface FileInfo {
 export interface FileUploadResponse {
   filename: string;
   text_content?: string | null;
+  size?: number | null;
+  sha256?: string | null;
+}
+
+/** A resumable chunked upload (POST/GET/PUT /api/data/uploads). */
+export interface UploadSessionInfo {
+  upload_id: string;
+  filename: string;
+  offset: number;
+  size?: number | null;
+  chunk_size: number;
+}
+
+/** One page of rows from a table output (GET /api/outputs/.../preview). */
+export interface TablePreview {
+  columns: string[];
+  rows: unknown[][];
+  offset: number;
+  limit: number;
+  /** Unknown for CSV / TSV (read lazily); use has_more to page. */
+  total_rows: number | null;
+  has_more: boolean;
+  /** Present when requested with stats=true. */
+  stats?: TableStats;
+}
+
+export interface TableStats {
+  /** False when computed from a sample (CSV / TSV) or partial metadata. */
+  exact: boolean;
+  rows: number | null;
+  columns: Record<
+    string,
+    { min: unknown; max: unknown; null_count: number }
+  >;
 }
 
 // ─── Plan ───
@@ -289,6 +333,22 @@ export interface CodeSegment {
   content: string;
 }
 
+/** Streamed piece of a running plan step's transcript (step_segment event). */
+export interface StepSegmentEvent {
+  step: number;
+  attempt: number;
+  event: "open" | "delta" | "close" | "reset";
+  type: CodeSegment["type"];
+  /** Position in the step's final segments list. */
+  index: number;
+  content: string;
+}
+
+export interface StepSegments {
+  attempt: number;
+  segments: CodeSegment[];
+}
+
 export interface CodeData {
   code: string;
   language: string;
@@ -309,6 +369,17 @@ export interface StepExecution {
   observation: string;
   success: boolean;
   iteration: number;
+  /** Output is still streaming in (step_execute progress events). */
+  running?: boolean;
+  usage?: ExecutionUsage;
+}
+
+/** Resource usage of one executed code block. */
+export interface ExecutionUsage {
+  cpu_time_s: number;
+  peak_rss_mb: number;
+  /** "cpu" | "memory" when the block hit its limit, else "". */
+  limit_exceeded: string;
 }
 
 export interface DetailPanelData {
@@ -322,6 +393,8 @@ export interface DetailPanelData {
   retrievalResult?: CategorizedRetrieval;
   toolRetrievalStatus?: "idle" | "running" | "done";
   stepExecutions?: Record<number, StepExecution[]>;
+  /** Transcripts assembled from step_segment events, by step index. */
+  stepSegments?: Record<number, StepSegments>;
 }
 
 export interface PendingFile {
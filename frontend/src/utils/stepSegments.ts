@@ -0,0 +1,42 @@
+import type { CodeSegment, StepSegmentEvent, StepSegments } from "@/types";
+
+/** Apply one step_segment event; a new attempt starts from scratch. */
+export function applyStepSegment(
+  prev: StepSegments | undefined,
+  ev: StepSegmentEvent,
+): StepSegments {
+  const segments: CodeSegment[] =
+    prev && prev.attempt === ev.attempt ? [...prev.segments] : [];
+  switch (ev.event) {
+    case "open":
+      segments[ev.index] = { type: ev.type, content: "" };
+      break;
+    case "delta": {
+      const seg = segments[ev.index];
+      if (seg) segments[ev.index] = { ...seg, content: seg.content + ev.content };
+      break;
+    }
+    case "reset":
+      // An unclosed block turned out to be text: it replaces the tail
+      segments.length = ev.index;
+      segments.push({ type: ev.type, content: ev.content });
+      break;
+  }
+  return { attempt: ev.attempt, segments };
+}
+
+/**
+ * The result fields a `segments_streamed` tool_result leaves out, rebuilt
+ * from the streamed segments (thinking joins the thinking segments, as the
+ * backend does).
+ */
+export function streamedResultFields(
+  streamed: StepSegments | undefined,
+): { segments?: CodeSegment[]; thinking?: string } {
+  if (!streamed?.segments.length) return {};
+  const thinking = streamed.segments
+    .filter((s) => s.type === "thinking")
+    .map((s) => s.content)
+    .join("\n");
+  return { segments: streamed.segments, ...(thinking ? { thinking } : {}) };
+}
@@ -3,7 +3,7 @@ WORK_DIR="$(cd "$(dirname "$0")" && pwd)"
 PARENT_DIR="$(dirname "$WORK_DIR")"
 
 # Create data directories
-mkdir -p "$PARENT_DIR"/{uploads,outputs,logs,models}
+mkdir -p "$PARENT_DIR"/{uploads,upload_store,outputs,logs,models}
 
 # Copy Biomni if not present
 if [ ! -d "$PARENT_DIR/Biomni" ]; then